@@ -1,5 +1,6 @@
 from pathlib import Path
 import os
+import tempfile
 from dotenv import load_dotenv
 import dj_database_url
 
@@ -74,6 +75,10 @@ DEFAULT_FROM_EMAIL = os.getenv("EMAIL_FROM", os.getenv("DEFAULT_FROM_EMAIL", EMA
 # Support ADMIN_EMAIL or EMAIL_ADMIN env names
 ADMIN_EMAIL = os.getenv("ADMIN_EMAIL", os.getenv("EMAIL_ADMIN", EMAIL_HOST_USER))
 
+# Bandeja de salida: además del comando procesar_correos, cada proceso web
+# envía lo que encola con un pool de tamaño fijo (desactivar con "False")
+EMAIL_OUTBOX_EN_PROCESO = os.getenv("EMAIL_OUTBOX_EN_PROCESO", "True").lower() in ("true", "1", "t", "yes")
+
 
 # ---------------------------
 # MIDDLEWARE
@@ -81,6 +86,7 @@ ADMIN_EMAIL = os.getenv("ADMIN_EMAIL", os.getenv("EMAIL_ADMIN", EMAIL_HOST_USER)
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
+    "reservas.paginas.PaginaCacheMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.locale.LocaleMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -136,15 +142,45 @@ if DATABASE_URL:
         )
     }
 else:
-    # Entorno local: usar SQLite sin parámetros de SSL incompatibles
+    # Entorno local: usar SQLite sin parámetros de SSL incompatibles.
+    # IMMEDIATE: cada transacción toma el bloqueo de escritura al empezar, así
+    # las creaciones de reserva concurrentes esperan su turno (ver reservas.candados).
     DATABASES = {
         "default": {
             "ENGINE": "django.db.backends.sqlite3",
             "NAME": BASE_DIR / "db.sqlite3",
+            "OPTIONS": {
+                "transaction_mode": "IMMEDIATE",
+                "timeout": 20,
+            },
+            # Base de tests en archivo (no en memoria) para que las pruebas de
+            # concurrencia puedan abrir varias conexiones; fuera del repositorio
+            "TEST": {"NAME": Path(tempfile.gettempdir()) / "clubelmeta_test_db.sqlite3"},
         }
     }
 
 
+# ---------------------------
+# CACHE
+# ---------------------------
+# Por defecto caché en disco: la comparten los workers de gunicorn y los
+# procesos de los comandos del mismo host (procesar_subidas, procesar_correos,
+# precalentar_paginas...), así todos ven las mismas generaciones e
+# invalidaciones, y leerla no cuesta consultas a la base. Con procesos en
+# varios hosts usar Redis o Memcached, p.ej.:
+#   CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+#   CACHE_LOCATION=redis://localhost:6379/1
+# No usar LocMemCache fuera de desarrollo: cada proceso tendría su propia caché.
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.filebased.FileBasedCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", str(Path(tempfile.gettempdir()) / "clubelmeta_cache")),
+        # Páginas completas y generaciones: evitar que el cull las descarte pronto
+        "OPTIONS": {"MAX_ENTRIES": int(os.getenv("CACHE_MAX_ENTRIES", "5000"))},
+    }
+}
+
+
 # ---------------------------
 # PASSWORD VALIDATION
 # ---------------------------
@@ -2,6 +2,14 @@
 set -e
 
 python manage.py migrate
+python manage.py reconstruir_ocupacion --si-vacia
 python manage.py collectstatic --noinput
+python manage.py precalentar_paginas || true
 
-exec gunicorn clubelmeta.wsgi:application --bind 0.0.0.0:8080
+# Web, cola de imágenes (reservas/subidas.py) y bandeja de salida de correos
+# (reservas/bandeja_salida.py), los procesos del Procfile en este mismo host:
+# comparten static/img y la caché en disco. honcho los vigila; si uno termina
+# detiene los demás y sale con error, y la plataforma reinicia el contenedor.
+# gunicorn escucha en $PORT (el primer proceso del Procfile recibe ese puerto).
+export PORT="${PORT:-8080}"
+exec honcho start -f Procfile
@@ -12,8 +12,11 @@ from .models import (
     Comunicado,
     ComunicadoImagen,
     AnuncioFlotante,
+    SubidaImagen,
+    EmailOutbox,
 )
 from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+import logging
 import re
 from django.shortcuts import render
 from django.urls import reverse
@@ -22,6 +25,7 @@ from django.core.exceptions import ValidationError
 
 # Register your models here.
 from .utils import is_admin_general, is_asistente
+from . import bandeja_salida, precios, subidas
 from django.contrib.auth.models import Group
 from django.contrib.auth.admin import GroupAdmin as DjangoGroupAdmin
 from django.contrib.auth.models import User
@@ -211,11 +215,31 @@ class MultipleFileField(forms.FileField):
         return []
 
 
+class SubidaImagenInline(admin.TabularInline):
+    model = SubidaImagen
+    extra = 0
+    max_num = 0
+    can_delete = False
+    fields = ('archivo', 'estado_col', 'intentos', 'subida_cloudinary', 'variantes', 'error', 'creado', 'terminado')
+    readonly_fields = fields
+    ordering = ('-creado',)
+    verbose_name_plural = 'Subidas de imágenes'
+
+    def estado_col(self, obj):
+        return _estado_subida(obj)
+    estado_col.short_description = 'Estado'
+
+
+def _estado_subida(obj):
+    colores = {'PENDIENTE': '#6c757d', 'PROCESANDO': '#0d6efd', 'LISTA': '#198754', 'ERROR': '#dc3545'}
+    return format_html('<b style="color:{}">{}</b>', colores.get(obj.estado, '#000'), obj.get_estado_display())
+
+
 class SalonAdminForm(forms.ModelForm):
     imagenes_upload = MultipleFileField(
         required=False,
         label='Subir imágenes nuevas',
-        help_text='Selecciona uno o varios archivos desde tu equipo. Se guardarán en el sitio y, si Cloudinary está configurado en el servidor (CLOUDINARY_API_KEY/SECRET), se subirán al CDN automáticamente. Se añadirán al final del campo "Imagen".',
+        help_text='Selecciona uno o varios archivos desde tu equipo. Se guardan en el sitio y quedan en cola: un proceso en segundo plano los sube al CDN (si Cloudinary está configurado) y los añade al final del campo "Imagen" al terminar.',
     )
 
     class Meta:
@@ -230,6 +254,7 @@ class SalonAdmin(admin.ModelAdmin):
     list_filter = ('disponible',)
     search_fields = ('nombre', 'descripcion')
     list_editable = ('disponible',)
+    inlines = [SubidaImagenInline]
     fieldsets = (
         (None, {
             'fields': ('nombre', 'descripcion', 'imagen', 'imagenes_upload', 'disponible'),
@@ -244,107 +269,52 @@ class SalonAdmin(admin.ModelAdmin):
     )
 
     def save_model(self, request, obj, form, change):
-        """Guarda el salon y procesa los archivos subidos:
-        1. Los persiste en static/img/<carpeta>/ (sirve en dev sin Cloudinary).
-        2. Si CLOUDINARY_API_KEY/SECRET estan configuradas, sube cada archivo
-           a Cloudinary con public_id = img/<carpeta>/<nombre_sin_ext>.
-        3. Append las rutas (formato '<carpeta>/<archivo>') al campo imagen.
+        """Guarda el salon y deja en cola los archivos subidos.
+
+        Los archivos se guardan en static/img/salon_<slug>/ y se crea una
+        `SubidaImagen` por cada uno; el comando `procesar_subidas` los sube a
+        Cloudinary, genera sus variantes y los agrega al campo imagen al
+        terminar (ver reservas/subidas.py). El request no espera a Cloudinary.
         """
         super().save_model(request, obj, form, change)
         archivos = form.cleaned_data.get('imagenes_upload') or []
         if not archivos:
             return
 
-        import os
-        from pathlib import Path
-        from django.conf import settings
-        from django.utils.text import slugify, get_valid_filename
-
-        # Carpeta destino: 'salon_<slug>' para evitar problemas con espacios
-        carpeta = f'salon_{slugify(obj.nombre)}' if obj.nombre else 'salon_sin_nombre'
-
-        # Cloudinary opcional: solo si las env vars estan configuradas
-        cloud_name = os.environ.get('CLOUDINARY_CLOUD_NAME') or getattr(settings, 'CLOUDINARY_CLOUD_NAME', '')
-        api_key = os.environ.get('CLOUDINARY_API_KEY', '')
-        api_secret = os.environ.get('CLOUDINARY_API_SECRET', '')
-        cloudinary_ready = bool(cloud_name and api_key and api_secret)
-        if cloudinary_ready:
-            try:
-                import cloudinary
-                import cloudinary.uploader
-                cloudinary.config(
-                    cloud_name=cloud_name,
-                    api_key=api_key,
-                    api_secret=api_secret,
-                    secure=True,
-                )
-            except ImportError:
-                cloudinary_ready = False
-
-        # Carpeta local destino (static/img/<carpeta>/)
-        static_dirs = getattr(settings, 'STATICFILES_DIRS', [])
-        static_base = Path(static_dirs[0]) if static_dirs else Path(settings.BASE_DIR) / 'static'
-        carpeta_local = static_base / 'img' / carpeta
         try:
-            carpeta_local.mkdir(parents=True, exist_ok=True)
+            creadas, errores = subidas.encolar(obj, archivos)
         except Exception as e:
-            messages.error(request, f'No se pudo crear la carpeta local {carpeta_local}: {e}')
+            messages.error(request, f'No se pudieron guardar las imágenes: {e}')
             return
+        for nombre, error in errores:
+            messages.error(request, f'Error procesando {nombre}: {error}')
+        if creadas:
+            messages.success(request,
+                f'{len(creadas)} imagen(es) en cola. Se publicarán en el sitio cuando terminen de subirse '
+                'a Cloudinary; el estado de cada archivo aparece en "Subidas de imágenes" al final de esta página.')
+
+
+@admin.register(SubidaImagen)
+class SubidaImagenAdmin(admin.ModelAdmin):
+    list_display = ('archivo', 'salon', 'estado_col', 'intentos', 'subida_cloudinary', 'variantes', 'creado', 'terminado')
+    list_filter = ('estado', 'salon')
+    search_fields = ('archivo', 'nombre_original')
+    readonly_fields = ('salon', 'archivo', 'nombre_original', 'estado', 'intentos', 'subida_cloudinary',
+                       'variantes', 'error', 'creado', 'iniciado', 'terminado')
+    actions = ['reintentar_subidas']
+
+    def estado_col(self, obj):
+        return _estado_subida(obj)
+    estado_col.short_description = 'Estado'
+    estado_col.admin_order_field = 'estado'
 
-        added = []
-        cloudinary_count = 0
-        for f in archivos:
-            try:
-                safe_name = get_valid_filename(f.name)
-                local_path = carpeta_local / safe_name
-                # Si ya existe, agregar sufijo numerico para no sobreescribir
-                stem = local_path.stem
-                ext = local_path.suffix
-                counter = 1
-                while local_path.exists() and counter <= 100:
-                    local_path = carpeta_local / f'{stem}_{counter}{ext}'
-                    counter += 1
-
-                # Persistir en disco
-                with open(local_path, 'wb') as outf:
-                    for chunk in f.chunks():
-                        outf.write(chunk)
-
-                # Subir a Cloudinary (no falla todo el save si Cloudinary falla)
-                if cloudinary_ready:
-                    try:
-                        public_id = f'img/{carpeta}/{local_path.stem}'
-                        cloudinary.uploader.upload(
-                            str(local_path),
-                            public_id=public_id,
-                            overwrite=True,
-                            resource_type='image',
-                            use_filename=False,
-                            unique_filename=False,
-                        )
-                        cloudinary_count += 1
-                    except Exception as e:
-                        messages.warning(request, f'{f.name}: guardado local pero falló la subida a Cloudinary: {e}')
-
-                # Path relativo a 'img/' para el campo imagen
-                added.append(f'{carpeta}/{local_path.name}')
-            except Exception as e:
-                messages.error(request, f'Error procesando {f.name}: {e}')
-
-        if added:
-            existing = (obj.imagen or '').strip()
-            current = [p.strip() for p in existing.split(',') if p.strip()]
-            current.extend(added)
-            obj.imagen = ','.join(current)
-            obj.save(update_fields=['imagen'])
-            if cloudinary_ready:
-                messages.success(request,
-                    f'{len(added)} imagen(es) guardada(s) localmente y {cloudinary_count} subida(s) a Cloudinary.')
-            else:
-                messages.warning(request,
-                    f'{len(added)} imagen(es) guardada(s) localmente. Cloudinary NO esta configurado en este servidor '
-                    '(faltan CLOUDINARY_API_KEY y/o CLOUDINARY_API_SECRET); las imagenes solo viven en /static/img/ '
-                    'hasta que las subas con `manage.py upload_static_to_cloudinary`.')
+    def has_add_permission(self, request):
+        return False
+
+    def reintentar_subidas(self, request, queryset):
+        n = subidas.reintentar(queryset)
+        self.message_user(request, f'{n} subida(s) de vuelta en la cola.', messages.SUCCESS)
+    reintentar_subidas.short_description = 'Reintentar las subidas con error'
 
 
 class ConfiguracionSalonInline(admin.TabularInline):
@@ -414,6 +384,8 @@ class ConfiguracionSalonAdmin(admin.ModelAdmin):
                 # Use update to set the chosen field
                 update_kwargs = {field_name: dec}
                 count = queryset.update(**update_kwargs)
+                # update() no dispara señales: invalidar la matriz de precios aquí
+                precios.invalidar()
                 self.message_user(request, f'{count} configuración(es) actualizada(s).', level=messages.SUCCESS)
                 return None
         else:
@@ -486,48 +458,23 @@ class SocioAdmin(admin.ModelAdmin):
     actions = ['enviar_notificacion_manual']
 
     def enviar_notificacion_manual(self, request, queryset):
-        """Enviar notificación por email y registrar en EmailLog. Contenido por defecto; puede personalizarse"""
-        # import signals locally to avoid circular imports during admin module import
-        from . import signals as signals_module
+        """Encolar una notificación por email (la bandeja de salida la envía y registra en EmailLog). Contenido por defecto; puede personalizarse"""
+        from .emails import send_email_async
         subject = 'Notificación desde Club El Meta'
+        encolados = 0
         for socio in queryset:
-            # enviar email
             try:
-                # render synchronously for logging, send async to avoid blocking
-                txt, html = signals_module._render_message(
-                    subject,
-                    'reservas/emails/admin_manual_notification.txt',
-                    'reservas/emails/admin_manual_notification.html',
-                    {'socio': socio}
-                )
-                try:
-                    from reservas.utils.email_async import send_email_async
-                    send_email_async(
-                        subject=subject,
-                        template_txt='reservas/emails/admin_manual_notification.txt',
-                        template_html='reservas/emails/admin_manual_notification.html',
-                        context={'socio': socio},
-                        recipient_list=[socio.email]
-                    )
-                    success, error = True, None
-                except Exception:
-                    success, error = False, 'async send failed'
-                try:
-                    EmailLog.objects.create(
-                        reserva=None,
-                        channel='EMAIL',
-                        to_email=socio.email,
-                        subject=subject,
-                        body_text=txt,
-                        body_html=html,
-                        success=bool(success),
-                        error=error if error else None,
-                    )
-                except Exception:
-                    pass
+                if send_email_async(
+                    subject=subject,
+                    template_txt='reservas/emails/admin_manual_notification.txt',
+                    template_html='reservas/emails/admin_manual_notification.html',
+                    context={'socio': socio},
+                    recipient_list=[socio.email]
+                ):
+                    encolados += 1
             except Exception:
-                pass
-        self.message_user(request, f'Notificaciones enviadas a {queryset.count()} socio(s) (intentos registrados en EmailLog).')
+                logging.getLogger(__name__).exception('Error encolando la notificación al socio %s', socio.pk)
+        self.message_user(request, f'{encolados} notificación(es) en cola de envío de {queryset.count()} socio(s) (resultados en Email Logs).')
     enviar_notificacion_manual.short_description = 'Enviar notificación manual (email)'
 
 
@@ -551,6 +498,8 @@ class ReservaAdmin(admin.ModelAdmin):
     readonly_fields = ('fecha_creacion', 'fecha_modificacion')
     date_hierarchy = 'fecha_evento'
     inlines = [ReservaServicioAdicionalInline]
+    # Con filtros, no contar además la tabla completa ("N de M"): recorre todas las reservas
+    show_full_result_count = False
     
     fieldsets = (
         ('Información del Salón', {
@@ -591,6 +540,7 @@ class BloqueoEspacioAdmin(admin.ModelAdmin):
     search_fields = ('salon__nombre', 'descripcion')
     readonly_fields = ('fecha_creacion',)
     date_hierarchy = 'fecha_inicio'
+    show_full_result_count = False
     actions = ['delete_selected', 'eliminar_bloqueos']
     list_display_links = ('salon', 'rango_fechas')
 
@@ -791,6 +741,7 @@ class ServicioAdicionalAdmin(admin.ModelAdmin):
                     return None
 
                 count = queryset.update(precio_unitario=dec)
+                precios.invalidar()
                 self.message_user(request, f'{count} servicio(s) actualizado(s) con el nuevo precio {dec}.')
                 return None
         else:
@@ -843,14 +794,27 @@ try:
         list_display = ('created_at', 'get_target', 'channel', 'success')
         list_filter = ('channel', 'success')
         search_fields = ('to_email', 'subject', 'error')
-        readonly_fields = ('reserva', 'channel', 'to_email', 'subject', 'body_text', 'body_html', 'success', 'error', 'created_at')
+        readonly_fields = ('reserva', 'channel', 'to_email', 'subject', 'texto_col', 'html_col', 'success', 'error', 'created_at')
+        exclude = ('body_text', 'body_html', 'text_body', 'html_body')
         ordering = ('-created_at',)
         actions = []
 
+        def get_queryset(self, request):
+            # Los cuerpos en línea de registros antiguos no hacen falta en el listado
+            return super().get_queryset(request).defer('body_text', 'body_html')
+
         def get_target(self, obj):
             return obj.to_email or 'sin destino'
         get_target.short_description = 'Destino'
 
+        def texto_col(self, obj):
+            return obj.texto
+        texto_col.short_description = 'Body text'
+
+        def html_col(self, obj):
+            return obj.html
+        html_col.short_description = 'Body html'
+
         def changelist_view(self, request, extra_context=None):
             """Wrap the changelist view to log unexpected exceptions and show a friendly admin message instead of a raw 500."""
             import logging
@@ -871,6 +835,25 @@ except Exception:
     # EmailLog model may not be available during some import sequences; skip admin registration if so
     pass
 
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'to_email', 'subject', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('to_email', 'subject', 'last_error')
+    readonly_fields = ('reserva', 'to_email', 'subject', 'body_text', 'body_html', 'template_txt', 'template_html',
+                       'context', 'status', 'attempts', 'next_attempt_at', 'claimed_at', 'last_error',
+                       'created_at', 'sent_at')
+    actions = ['reintentar_envio']
+
+    def has_add_permission(self, request):
+        return False
+
+    def reintentar_envio(self, request, queryset):
+        n = bandeja_salida.reintentar(queryset)
+        self.message_user(request, f'{n} correo(s) de vuelta en la cola.', messages.SUCCESS)
+    reintentar_envio.short_description = 'Reintentar los correos con error'
+
 # Register Socio admin if model is available (guard against import-time cycles)
 try:
     from .models import Socio
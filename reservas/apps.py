@@ -6,14 +6,49 @@ class ReservasConfig(AppConfig):
 
     def ready(self):
         try:
-            from django.db.models.signals import post_save, pre_save
-            from .models import Reserva
+            from django.db.models.signals import post_save, pre_save, post_delete
+            from .models import (
+                Reserva, BloqueoEspacio, Salon, ConfiguracionSalon, ServicioAdicional, CodigoSocio,
+                AnuncioFlotante, Comunicado, ComunicadoImagen,
+            )
             from . import signals as signals_module
 
             # Registrar señales correctamente
             post_save.connect(signals_module.reserva_post_save, sender=Reserva)
             pre_save.connect(signals_module.reserva_pre_save, sender=Reserva)
 
+            # Mantener la tabla OcupacionDiaria al día
+            post_save.connect(signals_module.reserva_ocupacion_changed, sender=Reserva)
+            post_delete.connect(signals_module.reserva_ocupacion_changed, sender=Reserva)
+            pre_save.connect(signals_module.bloqueo_pre_save, sender=BloqueoEspacio)
+            post_save.connect(signals_module.bloqueo_ocupacion_changed, sender=BloqueoEspacio)
+            post_delete.connect(signals_module.bloqueo_ocupacion_changed, sender=BloqueoEspacio)
+
+            # Invalidar la caché de disponibilidad (después de recalcular la ocupación)
+            for model in (Reserva, BloqueoEspacio, Salon, ConfiguracionSalon):
+                post_save.connect(signals_module.invalidar_disponibilidad, sender=model)
+                post_delete.connect(signals_module.invalidar_disponibilidad, sender=model)
+
+            # Invalidar el catálogo de espacios (capacidades, nombres, servicios)
+            for model in (Salon, ConfiguracionSalon, ServicioAdicional):
+                post_save.connect(signals_module.invalidar_catalogo, sender=model)
+                post_delete.connect(signals_module.invalidar_catalogo, sender=model)
+
+            # Invalidar la matriz de precios (reservas.precios)
+            for model in (ConfiguracionSalon, ServicioAdicional):
+                post_save.connect(signals_module.invalidar_precios, sender=model)
+                post_delete.connect(signals_module.invalidar_precios, sender=model)
+
+            # Invalidar el índice de códigos de socio (reservas.socios)
+            post_save.connect(signals_module.invalidar_socios, sender=CodigoSocio)
+            post_delete.connect(signals_module.invalidar_socios, sender=CodigoSocio)
+
+            # Generaciones por modelo para ETag / Last-Modified (reservas.condicional)
+            for model in (Reserva, BloqueoEspacio, Salon, ConfiguracionSalon, ServicioAdicional,
+                          AnuncioFlotante, Comunicado, ComunicadoImagen):
+                post_save.connect(signals_module.marcar_cambio_datos, sender=model)
+                post_delete.connect(signals_module.marcar_cambio_datos, sender=model)
+
         except Exception as e:
             import logging
             logging.exception("Error cargando señales:", e)
@@ -0,0 +1,312 @@
+"""
+Bandeja de salida de correos (`EmailOutbox`) y su worker.
+
+`send_email_async` lanzaba un hilo por correo: los mensajes se perdían si
+gunicorn reciclaba el worker y una ráfaga de reservas abría tantos hilos (y
+conexiones SMTP) como correos. Ahora:
+
+1. `encolar()` guarda el correo en `EmailOutbox` (ya renderizado, o sus
+   plantillas y contexto para renderizarlo aquí, ver `reservas.correos`).
+   Se llama dentro de la transacción de la reserva: si ésta se revierte,
+   el correo tampoco sale.
+2. `enviar_lote()` toma los pendientes (UPDATE condicional, como
+   `reservas.subidas`), renderiza los que faltan, los envía por una sola conexión SMTP
+   (`get_connection().send_messages`) y guarda los resultados con
+   `bulk_update` en la bandeja y, en otra transacción, `bulk_create` en
+   `EmailLog`: si el registro falla, lo ya enviado no vuelve a la cola.
+   Un correo enviado deja su cuerpo solo en `EmailLog`.
+   Un envío fallido se reintenta con espera exponencial hasta
+   `MAX_INTENTOS`.
+
+El comando `procesar_correos` drena la bandeja en un bucle. Además, al
+confirmar la transacción, `despachar()` pide un lote a un pool de tamaño
+fijo del propio proceso, así el correo sale enseguida aunque el worker no
+esté corriendo; lo que quede pendiente lo toma el comando.
+"""
+import logging
+import os
+import threading
+import traceback
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+MAX_INTENTOS = 5
+
+LOTE = 50
+
+# Espera antes del intento n: ESPERA_BASE * 2**(n-1), tope ESPERA_MAX
+ESPERA_BASE = timedelta(minutes=1)
+
+ESPERA_MAX = timedelta(hours=1)
+
+# Filas ENVIANDO de un worker caído vuelven a la cola pasado este tiempo
+ESPERA_ENVIANDO = timedelta(minutes=10)
+
+# Hilos del pool en proceso (por worker de gunicorn)
+HILOS = 1
+
+_pool = None
+_pool_lock = threading.Lock()
+_drenado_pedido = threading.Event()
+
+
+def remitente():
+    return os.getenv('EMAIL_FROM') or getattr(settings, 'DEFAULT_FROM_EMAIL', None)
+
+
+def destinatarios(recipient_list):
+    if isinstance(recipient_list, (list, tuple)):
+        return [str(r).strip() for r in recipient_list if r and str(r).strip()]
+    if recipient_list:
+        return [str(recipient_list).strip()]
+    return []
+
+
+def encolar(subject, body_text, body_html, recipient_list, reserva=None,
+            template_txt='', template_html='', context=None):
+    """Guarda un correo en la bandeja. Devuelve la fila o None.
+
+    Con plantillas y sin `body_text`, el worker lo renderiza antes de
+    enviarlo (`context` ya serializado, ver `reservas.correos`). Sin
+    destinatarios no encola nada y deja el fallo en `EmailLog`.
+    """
+    from .models import EmailLog, EmailOutbox
+
+    reserva = reserva if getattr(reserva, 'pk', None) else None
+    to_addrs = destinatarios(recipient_list)
+    # Savepoint: un error aquí no debe romper la transacción de la reserva
+    with transaction.atomic():
+        if not to_addrs:
+            EmailLog.objects.create(
+                reserva=reserva, channel='EMAIL', to_email=None, subject=subject,
+                body_text=body_text, body_html=body_html, success=False,
+                error='No recipient specified for email',
+            )
+            return None
+        correo = EmailOutbox.objects.create(
+            reserva=reserva,
+            to_email=','.join(to_addrs),
+            subject=(subject or '')[:255],
+            body_text=body_text or '',
+            body_html=body_html,
+            template_txt=template_txt or '',
+            template_html=template_html or '',
+            context=context or {},
+        )
+    despachar()
+    return correo
+
+
+def espera(intentos):
+    """Tiempo hasta el próximo intento tras `intentos` fallidos."""
+    return min(ESPERA_MAX, ESPERA_BASE * (2 ** max(0, intentos - 1)))
+
+
+def reencolar_vencidas():
+    from .models import EmailOutbox
+
+    limite = timezone.now() - ESPERA_ENVIANDO
+    return EmailOutbox.objects.filter(status='ENVIANDO', claimed_at__lt=limite).update(status='PENDIENTE')
+
+
+def tomar(limite=LOTE):
+    """Reserva hasta `limite` correos cuyo próximo intento ya llegó."""
+    from .models import EmailOutbox
+
+    ahora = timezone.now()
+    candidatos = (
+        EmailOutbox.objects.filter(status='PENDIENTE', next_attempt_at__lte=ahora)
+        .order_by('next_attempt_at', 'id').values_list('pk', flat=True)
+    )
+    pks = list(candidatos[:limite])
+    # Un solo UPDATE para todo el lote: los que otro worker tomó primero ya no
+    # están PENDIENTE y quedan fuera; son nuestros los que llevan este claimed_at
+    EmailOutbox.objects.filter(pk__in=pks, status='PENDIENTE').update(
+        status='ENVIANDO', claimed_at=ahora, attempts=F('attempts') + 1,
+    )
+    return list(EmailOutbox.objects.filter(pk__in=pks, status='ENVIANDO', claimed_at=ahora).order_by('id'))
+
+
+def _renderizar(correo):
+    """Completa body_text/body_html de un correo encolado con plantillas."""
+    from . import correos
+
+    if correo.body_text or not (correo.template_txt or correo.template_html):
+        return
+    correo.body_text, correo.body_html = correos.renderizar(
+        correo.subject, correo.template_txt, correo.template_html,
+        correos.restaurar_contexto(correo.context),
+    )
+
+
+def _mensaje(correo, from_addr, connection):
+    from django.core.mail import EmailMultiAlternatives
+
+    msg = EmailMultiAlternatives(
+        subject=correo.subject,
+        body=correo.body_text,
+        from_email=from_addr,
+        to=correo.to_email.split(','),
+        connection=connection,
+    )
+    if correo.body_html:
+        msg.attach_alternative(correo.body_html, "text/html")
+    return msg
+
+
+def _log(correo, success, error=None):
+    from .models import EmailLog
+
+    return EmailLog(
+        reserva_id=correo.reserva_id,
+        channel='EMAIL',
+        to_email=correo.to_email,
+        subject=correo.subject,
+        body_text=correo.body_text,
+        body_html=correo.body_html,
+        success=success,
+        error=error,
+    )
+
+
+def enviar_lote(limite=LOTE):
+    """Envía un lote de la bandeja por una conexión SMTP.
+
+    Devuelve un Counter con 'enviados', 'reintentar' y 'errores'.
+    """
+    from django.core.mail import get_connection
+
+    from .models import EmailOutbox
+
+    resumen = Counter()
+    correos = tomar(limite)
+    if not correos:
+        return resumen
+
+    # Render (una sola vez: el resultado se guarda con la fila) antes de
+    # abrir la conexión
+    resultados, listos = [], []
+    for correo in correos:
+        try:
+            _renderizar(correo)
+            listos.append(correo)
+        except Exception:
+            logger.exception('Error renderizando el correo %s', correo.pk)
+            resultados.append((correo, traceback.format_exc()))
+
+    from_addr = remitente()
+    try:
+        if not from_addr:
+            raise RuntimeError('No from address configured')
+        with get_connection(fail_silently=False) as connection:
+            for correo in listos:
+                try:
+                    connection.send_messages([_mensaje(correo, from_addr, connection)])
+                    resultados.append((correo, None))
+                except Exception:
+                    resultados.append((correo, traceback.format_exc()))
+    except Exception:
+        # Sin conexión (o sin remitente): todo el lote vuelve a intentarse
+        error = traceback.format_exc()
+        hechos = {c.pk for c, _ in resultados}
+        resultados += [(c, error) for c in listos if c.pk not in hechos]
+
+    ahora = timezone.now()
+    logs = []
+    for correo, error in resultados:
+        if error is None:
+            correo.status, correo.sent_at, correo.last_error = 'ENVIADO', ahora, ''
+            logs.append(_log(correo, True))
+            # El cuerpo queda (deduplicado) en EmailLog; la bandeja no lo guarda dos veces
+            correo.body_text, correo.body_html, correo.context = '', None, {}
+            resumen['enviados'] += 1
+        elif correo.attempts >= MAX_INTENTOS:
+            correo.status, correo.last_error = 'ERROR', error
+            logs.append(_log(correo, False, error))
+            resumen['errores'] += 1
+        else:
+            correo.status, correo.last_error = 'PENDIENTE', error
+            correo.next_attempt_at = ahora + espera(correo.attempts)
+            resumen['reintentar'] += 1
+    with transaction.atomic():
+        EmailOutbox.objects.bulk_update(
+            [c for c, _ in resultados],
+            ['body_text', 'body_html', 'context', 'status', 'sent_at', 'last_error', 'next_attempt_at'])
+    _registrar(logs)
+    return resumen
+
+
+def _registrar(logs):
+    """Guarda los `EmailLog` del lote; un error solo queda en el log."""
+    from .models import EmailLog, Reserva
+
+    if not logs:
+        return
+    # Reservas borradas mientras su correo estaba en la bandeja
+    ids = {l.reserva_id for l in logs if l.reserva_id}
+    vigentes = set(Reserva.objects.filter(pk__in=ids).values_list('pk', flat=True)) if ids else set()
+    for l in logs:
+        if l.reserva_id not in vigentes:
+            l.reserva_id = None
+    try:
+        with transaction.atomic():
+            EmailLog.objects.bulk_create(logs)
+    except Exception:
+        logger.exception('Error guardando %d EmailLog de la bandeja de salida', len(logs))
+
+
+def drenar(limite=LOTE):
+    """Envía lotes hasta que no queden correos listos para enviar."""
+    total = Counter()
+    while True:
+        resumen = enviar_lote(limite)
+        total.update(resumen)
+        if not resumen or resumen['enviados'] == 0:
+            return total
+
+
+def _drenar_en_pool():
+    _drenado_pedido.clear()
+    try:
+        drenar()
+    except Exception:
+        logger.exception('Error enviando la bandeja de salida')
+    finally:
+        close_old_connections()
+
+
+def despachar():
+    """Al confirmar la transacción, pedir un drenado al pool del proceso.
+
+    Pedidos mientras ya hay uno en espera se juntan en ese. Con
+    `EMAIL_OUTBOX_EN_PROCESO = False` solo envía el comando `procesar_correos`.
+    """
+    if not getattr(settings, 'EMAIL_OUTBOX_EN_PROCESO', True):
+        return
+
+    def _run():
+        global _pool
+        if _drenado_pedido.is_set():
+            return
+        _drenado_pedido.set()
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=HILOS, thread_name_prefix='bandeja-salida')
+        _pool.submit(_drenar_en_pool)
+
+    transaction.on_commit(_run)
+
+
+def reintentar(queryset):
+    """Devuelve a la cola correos en ERROR (acción del admin)."""
+    return queryset.filter(status='ERROR').update(
+        status='PENDIENTE', attempts=0, last_error='', next_attempt_at=timezone.now())
@@ -0,0 +1,206 @@
+"""
+Helpers de caché con contador de generación por grupo de datos.
+
+Cada grupo (p.ej. 'disponibilidad') tiene un número de generación guardado
+en la caché de Django. Las claves de datos incluyen ese número, así que para
+invalidar todo un grupo basta con incrementar la generación desde las
+señales de los modelos: las entradas viejas quedan huérfanas y expiran solas.
+
+Funciona con cualquier backend de Django. Las generaciones tienen que ser
+las mismas para los workers de gunicorn y los comandos que invalidan o
+precalientan, por eso la caché por defecto es FileBasedCache (ver CACHES en
+settings): leerla no cuesta consultas a la base. LocMemCache solo sirve
+para un único proceso.
+
+Los índices en memoria de cada proceso (socios, imágenes) consultan la
+generación con `generacion_local`, que vuelve a la caché compartida como
+mucho cada `REVISION_LOCAL` segundos. Los contadores de aciertos/fallos se
+acumulan en el proceso y se suman a la caché cada `VOLCAR_CADA` eventos.
+"""
+import threading
+import time
+from collections import Counter
+
+from django.core.cache import cache
+
+
+# Tiempo de vida de las entradas de datos; la validez real la da la generación
+TIMEOUT_DATOS = 60 * 60
+
+# Segundos que un proceso reutiliza una generación leída con `generacion_local`
+REVISION_LOCAL = 2.0
+
+# Aciertos/fallos que acumula un proceso antes de sumarlos a la caché
+VOLCAR_CADA = 100
+
+# {grupo: (generación, time.monotonic() de la lectura)} de este proceso
+_locales = {}
+
+# {(grupo, 'hits'|'misses'): eventos aún no sumados a la caché} de este proceso
+_pendientes = Counter()
+_pendientes_lock = threading.Lock()
+
+
+def _clave_generacion(grupo):
+    return f'gen:{grupo}'
+
+
+def _generacion_nueva():
+    return int(time.time() * 1_000_000)
+
+
+def generacion(grupo):
+    """Generación actual del grupo. Si no existe (caché vacía o reiniciada),
+    se inicializa con el reloj en microsegundos para no reutilizar una
+    generación anterior por accidente (un índice en memoria que recuerda la
+    generación vieja + N no debe confundirla con la nueva)."""
+    clave = _clave_generacion(grupo)
+    gen = cache.get(clave)
+    if gen is None:
+        cache.add(clave, _generacion_nueva(), timeout=None)
+        gen = cache.get(clave)
+    return gen
+
+
+def generacion_local(grupo, segundos=REVISION_LOCAL):
+    """`generacion()` leída de la caché compartida como mucho cada `segundos`.
+
+    Un cambio hecho en otro proceso se ve con ese retraso; los del propio
+    proceso (`incrementar_generacion`) se ven enseguida.
+    """
+    ahora = time.monotonic()
+    leida = _locales.get(grupo)
+    if leida is not None and ahora - leida[1] < segundos:
+        return leida[0]
+    gen = generacion(grupo)
+    _locales[grupo] = (gen, ahora)
+    return gen
+
+
+def olvidar_locales():
+    """Descarta las generaciones recordadas por el proceso (tests)."""
+    _locales.clear()
+
+
+def _clave_marca(grupo):
+    return f'ts:{grupo}'
+
+
+def marca_tiempo(grupo):
+    """Momento (epoch) del último cambio de generación del grupo; sirve
+    para `Last-Modified`. Si no existe se toma el momento actual."""
+    clave_marca = _clave_marca(grupo)
+    ts = cache.get(clave_marca)
+    if ts is None:
+        cache.add(clave_marca, time.time(), timeout=None)
+        ts = cache.get(clave_marca)
+    return ts
+
+
+def estado_grupos(grupos):
+    """[(generación, marca de tiempo)] de varios grupos con un solo `get_many`.
+
+    Solo los grupos que faltan en la caché se inicializan (con `add`).
+    """
+    claves = [f(g) for g in grupos for f in (_clave_generacion, _clave_marca)]
+    valores = cache.get_many(claves)
+    resultado = []
+    for g in grupos:
+        gen = valores.get(_clave_generacion(g))
+        ts = valores.get(_clave_marca(g))
+        resultado.append((
+            gen if gen is not None else generacion(g),
+            ts if ts is not None else marca_tiempo(g),
+        ))
+    return resultado
+
+
+def incrementar_generacion(grupo):
+    """Invalida todas las entradas del grupo."""
+    clave = _clave_generacion(grupo)
+    cache.set(_clave_marca(grupo), time.time(), timeout=None)
+    try:
+        gen = cache.incr(clave)
+        # `incr` de BaseCache (archivos, base de datos) vuelve a guardar la
+        # clave con el timeout por defecto: la generación no debe expirar
+        cache.touch(clave, None)
+    except ValueError:
+        # La clave no existía (o expiró): arrancar una generación nueva
+        gen = _generacion_nueva()
+        cache.set(clave, gen, timeout=None)
+    _locales[grupo] = (gen, time.monotonic())
+    return gen
+
+
+def clave(grupo, *partes):
+    """Clave de datos ligada a la generación actual del grupo."""
+    sufijo = ':'.join(str(p) for p in partes)
+    return f'{grupo}:v{generacion(grupo)}:{sufijo}'
+
+
+def _sumar(clave_contador, n):
+    if cache.add(clave_contador, n, timeout=None):
+        return
+    try:
+        cache.incr(clave_contador, n)
+        cache.touch(clave_contador, None)
+    except ValueError:
+        cache.set(clave_contador, n, timeout=None)
+
+
+def _contar(grupo, resultado):
+    """Cuenta un acierto/fallo en el proceso; sin escribir en la caché en cada lectura."""
+    with _pendientes_lock:
+        _pendientes[grupo, resultado] += 1
+        n = _pendientes[grupo, resultado]
+        if n < VOLCAR_CADA:
+            return
+        del _pendientes[grupo, resultado]
+    _sumar(f'stats:{grupo}:{resultado}', n)
+
+
+def volcar_estadisticas(grupo):
+    """Suma a la caché lo que el proceso acumuló del grupo."""
+    for resultado in ('hits', 'misses'):
+        with _pendientes_lock:
+            n = _pendientes.pop((grupo, resultado), 0)
+        if n:
+            _sumar(f'stats:{grupo}:{resultado}', n)
+
+
+def obtener_o_calcular(grupo, partes, calcular, timeout=TIMEOUT_DATOS):
+    """Devuelve (valor, hit). Calcula y guarda el valor si no estaba en caché."""
+    key = clave(grupo, *partes)
+    valor = cache.get(key)
+    if valor is not None:
+        _contar(grupo, 'hits')
+        return valor, True
+    _contar(grupo, 'misses')
+    valor = calcular()
+    cache.set(key, valor, timeout)
+    return valor, False
+
+
+def estadisticas(grupo):
+    """Contadores de aciertos/fallos del grupo y su generación actual.
+
+    Incluye lo acumulado por este proceso; de los demás, lo ya volcado.
+    """
+    volcar_estadisticas(grupo)
+    hits = cache.get(f'stats:{grupo}:hits') or 0
+    misses = cache.get(f'stats:{grupo}:misses') or 0
+    total = hits + misses
+    return {
+        'grupo': grupo,
+        'generacion': generacion(grupo),
+        'hits': hits,
+        'misses': misses,
+        'ratio': round(hits / total, 3) if total else 0.0,
+    }
+
+
+def reiniciar_estadisticas(grupo):
+    with _pendientes_lock:
+        for resultado in ('hits', 'misses'):
+            _pendientes.pop((grupo, resultado), None)
+    cache.delete_many([f'stats:{grupo}:hits', f'stats:{grupo}:misses'])
@@ -0,0 +1,83 @@
+"""
+Sección crítica para crear reservas sin doble reserva.
+
+`register` y `reserva_manual` validan el cruce de horario y luego crean la
+reserva; sin bloqueo dos solicitudes simultáneas pueden pasar ambas la
+validación. `reservar_horario` abre una transacción, toma el candado de
+las fechas afectadas del salón y vuelve a comprobar el cruce antes de
+ceder el control para crear la reserva.
+
+- PostgreSQL: `select_for_update` sobre las filas `CandadoReserva`
+  (salón, fecha). Solo esperan las solicitudes del mismo salón y fechas
+  vecinas; otros salones siguen en paralelo.
+- SQLite: no tiene bloqueo por fila; la base se abre con
+  `transaction_mode=IMMEDIATE` (ver settings) y además se escribe en las
+  filas de candado al inicio, así la transacción toma el bloqueo de
+  escritura de la base antes de leer y las demás esperan su turno.
+"""
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .disponibilidad import buscar_conflictos
+from .holds import apartados_en_conflicto
+from .models import CandadoReserva
+from .ocupacion import fechas_de_reserva
+
+
+class HorarioOcupado(Exception):
+    """El horario pedido se cruza con otra reserva del salón."""
+
+    def __init__(self, conflictos):
+        self.conflictos = conflictos
+        super().__init__(f"{len(conflictos)} reserva(s) en conflicto")
+
+
+class HorarioApartado(HorarioOcupado):
+    """El horario está apartado temporalmente por otro cliente (`ReservaHold`)."""
+
+    def __init__(self, holds):
+        self.holds = holds
+        self.conflictos = []
+        Exception.__init__(self, f"{len(holds)} apartado(s) en conflicto")
+
+
+def _tomar_candados(salon_id, fechas):
+    # Crear las filas que falten; si otra transacción las crea a la vez, se ignora
+    CandadoReserva.objects.bulk_create(
+        [CandadoReserva(salon_id=salon_id, fecha=f) for f in fechas],
+        ignore_conflicts=True,
+    )
+    candados = CandadoReserva.objects.filter(salon_id=salon_id, fecha__in=fechas)
+    if connection.features.has_select_for_update:
+        # Orden fijo para que dos transacciones no se bloqueen mutuamente
+        list(candados.select_for_update().order_by('fecha').values_list('pk', flat=True))
+    else:
+        candados.update(actualizado=timezone.now())
+
+
+@contextmanager
+def reservar_horario(salon_id, fecha, hora_inicio, duracion, tiempo_decoracion=0,
+                     excluir_id=None, permitir_cruce=False, hold_token=None):
+    """Transacción con el salón bloqueado para `fecha` y sus días vecinos.
+
+    Lanza `HorarioOcupado` si, ya con el candado, el horario se cruza con
+    otra reserva, o `HorarioApartado` si lo tiene apartado otro cliente
+    (el apartado de `hold_token` no cuenta). `permitir_cruce` omite ambas
+    comprobaciones. Todo lo que se haga dentro del bloque `with` se
+    confirma o revierte junto.
+    """
+    with transaction.atomic():
+        # Un evento puede cruzar la medianoche: bloquear también E-1 y E+1
+        _tomar_candados(salon_id, sorted(fechas_de_reserva(fecha)))
+        if not permitir_cruce:
+            conflictos = buscar_conflictos(salon_id, fecha, hora_inicio, duracion,
+                                           tiempo_decoracion, excluir_id=excluir_id)
+            if conflictos:
+                raise HorarioOcupado(conflictos)
+            holds = apartados_en_conflicto(salon_id, fecha, hora_inicio, duracion,
+                                           tiempo_decoracion, excluir_token=hold_token)
+            if holds:
+                raise HorarioApartado(holds)
+        yield
@@ -0,0 +1,118 @@
+"""
+Catálogo público de espacios: datos de `espacios` y `register`.
+
+`construir()` carga salones, configuraciones y servicios adicionales en un
+número fijo de consultas (`prefetch_related`) y arma de una vez las
+estructuras que usan las plantillas. `catalogo()` las guarda en la caché
+bajo la generación 'catalogo' (señales de Salon, ConfiguracionSalon y
+ServicioAdicional), la generación 'precios' (acciones masivas de precios
+del admin) y la de 'imagenes' (manifiesto de static/img), así las páginas
+del catálogo se sirven desde memoria.
+"""
+from django.db.models import Prefetch
+
+from .cache import generacion, obtener_o_calcular
+
+
+def _tarjeta_salon(salon, configs, imagenes):
+    """Tarjeta de `espacios`: un salón con sus configuraciones como opciones."""
+    # Agregados para mostrar en la card del salón:
+    #   - capacidad mostrada = la MAYOR de todas las configuraciones
+    #   - precio "desde"     = el MENOR de todas las configuraciones
+    max_capacidad = max(c.capacidad_efectiva_max for c in configs)
+    min_precio_particular_4h = min(int(c.precio_particular_4h) for c in configs if c.precio_particular_4h is not None)
+    min_precio_socio_4h = min(int(c.precio_socio_4h) for c in configs if c.precio_socio_4h is not None)
+    precios_part_8h = [int(c.precio_particular_8h) for c in configs if c.precio_particular_8h]
+    precios_socio_8h = [int(c.precio_socio_8h) for c in configs if c.precio_socio_8h]
+    return {
+        'id': salon.id,
+        'name': salon.nombre,
+        'desc': salon.descripcion,
+        'price_particular_4h': min_precio_particular_4h,
+        'price_particular_8h': min(precios_part_8h) if precios_part_8h else min_precio_particular_4h,
+        'price_socio_4h': min_precio_socio_4h,
+        'price_socio_8h': min(precios_socio_8h) if precios_socio_8h else min_precio_socio_4h,
+        'capacity': str(max_capacidad),
+        'capacity_max': max_capacidad,
+        'type': 'social',
+        'images': imagenes,
+        'configuraciones': [
+            {
+                'id': c.id,
+                'tipo': c.get_tipo_configuracion_display(),
+                'capacidad': c.capacidad_display,
+                'capacidad_max': c.capacidad_efectiva_max,
+                'precio_particular_4h': int(c.precio_particular_4h),
+                'precio_particular_8h': int(c.precio_particular_8h) if c.precio_particular_8h else None,
+                'montaje_image': c.imagen_montaje,
+            } for c in configs
+        ],
+        'num_configuraciones': len(configs),
+        'medidas': salon.medidas_dict(),
+    }
+
+
+def _opcion_configuracion(salon, c, imagenes):
+    """Opción del selector de `register`: una configuración de un salón."""
+    return {
+        'id': c.id,
+        'salon_id': salon.id,
+        'name': f"{salon.nombre} - {c.get_tipo_configuracion_display()}",
+        'desc': f"{c.capacidad_display} personas",
+        # Mostrar solo precio particular (ocultar precios de socio por solicitud del cliente)
+        'price': f"${c.precio_particular_4h:,.0f}",
+        'price_particular_4h': int(c.precio_particular_4h),
+        'price_particular_8h': int(c.precio_particular_8h or c.precio_particular_4h),
+        'price_socio_4h': int(c.precio_socio_4h),
+        'price_socio_8h': int(c.precio_socio_8h or c.precio_socio_4h),
+        'capacity': c.capacidad_display,
+        'capacity_max': c.capacidad_efectiva_max,
+        'type': 'social',
+        'images': imagenes,
+        'montaje_image': c.imagen_montaje,
+    }
+
+
+def construir():
+    """Arma el catálogo con tres consultas: salones, configuraciones y servicios.
+
+    Devuelve un dict con:
+      - 'salones': tarjetas de `espacios` (salones disponibles con configuraciones)
+      - 'configuraciones': opciones de `register`, por salón y tipo
+      - 'servicios': servicios adicionales activos sin montajes
+      - 'nombres': {salon_id: nombre} de todos los salones
+    """
+    from .models import ConfiguracionSalon, Salon, ServicioAdicional
+    from .views import get_salon_images
+
+    salones = Salon.objects.order_by('nombre').prefetch_related(
+        Prefetch('configuraciones', queryset=ConfiguracionSalon.objects.order_by('tipo_configuracion'))
+    )
+    tarjetas, opciones, nombres = [], [], {}
+    for salon in salones:
+        nombres[salon.id] = salon.nombre
+        configs = list(salon.configuraciones.all())
+        if not salon.disponible or not configs:
+            continue
+        imagenes = get_salon_images(salon)
+        tarjetas.append(_tarjeta_salon(salon, configs, imagenes))
+        opciones.extend(_opcion_configuracion(salon, c, imagenes) for c in configs)
+
+    # Excluir montajes: se manejan por separado en el formulario
+    servicios = list(
+        ServicioAdicional.objects.filter(activo=True).exclude(nombre__icontains='montaje').order_by('nombre')
+        .values('id', 'nombre', 'descripcion', 'precio_unitario', 'unidad_medida')
+    )
+    return {
+        'salones': tarjetas,
+        'configuraciones': opciones,
+        'servicios': servicios,
+        'nombres': nombres,
+    }
+
+
+def catalogo():
+    """Catálogo vigente desde la caché (se construye en el primer acceso)."""
+    partes = ['payload', generacion('precios'), generacion('imagenes')]
+    valor, _ = obtener_o_calcular('catalogo', partes, construir)
+    return valor
@@ -0,0 +1,118 @@
+"""
+GET condicional (ETag / Last-Modified → 304) para páginas públicas y APIs JSON.
+
+Cada modelo tiene un grupo de generación `datos:<app>.<modelo>` en
+`reservas.cache` que las señales incrementan en cada guardado o borrado
+(ver `signals.marcar_cambio_datos`). Las vistas decoradas con
+`condicional(...)` arman un ETag fuerte con las generaciones de los grupos
+de los que dependen (más la huella de las plantillas) y un `Last-Modified`
+con el último cambio. Si el navegador envía el mismo ETag en
+`If-None-Match` se responde 304 sin ejecutar la vista ni consultar la base
+de datos: solo una lectura `get_many` de la caché compartida (en disco por
+defecto, ver CACHES en settings). Un grupo que todavía no está en la caché
+se inicializa una vez con `add` (`generacion`/`marca_tiempo`).
+"""
+import hashlib
+from datetime import datetime, timezone as dt_timezone
+from functools import wraps
+from pathlib import Path
+
+from django.conf import settings
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .cache import estado_grupos
+
+
+def grupo_modelo(model):
+    """Grupo de generación de los datos de un modelo (p.ej. 'datos:reservas.reserva')."""
+    return f'datos:{model._meta.label_lower}'
+
+
+# (hash, mtime máximo) de las plantillas del proyecto, por proceso
+_huella = None
+
+
+def huella_plantillas():
+    """Hash del contenido de templates/ y la fecha de la plantilla más reciente.
+
+    Cambia con cada despliegue que toque una plantilla, así un 304 nunca
+    devuelve HTML de una versión anterior del sitio.
+    """
+    global _huella
+    if _huella is None:
+        h = hashlib.sha1()
+        mtime = 0
+        for conf in settings.TEMPLATES:
+            for d in conf.get('DIRS', []):
+                base = Path(d)
+                for path in sorted(base.rglob('*')):
+                    if path.is_file():
+                        h.update(path.relative_to(base).as_posix().encode())
+                        h.update(path.read_bytes())
+                        mtime = max(mtime, path.stat().st_mtime)
+        _huella = (h.hexdigest(), mtime)
+    return _huella
+
+
+def _sin_estado_de_usuario(request):
+    """¿Es un visitante anónimo sin mensajes pendientes?
+
+    La plantilla base cambia según el usuario (enlaces de staff/login) y
+    muestra los mensajes de `django.contrib.messages`: para esos casos no se
+    emiten validadores. Sin cookie de sesión no hace falta tocar la base.
+    """
+    if 'messages' in request.COOKIES:
+        return False
+    if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+        return True
+    user = getattr(request, 'user', None)
+    return not (user and user.is_authenticated)
+
+
+def condicional(*grupos, anonimo=False, extra=None, privada=False):
+    """Decorador de vista: ETag fuerte y Last-Modified por generación de datos.
+
+    `grupos`: modelos o nombres de grupo de `reservas.cache` de los que
+    depende la respuesta. `anonimo=True` para páginas HTML (ver
+    `_sin_estado_de_usuario`). `extra(request)` añade al ETag valores que no
+    vienen de la base (p.ej. la fecha de hoy). Las respuestas llevan
+    `Cache-Control: no-cache` para que el navegador siempre revalide
+    (`privada=True` para vistas con login).
+    """
+    nombres = [g if isinstance(g, str) else grupo_modelo(g) for g in grupos]
+
+    def _validadores(request):
+        # `condition` pide ETag y Last-Modified por separado: calcular una vez
+        if not hasattr(request, '_validadores_condicional'):
+            validadores = (None, None)
+            if not anonimo or _sin_estado_de_usuario(request):
+                huella, mtime_plantillas = huella_plantillas()
+                estado = estado_grupos(nombres)
+                partes = [request.resolver_match.view_name if request.resolver_match else '', huella]
+                partes.extend(gen for gen, _ in estado)
+                if extra is not None:
+                    partes.append(extra(request))
+                etag = hashlib.sha1(repr(partes).encode()).hexdigest()
+                ultimo = max([mtime_plantillas] + [ts for _, ts in estado])
+                validadores = (etag, datetime.fromtimestamp(ultimo, tz=dt_timezone.utc))
+            request._validadores_condicional = validadores
+        return request._validadores_condicional
+
+    def decorador(vista):
+        vista_condicional = condition(
+            etag_func=lambda request, *a, **k: _validadores(request)[0],
+            last_modified_func=lambda request, *a, **k: _validadores(request)[1],
+        )(vista)
+
+        @wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            response = vista_condicional(request, *args, **kwargs)
+            if response.has_header('ETag'):
+                if privada:
+                    patch_cache_control(response, no_cache=True, private=True)
+                else:
+                    patch_cache_control(response, no_cache=True, public=True)
+            return response
+        return envoltura
+    return decorador
@@ -0,0 +1,142 @@
+"""
+Contenido editorial de la portada y de `comunicados`, servido desde la caché.
+
+`index` es la URL más visitada y consultaba el anuncio flotante en cada
+visita; `comunicados` cargaba todos los comunicados activos con todas sus
+imágenes. Aquí se guardan en la caché (grupo 'contenido') estructuras ya
+listas para la plantilla: dicts con las URLs de Cloudinary resueltas, sin
+instancias de modelo.
+
+Las claves llevan las generaciones `datos:<modelo>` de `AnuncioFlotante`,
+`Comunicado` y `ComunicadoImagen`, que las señales incrementan en cada
+guardado o borrado (`signals.marcar_cambio_datos`).
+
+`comunicados` se pagina por cursor (keyset) sobre (`publicado`, `id`) en
+el mismo orden que la vista: cada página es una consulta por índice con
+`LIMIT`, sin `OFFSET`, así cuesta lo mismo la primera que la del archivo
+de hace años. Los comunicados sin fecha van al final.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import F, Q
+
+from .cache import generacion, obtener_o_calcular
+from .condicional import grupo_modelo
+
+
+POR_PAGINA = 10
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _url(imagen):
+    try:
+        return imagen.url if imagen else ''
+    except Exception:
+        return ''
+
+
+def _cargar_anuncio():
+    from .models import AnuncioFlotante
+
+    # Por ahora mostramos el anuncio más reciente (si existe)
+    anuncio = (
+        AnuncioFlotante.objects.filter(activo=True, mostrar_en_index=True)
+        .order_by('-creado').first()
+    )
+    if anuncio is None:
+        # obtener_o_calcular no guarda None: envolver el resultado
+        return {'anuncio': None}
+    return {'anuncio': {
+        'id': anuncio.id,
+        'titulo': anuncio.titulo,
+        'enlace': anuncio.enlace,
+        'imagen_url': _url(anuncio.imagen),
+    }}
+
+
+def anuncio_destacado():
+    """Anuncio flotante de la portada (dict) o None."""
+    from .models import AnuncioFlotante
+
+    partes = ['anuncio', generacion(grupo_modelo(AnuncioFlotante))]
+    valor, _ = obtener_o_calcular('contenido', partes, _cargar_anuncio)
+    return valor['anuncio']
+
+
+def codificar_cursor(publicado, pk):
+    """Cursor 'microsegundos.id' ('-.id' si el comunicado no tiene fecha)."""
+    if publicado is None:
+        return f'-.{pk}'
+    delta = publicado - _EPOCH
+    micros = (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+    return f'{micros}.{pk}'
+
+
+def decodificar_cursor(cursor):
+    """(publicado, id) del cursor, o None si no es válido."""
+    try:
+        micros, pk = (cursor or '').split('.')
+        pk = int(pk)
+        publicado = None if micros == '-' else _EPOCH + timedelta(microseconds=int(micros))
+    except (ValueError, OverflowError):
+        return None
+    return publicado, pk
+
+
+def _filtro_despues(publicado, pk):
+    """Comunicados que van después de (publicado, id) en orden descendente.
+
+    `publicado < p OR (publicado = p AND id < pk)`: ambas ramas son rangos
+    de `comunicado_pub_id_desc_idx`. Los comunicados sin fecha van después
+    de todos.
+    """
+    if publicado is None:
+        return Q(publicado__isnull=True, id__lt=pk)
+    return Q(publicado__lt=publicado) | Q(publicado=publicado, id__lt=pk) | Q(publicado__isnull=True)
+
+
+def _cargar_pagina(posicion):
+    from .models import Comunicado
+
+    qs = (
+        Comunicado.objects.filter(activo=True)
+        .order_by(F('publicado').desc(nulls_last=True), '-id')
+        .prefetch_related('images')
+    )
+    if posicion is not None:
+        qs = qs.filter(_filtro_despues(*posicion))
+    filas = list(qs[:POR_PAGINA + 1])
+    comunicados = [
+        {
+            'id': c.id,
+            'titulo': c.titulo,
+            'cuerpo': c.cuerpo,
+            'publicado': c.publicado,
+            'imagenes': [url for url in (_url(img.imagen) for img in c.images.all()) if url],
+        }
+        for c in filas[:POR_PAGINA]
+    ]
+    siguiente = None
+    if len(filas) > POR_PAGINA:
+        ultimo = filas[POR_PAGINA - 1]
+        siguiente = codificar_cursor(ultimo.publicado, ultimo.id)
+    return {'comunicados': comunicados, 'siguiente': siguiente}
+
+
+def pagina_comunicados(cursor=None):
+    """Una página de comunicados activos: {'comunicados': [...], 'siguiente': cursor o None}.
+
+    Un cursor inválido devuelve la primera página.
+    """
+    from .models import Comunicado, ComunicadoImagen
+
+    posicion = decodificar_cursor(cursor) if cursor else None
+    partes = [
+        'comunicados',
+        generacion(grupo_modelo(Comunicado)),
+        generacion(grupo_modelo(ComunicadoImagen)),
+        codificar_cursor(*posicion) if posicion else 'inicio',
+    ]
+    valor, _ = obtener_o_calcular('contenido', partes, lambda: _cargar_pagina(posicion))
+    return valor
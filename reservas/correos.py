@@ -0,0 +1,139 @@
+"""
+Render de los correos: una sola vez por mensaje y fuera del request.
+
+`reserva_post_save` renderizaba cada correo con `_render_message`, tiraba el
+resultado y `send_email_async` volvía a renderizar las mismas plantillas:
+tres correos por reserva nueva, dos renders cada uno, dentro del request.
+
+Ahora `send_email_async` guarda en la bandeja de salida los nombres de las
+plantillas y el contexto serializado (`serializar_contexto`: las instancias
+de modelo van como referencia, no copiadas). El worker de la bandeja
+renderiza cada correo una vez con `renderizar()` justo antes de enviarlo y
+ese mismo texto/html se envía y queda en `EmailLog`.
+
+Cada render emite la señal `plantilla_renderizada` con los tiempos de carga
+(`get_template`: compilación o acierto del loader en caché) y de render de
+cada plantilla; `tiempos()` los acumula por plantilla en el proceso.
+"""
+import logging
+import threading
+import time
+from decimal import Decimal
+
+from django.apps import apps
+from django.db import models
+from django.dispatch import Signal
+from django.template.loader import get_template
+from django.utils.html import strip_tags
+
+
+logger = logging.getLogger(__name__)
+
+# Argumentos: plantilla, carga (s), render (s), error (excepción o None)
+plantilla_renderizada = Signal()
+
+_tiempos = {}
+_tiempos_lock = threading.Lock()
+
+
+def _renderizar_plantilla(nombre, context):
+    inicio = time.perf_counter()
+    carga = render = 0.0
+    error = None
+    try:
+        plantilla = get_template(nombre)
+        carga = time.perf_counter() - inicio
+        salida = plantilla.render(context)
+        render = time.perf_counter() - inicio - carga
+        return salida
+    except Exception as exc:
+        error = exc
+        raise
+    finally:
+        plantilla_renderizada.send(sender=None, plantilla=nombre, carga=carga, render=render, error=error)
+
+
+def renderizar(subject, template_txt, template_html, context):
+    """Renderiza el correo y devuelve (texto, html).
+
+    Sin plantilla de texto usa el html sin etiquetas; sin ninguna, el asunto.
+    Un error de plantilla se propaga: la bandeja reintenta el correo en vez
+    de enviarlo con el cuerpo vacío.
+    """
+    text_content = ''
+    html_content = None
+    if template_txt:
+        text_content = _renderizar_plantilla(template_txt, context)
+    if template_html:
+        html_content = _renderizar_plantilla(template_html, context)
+
+    if not text_content and html_content:
+        try:
+            text_content = strip_tags(html_content).strip()
+        except Exception:
+            text_content = ''
+
+    if not text_content:
+        text_content = subject
+
+    return text_content, html_content
+
+
+def serializar_contexto(context):
+    """Contexto -> dict JSON. Modelos como referencia, Decimal como texto.
+
+    Lanza TypeError si algún valor no se puede guardar.
+    """
+    def _valor(v):
+        if isinstance(v, models.Model):
+            if v.pk is None:
+                raise TypeError(f'{v!r} sin guardar')
+            return {'__modelo__': v._meta.label_lower, 'pk': v.pk}
+        if isinstance(v, Decimal):
+            return {'__decimal__': str(v)}
+        if v is None or isinstance(v, (str, int, float, bool)):
+            return v
+        raise TypeError(f'{type(v).__name__} no serializable en el contexto del correo')
+
+    return {str(k): _valor(v) for k, v in (context or {}).items()}
+
+
+def restaurar_contexto(datos):
+    """Inverso de `serializar_contexto`.
+
+    Lanza `DoesNotExist` si un objeto referenciado ya no existe y
+    LookupError si su modelo tampoco.
+    """
+    contexto = {}
+    for k, v in (datos or {}).items():
+        if isinstance(v, dict) and '__modelo__' in v:
+            v = apps.get_model(v['__modelo__'])._default_manager.get(pk=v['pk'])
+        elif isinstance(v, dict) and '__decimal__' in v:
+            v = Decimal(v['__decimal__'])
+        contexto[k] = v
+    return contexto
+
+
+def _acumular(sender, plantilla, carga, render, error=None, **kwargs):
+    with _tiempos_lock:
+        t = _tiempos.setdefault(plantilla, {'renders': 0, 'errores': 0, 'carga': 0.0, 'carga_max': 0.0, 'render': 0.0})
+        t['renders'] += 1
+        t['errores'] += error is not None
+        t['carga'] += carga
+        t['carga_max'] = max(t['carga_max'], carga)
+        t['render'] += render
+    logger.debug('Plantilla %s: carga %.2f ms, render %.2f ms', plantilla, carga * 1000, render * 1000)
+
+
+plantilla_renderizada.connect(_acumular, dispatch_uid='reservas.correos.acumular')
+
+
+def tiempos():
+    """{plantilla: {'renders', 'errores', 'carga', 'carga_max', 'render'}} del proceso (segundos)."""
+    with _tiempos_lock:
+        return {k: dict(v) for k, v in _tiempos.items()}
+
+
+def reiniciar_tiempos():
+    with _tiempos_lock:
+        _tiempos.clear()
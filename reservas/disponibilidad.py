@@ -0,0 +1,219 @@
+"""
+Motor de conflictos de horario entre reservas de un mismo salón.
+
+Cada reserva ocupa el intervalo semiabierto
+
+    [hora_inicio - tiempo_decoracion, hora_inicio + duracion)
+
+expresado en minutos absolutos (días desde date.min * 1440 + minuto del día),
+de modo que los eventos que terminan después de medianoche se comparan
+correctamente con las reservas del día siguiente. Igual que en `register`,
+las horas anteriores a las 08:00 se interpretan como madrugada del día
+siguiente (ventana permitida 08:30 – 02:00).
+
+Todas las configuraciones de un salón comparten el mismo espacio físico,
+por eso el conflicto se evalúa por salón y no por configuración.
+
+Los bloqueos (`BloqueoEspacio`) se expresan en los mismos minutos absolutos
+con `intervalo_bloqueo`: desde `hora_inicio` de la fecha inicial hasta
+`hora_fin` de la final; sin horas cubren las jornadas completas.
+"""
+from bisect import bisect_left
+from collections import namedtuple
+from datetime import date
+
+from django.db.models import Q
+
+from .models import BloqueoEspacio, Reserva
+
+
+# Estados que ocupan el salón (una reserva cancelada libera el horario)
+ESTADOS_OCUPAN = ('PENDIENTE', 'CONFIRMADA', 'COMPLETADA')
+
+MINUTOS_DIA = 24 * 60
+# Horas antes de esta se consideran madrugada del día siguiente (01:00 -> 25:00)
+HORA_CORTE_MADRUGADA = 8
+# Reservas antiguas sin hora de inicio bloquean la jornada completa
+JORNADA_INICIO = 8 * 60 + 30
+JORNADA_FIN = (2 + 24) * 60
+# Fin máximo posible de una reserva relativo a su fecha (inicio 02:00 + 8 h)
+FIN_MAXIMO = JORNADA_FIN + 8 * 60
+
+Intervalo = namedtuple('Intervalo', ['inicio', 'fin', 'reserva_id'])
+
+
+def duracion_en_horas(duracion):
+    """'4H' -> 4, '8H' -> 8. Acepta también enteros."""
+    if isinstance(duracion, int):
+        return duracion
+    try:
+        return int(str(duracion).strip().upper().rstrip('H'))
+    except (TypeError, ValueError):
+        return 4
+
+
+def _minuto_del_dia(hora):
+    h = hora.hour if hora.hour >= HORA_CORTE_MADRUGADA else hora.hour + 24
+    return h * 60 + hora.minute
+
+
+def intervalo_reserva(fecha, hora_inicio, duracion, tiempo_decoracion=0, reserva_id=None):
+    """Devuelve el `Intervalo` (minutos absolutos) que ocupa una reserva."""
+    base = fecha.toordinal() * MINUTOS_DIA
+    if hora_inicio is None:
+        return Intervalo(base + JORNADA_INICIO, base + JORNADA_FIN, reserva_id)
+    inicio = _minuto_del_dia(hora_inicio)
+    fin = inicio + duracion_en_horas(duracion) * 60
+    inicio -= max(0, int(tiempo_decoracion or 0)) * 60
+    return Intervalo(base + inicio, base + fin, reserva_id)
+
+
+def intervalo_bloqueo(fecha_inicio, hora_inicio, fecha_fin, hora_fin, bloqueo_id=None):
+    """Devuelve el `Intervalo` (minutos absolutos) que ocupa un bloqueo.
+
+    Algunos bloqueos tienen fecha_fin < fecha_inicio; se tratan como un solo
+    día. Si las horas dejan un intervalo vacío se bloquean las jornadas completas.
+    """
+    if fecha_fin is None or fecha_fin < fecha_inicio:
+        fecha_fin = fecha_inicio
+    base_inicio = fecha_inicio.toordinal() * MINUTOS_DIA
+    base_fin = fecha_fin.toordinal() * MINUTOS_DIA
+    inicio = base_inicio + (_minuto_del_dia(hora_inicio) if hora_inicio else JORNADA_INICIO)
+    fin = base_fin + (_minuto_del_dia(hora_fin) if hora_fin else JORNADA_FIN)
+    if fin <= inicio:
+        inicio, fin = base_inicio + JORNADA_INICIO, base_fin + JORNADA_FIN
+    return Intervalo(inicio, fin, bloqueo_id)
+
+
+def _rango_fechas(intervalo):
+    """Fechas de evento cuyas reservas podrían solaparse con `intervalo`.
+
+    Una reserva del día E empieza como pronto en E + 08:00 - decoración y
+    termina como tarde en E + FIN_MAXIMO. Se asume decoración < 24 h.
+    """
+    primer_dia = (intervalo.inicio - FIN_MAXIMO) // MINUTOS_DIA
+    ultimo_dia = (intervalo.fin + MINUTOS_DIA) // MINUTOS_DIA
+    return primer_dia, ultimo_dia
+
+
+def _reservas_salon(salon_id, desde_ordinal, hasta_ordinal, excluir_id=None):
+    """Consulta por rango sobre el índice (configuracion_salon, fecha_evento)."""
+    qs = Reserva.objects.filter(
+        configuracion_salon__salon_id=salon_id,
+        fecha_evento__range=(date.fromordinal(desde_ordinal), date.fromordinal(hasta_ordinal)),
+        estado__in=ESTADOS_OCUPAN,
+    )
+    if excluir_id:
+        qs = qs.exclude(pk=excluir_id)
+    return qs.values_list('id', 'fecha_evento', 'hora_inicio', 'duracion', 'tiempo_decoracion')
+
+
+def indexar(intervalos):
+    """Ordena `Intervalo`s por inicio para poder buscarlos con bisect."""
+    intervalos = sorted(intervalos)
+    inicios = [iv.inicio for iv in intervalos]
+    max_largo = max((iv.fin - iv.inicio for iv in intervalos), default=0)
+    return intervalos, inicios, max_largo
+
+
+def indexar_intervalos(filas):
+    """Índice de las filas (id, fecha, hora_inicio, duracion, tiempo_decoracion)."""
+    return indexar(
+        intervalo_reserva(fecha, hora, duracion, decoracion, reserva_id=pk)
+        for pk, fecha, hora, duracion, decoracion in filas
+    )
+
+
+def intervalos_solapados(candidato, intervalos, inicios, max_largo):
+    """Intervalos del índice que se cruzan con `candidato` (semiabiertos)."""
+    resultado = []
+    j = bisect_left(inicios, candidato.fin) - 1
+    limite = candidato.inicio - max_largo
+    while j >= 0 and inicios[j] >= limite:
+        if intervalos[j].fin > candidato.inicio:
+            resultado.append(intervalos[j])
+        j -= 1
+    resultado.reverse()
+    return resultado
+
+
+def buscar_conflictos(salon_id, fecha, hora_inicio, duracion, tiempo_decoracion=0, excluir_id=None):
+    """Devuelve las reservas del salón que se cruzan con el horario pedido.
+
+    Hace una sola consulta acotada a las fechas vecinas de `fecha`.
+    """
+    candidato = intervalo_reserva(fecha, hora_inicio, duracion, tiempo_decoracion)
+    desde, hasta = _rango_fechas(candidato)
+    intervalos, inicios, max_largo = indexar_intervalos(_reservas_salon(salon_id, desde, hasta, excluir_id))
+    ids = [iv.reserva_id for iv in intervalos_solapados(candidato, intervalos, inicios, max_largo)]
+    if not ids:
+        return []
+    return list(
+        Reserva.objects.filter(pk__in=ids)
+        .select_related('configuracion_salon__salon')
+        .order_by('fecha_evento', 'hora_inicio')
+    )
+
+
+def hay_conflicto(salon_id, fecha, hora_inicio, duracion, tiempo_decoracion=0, excluir_id=None):
+    """True si el horario pedido se cruza con alguna reserva activa del salón."""
+    candidato = intervalo_reserva(fecha, hora_inicio, duracion, tiempo_decoracion)
+    desde, hasta = _rango_fechas(candidato)
+    intervalos, inicios, max_largo = indexar_intervalos(_reservas_salon(salon_id, desde, hasta, excluir_id))
+    return bool(intervalos_solapados(candidato, intervalos, inicios, max_largo))
+
+
+def bloqueos_activos(desde, hasta):
+    """Bloqueos activos que tocan alguna fecha entre `desde` y `hasta`.
+
+    Incluye los que tienen fecha_fin < fecha_inicio (cuentan como un día).
+    """
+    return BloqueoEspacio.objects.filter(
+        Q(fecha_fin__gte=desde) | Q(fecha_inicio__gte=desde),
+        activo=True,
+        fecha_inicio__lte=hasta,
+    )
+
+
+def bloqueos_en_conflicto(salon_id, fecha, hora_inicio, duracion, tiempo_decoracion=0):
+    """Bloqueos activos del salón que se cruzan con el horario pedido."""
+    candidato = intervalo_reserva(fecha, hora_inicio, duracion, tiempo_decoracion)
+    desde, hasta = _rango_fechas(candidato)
+    bloqueos = bloqueos_activos(date.fromordinal(desde), date.fromordinal(hasta)).filter(
+        salon_id=salon_id).order_by('fecha_inicio')
+    resultado = []
+    for b in bloqueos:
+        iv = intervalo_bloqueo(b.fecha_inicio, b.hora_inicio, b.fecha_fin, b.hora_fin, bloqueo_id=b.pk)
+        if iv.inicio < candidato.fin and candidato.inicio < iv.fin:
+            resultado.append(b)
+    return resultado
+
+
+def conflictos_en_lote(salon_id, candidatos):
+    """Evalúa muchos horarios candidatos (p.ej. un mes completo) en una pasada.
+
+    `candidatos` es una lista de tuplas (fecha, hora_inicio, duracion, tiempo_decoracion).
+    Devuelve una lista paralela con los ids de reserva en conflicto para cada
+    candidato (lista vacía = libre). Se hace UNA consulta para todo el rango.
+    """
+    if not candidatos:
+        return []
+    ivs = [intervalo_reserva(f, h, d, dec) for f, h, d, dec in candidatos]
+    desde = min(_rango_fechas(iv)[0] for iv in ivs)
+    hasta = max(_rango_fechas(iv)[1] for iv in ivs)
+    intervalos, inicios, max_largo = indexar_intervalos(_reservas_salon(salon_id, desde, hasta))
+    return [
+        [iv.reserva_id for iv in intervalos_solapados(candidato, intervalos, inicios, max_largo)]
+        for candidato in ivs
+    ]
+
+
+def describir_conflicto(reserva):
+    """Texto corto para mostrar al usuario la reserva que ocupa el horario."""
+    hora = reserva.hora_inicio.strftime('%H:%M') if reserva.hora_inicio else 'todo el día'
+    fin = ''
+    if reserva.hora_inicio:
+        iv = intervalo_reserva(reserva.fecha_evento, reserva.hora_inicio, reserva.duracion)
+        fin_min = (iv.fin % MINUTOS_DIA)
+        fin = f"–{fin_min // 60:02d}:{fin_min % 60:02d}"
+    return f"{reserva.fecha_evento:%d/%m/%Y} {hora}{fin} ({reserva.get_duracion_display()})"
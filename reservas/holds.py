@@ -0,0 +1,180 @@
+"""
+Apartados temporales (`ReservaHold`) de un horario mientras el cliente
+completa el formulario de `register`.
+
+Un apartado ACTIVO con `expira` en el futuro ocupa el salón igual que una
+reserva, pero solo para los demás clientes: quien tiene el token puede
+crear su reserva en ese horario. Las consultas usan los índices
+(fecha, estado, expira) y (estado, expira); `expirar_vencidos` marca los
+vencidos con un solo UPDATE (comando `expirar_holds`).
+"""
+import time
+import uuid
+from datetime import date, timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import incrementar_generacion
+
+from .disponibilidad import (
+    JORNADA_FIN,
+    JORNADA_INICIO,
+    MINUTOS_DIA,
+    _rango_fechas,
+    indexar_intervalos,
+    intervalo_reserva,
+    intervalos_solapados,
+)
+from .models import ReservaHold
+
+
+# Minutos que dura un apartado si no se renueva
+TTL_MINUTOS = 15
+
+# Epoch hasta el que puede haber apartados vivos (el vencimiento más lejano creado)
+_CLAVE_VIGENCIA = 'holds:vigentes_hasta'
+
+
+def _cambiaron(expira=None):
+    """Nueva generación 'holds' (ETag de check_availability) al crear o soltar apartados.
+
+    Se aplica al confirmar la transacción: si se revierte, nada cambió.
+    """
+    def _run():
+        if expira is not None:
+            hasta = expira.timestamp()
+            if hasta > (cache.get(_CLAVE_VIGENCIA) or 0):
+                cache.set(_CLAVE_VIGENCIA, hasta, timeout=int(hasta - time.time()) + 60)
+        incrementar_generacion('holds')
+
+    transaction.on_commit(_run)
+
+
+def marca_vigencia():
+    """Parte del ETag: el próximo vencimiento entre los apartados vivos.
+
+    Los apartados vencen solos (sin señal): al vencer uno cambia el próximo
+    vencimiento y con él el ETag. Si ningún apartado puede seguir vivo no
+    consulta la base y es constante.
+    """
+    if time.time() >= (cache.get(_CLAVE_VIGENCIA) or 0):
+        return 0
+    proximo = vivos().order_by('expira').values_list('expira', flat=True).first()
+    return proximo.timestamp() if proximo else 0
+
+
+def token_valido(token):
+    """UUID del token o None si viene vacío o con formato inválido."""
+    if not token:
+        return None
+    try:
+        return uuid.UUID(str(token))
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+def vivos(ahora=None):
+    """Apartados que todavía ocupan su horario."""
+    return ReservaHold.objects.filter(estado='ACTIVO', expira__gt=ahora or timezone.now()).order_by()
+
+
+def apartados_en_conflicto(salon_id, fecha, hora_inicio, duracion, tiempo_decoracion=0, excluir_token=None):
+    """Ids de los apartados vivos del salón que se cruzan con el horario pedido."""
+    candidato = intervalo_reserva(fecha, hora_inicio, duracion, tiempo_decoracion)
+    desde, hasta = _rango_fechas(candidato)
+    qs = vivos().filter(
+        configuracion_salon__salon_id=salon_id,
+        fecha__range=(date.fromordinal(desde), date.fromordinal(hasta)),
+    )
+    excluir_token = token_valido(excluir_token)
+    if excluir_token:
+        qs = qs.exclude(token=excluir_token)
+    filas = qs.values_list('id', 'fecha', 'hora_inicio', 'duracion', 'tiempo_decoracion')
+    return [iv.reserva_id for iv in intervalos_solapados(candidato, *indexar_intervalos(filas))]
+
+
+def crear_hold(configuracion, fecha, hora_inicio, duracion, tiempo_decoracion=0,
+               token=None, ttl_minutos=TTL_MINUTOS):
+    """Aparta el horario por `ttl_minutos`.
+
+    Si se pasa el `token` de un apartado anterior del mismo cliente, ese se
+    libera y se crea uno nuevo (cambio de fecha/hora o renovación). Lanza
+    `candados.HorarioOcupado` si el horario ya está reservado o apartado.
+    """
+    from .candados import reservar_horario
+
+    anterior = token_valido(token)
+    with reservar_horario(configuracion.salon_id, fecha, hora_inicio, duracion,
+                          tiempo_decoracion, hold_token=anterior):
+        if anterior:
+            liberar_hold(anterior)
+        hold = ReservaHold.objects.create(
+            configuracion_salon=configuracion,
+            fecha=fecha,
+            hora_inicio=hora_inicio,
+            duracion=duracion,
+            tiempo_decoracion=max(0, int(tiempo_decoracion or 0)),
+            expira=timezone.now() + timedelta(minutes=ttl_minutos),
+        )
+        _cambiaron(hold.expira)
+        return hold
+
+
+def liberar_hold(token):
+    token = token_valido(token)
+    if not token:
+        return 0
+    liberados = ReservaHold.objects.filter(token=token, estado='ACTIVO').update(estado='LIBERADO')
+    if liberados:
+        _cambiaron()
+    return liberados
+
+
+def convertir_hold(token):
+    """Marca el apartado como usado al crear la reserva."""
+    token = token_valido(token)
+    if not token:
+        return 0
+    convertidos = ReservaHold.objects.filter(token=token, estado='ACTIVO').update(estado='CONVERTIDO')
+    if convertidos:
+        _cambiaron()
+    return convertidos
+
+
+def expirar_vencidos(ahora=None):
+    """Marca EXPIRADO todo apartado activo vencido. Un solo UPDATE; devuelve cuántos."""
+    return ReservaHold.objects.filter(
+        estado='ACTIVO', expira__lte=ahora or timezone.now()
+    ).update(estado='EXPIRADO')
+
+
+def apartados_rango(desde, hasta):
+    """Rangos apartados por (salón, fecha) dentro de las jornadas de `desde` a `hasta`.
+
+    Devuelve {(salon_id, fecha): [[inicio, fin], ...]} en minutos desde las
+    00:00 de cada fecha, con el mismo formato que `OcupacionDiaria.rangos`.
+    """
+    resultado = {}
+    filas = vivos().filter(fecha__range=(desde - timedelta(days=1), hasta)).values_list(
+        'configuracion_salon__salon_id', 'fecha', 'hora_inicio', 'duracion', 'tiempo_decoracion')
+    for salon_id, f, hora, duracion, decoracion in filas:
+        iv = intervalo_reserva(f, hora, duracion, decoracion)
+        # Un apartado puede tocar la jornada anterior (decoración) y la siguiente
+        for ordinal in range(iv.inicio // MINUTOS_DIA - 1, iv.fin // MINUTOS_DIA + 1):
+            dia = date.fromordinal(ordinal)
+            if not desde <= dia <= hasta:
+                continue
+            base = ordinal * MINUTOS_DIA
+            ini, fin = max(iv.inicio, base + JORNADA_INICIO), min(iv.fin, base + JORNADA_FIN)
+            if ini < fin:
+                resultado.setdefault((salon_id, dia), []).append([ini - base, fin - base])
+    for rangos in resultado.values():
+        rangos.sort()
+    return resultado
+
+
+def apartados_del_dia(fecha):
+    """Rangos apartados por salón dentro de la jornada de `fecha`: {salon_id: [[inicio, fin], ...]}."""
+    return {salon_id: rangos for (salon_id, _), rangos in apartados_rango(fecha, fecha).items()}
@@ -0,0 +1,103 @@
+"""
+Manifiesto de las imágenes de `static/img`.
+
+`get_salon_images` y `_filter_existing_images` comprobaban cada ruta con
+`Path.is_file()` en cada visita a `espacios`/`register`. El manifiesto
+recorre `static/img` una vez por proceso y guarda ruta, tamaño, mtime y
+dimensiones (ancho × alto, si Pillow puede leer la cabecera); comprobar si
+una imagen existe pasa a ser una búsqueda en un dict.
+
+Se vuelve a construir cuando cambia la generación 'imagenes' de
+`reservas.cache`: la incrementan `refrescar()` (subidas desde
+`SalonAdmin.save_model`) y el comando `refrescar_imagenes`. Cada proceso
+revisa esa generación con `generacion_local`, como mucho cada
+`REVISION_LOCAL` segundos: `existe()`/`info()` no leen la caché.
+"""
+import logging
+from collections import namedtuple
+from pathlib import Path
+
+from .cache import generacion_local, incrementar_generacion
+
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONES = {'.jpg', '.jpeg', '.png', '.webp', '.avif', '.gif', '.svg'}
+
+# Variantes generadas por `reservas.variantes`: no son imágenes del sitio
+DIR_VARIANTES = '_responsive'
+
+Imagen = namedtuple('Imagen', ['ruta', 'tamano', 'mtime', 'ancho', 'alto'])
+
+# (generación, {ruta relativa a img/: Imagen}) por proceso
+_manifiesto = None
+
+
+def directorio_img():
+    """`static/img` del proyecto (primer STATICFILES_DIRS o BASE_DIR/static)."""
+    from django.conf import settings
+    static_dirs = getattr(settings, 'STATICFILES_DIRS', [])
+    base = Path(static_dirs[0]) if static_dirs else Path(settings.BASE_DIR) / 'static'
+    return base / 'img'
+
+
+def _dimensiones(path):
+    if path.suffix.lower() == '.svg':
+        return None, None
+    try:
+        from PIL import Image
+        with Image.open(path) as im:
+            return im.size
+    except Exception:
+        # Pillow no instalado o formato que no sabe leer: sin dimensiones
+        return None, None
+
+
+def construir(base=None):
+    """Recorre `static/img` y devuelve {ruta: Imagen} con rutas tipo 'carpeta/archivo.jpg'."""
+    base = Path(base) if base else directorio_img()
+    entradas = {}
+    if not base.is_dir():
+        return entradas
+    for path in base.rglob('*'):
+        if not path.is_file() or path.suffix.lower() not in EXTENSIONES:
+            continue
+        if path.relative_to(base).parts[0] == DIR_VARIANTES:
+            continue
+        try:
+            st = path.stat()
+        except OSError:
+            continue
+        ruta = path.relative_to(base).as_posix()
+        ancho, alto = _dimensiones(path)
+        entradas[ruta] = Imagen(ruta, st.st_size, st.st_mtime, ancho, alto)
+    return entradas
+
+
+def manifiesto():
+    """Manifiesto vigente del proceso; se reconstruye solo si cambió la generación."""
+    global _manifiesto
+    gen = generacion_local('imagenes')
+    if _manifiesto is None or _manifiesto[0] != gen:
+        try:
+            entradas = construir()
+        except Exception:
+            logger.exception('Error construyendo el manifiesto de imágenes')
+            entradas = {}
+        _manifiesto = (gen, entradas)
+    return _manifiesto[1]
+
+
+def existe(ruta):
+    """¿Está `ruta` (relativa a static/img/) en el manifiesto?"""
+    return ruta in manifiesto()
+
+
+def info(ruta):
+    """`Imagen` de la ruta o None."""
+    return manifiesto().get(ruta)
+
+
+def refrescar():
+    """Fuerza reconstruir el manifiesto en todos los procesos (p.ej. tras subir imágenes)."""
+    return incrementar_generacion('imagenes')
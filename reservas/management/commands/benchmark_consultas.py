@@ -0,0 +1,245 @@
+"""Verifica con EXPLAIN que las consultas frecuentes usan índices.
+
+Siembra un volumen grande de reservas de prueba (200.000 por defecto)
+dentro de una transacción, actualiza las estadísticas del planificador y
+ejecuta EXPLAIN sobre las consultas de `reportes_dashboard`,
+`check_availability`, `register` y `get_calendar_events`. Para el admin
+arma los changelists reales de Reserva y BloqueoEspacio con filtros
+habituales (`ModelAdmin.get_changelist_instance`) y explica cada SQL que
+ejecutan: la página de resultados y los conteos. Falla si alguna consulta
+recorre completa una tabla grande (Seq Scan en PostgreSQL, SCAN sin índice
+en SQLite). Al terminar revierte la transacción: la base queda como estaba.
+
+El changelist sin filtros no se evalúa: su conteo recorre la tabla por
+definición y la página va acotada por LIMIT.
+
+Uso:
+    python manage.py benchmark_consultas
+    python manage.py benchmark_consultas --reservas 50000 --verbose
+    python manage.py benchmark_consultas --sin-sembrar   # solo EXPLAIN sobre los datos actuales
+"""
+import random
+import re
+import time
+from datetime import time as dtime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+
+# Tablas que crecen con el uso: nunca deberían recorrerse completas
+RESERVA = 'reservas_reserva'
+BLOQUEO = 'reservas_bloqueoespacio'
+OCUPACION = 'reservas_ocupaciondiaria'
+HOLD = 'reservas_reservahold'
+
+SALONES = 12
+BLOQUEOS_POR_SALON = 40
+DIAS_HISTORIA = 3 * 365
+
+
+class _Revertir(Exception):
+    pass
+
+
+def _scans_completos(plan, vendor):
+    """Tablas recorridas completas según el texto de EXPLAIN."""
+    if vendor == 'postgresql':
+        return set(re.findall(r'Seq Scan on (\w+)', plan))
+    if vendor == 'sqlite':
+        # SEARCH usa el índice con restricciones; SCAN recorre todas las filas
+        # (aunque sea en el orden de un índice: "SCAN t USING INDEX ...")
+        return set(re.findall(r'\bSCAN (?:TABLE )?(\w+)', plan))
+    raise CommandError(f"Motor no soportado para el benchmark: {vendor}")
+
+
+def consultas(hoy, salon_id):
+    """(nombre, queryset, tablas vigiladas) con los mismos filtros que las vistas."""
+    from reservas.disponibilidad import _reservas_salon
+    from reservas.holds import vivos
+    from reservas.models import BloqueoEspacio, OcupacionDiaria, Reserva
+
+    desde, hasta = hoy - timedelta(days=30), hoy + timedelta(days=30)
+    reservas = Reserva.objects.select_related('configuracion_salon', 'configuracion_salon__salon')
+    reportes = Reserva.objects.filter(
+        estado__in=['CONFIRMADA', 'COMPLETADA'], fecha_evento__gte=desde, fecha_evento__lte=hasta,
+    )
+    return [
+        # reportes_dashboard
+        ('reportes: base', reportes.select_related('configuracion_salon__salon'), {RESERVA}),
+        ('reportes: ingresos por día', reportes.values('fecha_evento').order_by('fecha_evento'), {RESERVA}),
+        ('reportes: por salón', reportes.filter(configuracion_salon__salon_id=salon_id), {RESERVA}),
+        # check_availability / availability_range
+        ('check_availability: ocupación del día', OcupacionDiaria.objects.filter(fecha=hoy), {OCUPACION}),
+        ('availability_range: ventana', OcupacionDiaria.objects.filter(
+            fecha__range=(hoy, hoy + timedelta(days=180)), salon_id=salon_id), {OCUPACION}),
+        ('check_availability: apartados', vivos().filter(fecha__range=(hoy - timedelta(days=1), hoy)), {HOLD}),
+        # register (cruces y bloqueos)
+        ('register: cruces de horario', _reservas_salon(
+            salon_id, hoy.toordinal() - 2, hoy.toordinal() + 1), {RESERVA}),
+        ('register: bloqueo del salón', BloqueoEspacio.objects.filter(
+            salon_id=salon_id, activo=True, fecha_inicio__lte=hoy, fecha_fin__gte=hoy), {BLOQUEO}),
+        # get_calendar_events (ventana visible de FullCalendar)
+        ('calendario: reservas del mes', reservas.filter(
+            fecha_evento__gte=hoy, fecha_evento__lte=hoy + timedelta(days=42)), {RESERVA}),
+        ('calendario: reservas del salón', reservas.filter(
+            configuracion_salon__salon_id=salon_id,
+            fecha_evento__gte=hoy, fecha_evento__lte=hoy + timedelta(days=42)), {RESERVA}),
+        ('calendario: bloqueos del salón', BloqueoEspacio.objects.select_related('salon').filter(
+            Q(fecha_fin__gte=hoy) | Q(fecha_inicio__gte=hoy),
+            salon_id=salon_id, fecha_inicio__lte=hoy + timedelta(days=42)), {BLOQUEO}),
+    ]
+
+
+def changelists(hoy, salon_id):
+    """(nombre, modelo, parámetros GET, tablas vigiladas) de los listados del admin."""
+    from reservas.models import BloqueoEspacio, Reserva
+
+    semana = {'fecha_evento__gte': hoy.isoformat(), 'fecha_evento__lt': (hoy + timedelta(days=7)).isoformat()}
+    return [
+        ('admin reservas: estado', Reserva, {'estado__exact': 'PENDIENTE'}, {RESERVA}),
+        ('admin reservas: mes (date_hierarchy)', Reserva, {
+            'fecha_evento__year': hoy.year, 'fecha_evento__month': hoy.month}, {RESERVA}),
+        ('admin reservas: estado + mes', Reserva, {
+            'estado__exact': 'CONFIRMADA', 'fecha_evento__year': hoy.year, 'fecha_evento__month': hoy.month,
+        }, {RESERVA}),
+        ('admin reservas: próximos 7 días', Reserva, semana, {RESERVA}),
+        ('admin bloqueos: salón', BloqueoEspacio, {'salon__id__exact': salon_id}, {BLOQUEO}),
+    ]
+
+
+def sql_de_changelist(modelo, params):
+    """SQL que ejecuta el changelist del admin (conteos y página) con esos filtros."""
+    from django.contrib import admin
+    from django.contrib.auth.models import User
+    from django.test import RequestFactory
+
+    request = RequestFactory().get('/', params)
+    request.user = User(is_staff=True, is_superuser=True, is_active=True)
+    model_admin = admin.site._registry[modelo]
+    with CaptureQueriesContext(connection) as capturadas:
+        changelist = model_admin.get_changelist_instance(request)
+        list(changelist.result_list)
+    return [q['sql'] for q in capturadas.captured_queries if q['sql'].lstrip().upper().startswith('SELECT')]
+
+
+def explicar_sql(sql):
+    """Plan de una consulta SQL ya armada (texto de EXPLAIN)."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return '\n'.join(fila[-1] for fila in cursor.fetchall())
+        cursor.execute('EXPLAIN ' + sql)
+        return '\n'.join(fila[0] for fila in cursor.fetchall())
+
+
+class Command(BaseCommand):
+    help = "Siembra datos de prueba y falla si una consulta frecuente hace un recorrido completo de tabla."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reservas", type=int, default=200000,
+                            help="Cantidad de reservas a sembrar (default 200000).")
+        parser.add_argument("--sin-sembrar", action="store_true",
+                            help="No sembrar datos; ejecutar EXPLAIN sobre la base actual.")
+        parser.add_argument("--seed", type=int, default=42, help="Semilla aleatoria.")
+        parser.add_argument("--verbose", action="store_true", help="Mostrar el plan completo de cada consulta.")
+
+    def handle(self, *args, **opts):
+        fallos = []
+        try:
+            with transaction.atomic():
+                if not opts["sin_sembrar"]:
+                    self._sembrar(opts["reservas"], random.Random(opts["seed"]))
+                self._analizar()
+                fallos = self._explicar(opts["verbose"])
+                raise _Revertir()
+        except _Revertir:
+            pass
+
+        if fallos:
+            raise CommandError("Consultas con recorrido completo de tabla: " + "; ".join(fallos))
+        self.stdout.write(self.style.SUCCESS("Todas las consultas usan índices."))
+
+    def _sembrar(self, total, rnd):
+        from reservas.models import BloqueoEspacio, ConfiguracionSalon, Reserva, Salon
+        from reservas.ocupacion import reconstruir_todo
+
+        inicio = time.monotonic()
+        salones = Salon.objects.bulk_create(
+            [Salon(nombre=f"Benchmark {i}") for i in range(SALONES)])
+        configs = ConfiguracionSalon.objects.bulk_create([
+            ConfiguracionSalon(salon=s, tipo_configuracion=tipo, capacidad=100,
+                               precio_socio_4h=100000, precio_particular_4h=150000)
+            for s in salones for tipo in ('AUDITORIO', 'BANQUETE')
+        ])
+
+        hoy = timezone.localdate()
+        estados = ['PENDIENTE', 'CONFIRMADA', 'CANCELADA', 'COMPLETADA']
+        lote = []
+        for i in range(total):
+            lote.append(Reserva(
+                configuracion_salon=rnd.choice(configs),
+                nombre_cliente=f"Cliente {i}",
+                email_cliente=f"cliente{i}@example.com",
+                telefono_cliente="3000000000",
+                fecha_evento=hoy + timedelta(days=rnd.randint(-DIAS_HISTORIA, 180)),
+                hora_inicio=dtime(rnd.choice([9, 10, 14, 18, 20]), 0),
+                duracion=rnd.choice(['4H', '8H']),
+                numero_personas=rnd.randint(10, 100),
+                precio_total=150000,
+                estado=rnd.choice(estados),
+            ))
+            if len(lote) == 5000:
+                Reserva.objects.bulk_create(lote)
+                lote = []
+        if lote:
+            Reserva.objects.bulk_create(lote)
+
+        bloqueos = []
+        for s in salones:
+            for _ in range(BLOQUEOS_POR_SALON):
+                fi = hoy + timedelta(days=rnd.randint(-DIAS_HISTORIA, 180))
+                bloqueos.append(BloqueoEspacio(salon=s, fecha_inicio=fi,
+                                               fecha_fin=fi + timedelta(days=rnd.randint(0, 3))))
+        BloqueoEspacio.objects.bulk_create(bloqueos)
+        filas = reconstruir_todo()
+
+        self._salon_id = salones[0].id
+        self.stdout.write(
+            f"Sembradas {total} reservas, {len(bloqueos)} bloqueos y {filas} filas de ocupación "
+            f"en {time.monotonic() - inicio:.1f}s"
+        )
+
+    def _analizar(self):
+        """Estadísticas al día para que el planificador vea el volumen real."""
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def _explicar(self, verbose):
+        from reservas.models import Salon
+
+        salon_id = getattr(self, '_salon_id', None)
+        if salon_id is None:
+            salon_id = Salon.objects.order_by('id').values_list('id', flat=True).first() or 0
+
+        hoy = timezone.localdate()
+        planes = [(nombre, qs.explain(), vigiladas) for nombre, qs, vigiladas in consultas(hoy, salon_id)]
+        for nombre, modelo, params, vigiladas in changelists(hoy, salon_id):
+            for i, sql in enumerate(sql_de_changelist(modelo, params), 1):
+                planes.append((f"{nombre} [{i}]", explicar_sql(sql), vigiladas))
+
+        fallos = []
+        for nombre, plan, vigiladas in planes:
+            completas = _scans_completos(plan, connection.vendor) & vigiladas
+            if completas:
+                fallos.append(f"{nombre} ({', '.join(sorted(completas))})")
+                self.stdout.write(self.style.ERROR(f"FULL SCAN  {nombre}: {', '.join(sorted(completas))}"))
+            else:
+                self.stdout.write(f"ok         {nombre}")
+            if verbose or completas:
+                for linea in plan.splitlines():
+                    self.stdout.write(f"    {linea}")
+        return fallos
@@ -0,0 +1,113 @@
+"""Depura los registros de correo más antiguos que --dias, en lotes.
+
+Por defecto borra los `EmailLog` (y los `EmailOutbox` ya enviados o con
+error) anteriores al límite y después los `EmailBody` que quedaron sin uso.
+Con --compactar no borra nada: pasa a `EmailBody` los cuerpos guardados en
+línea por los registros anteriores a la deduplicación.
+
+Cada lote va en su propia transacción, así la tabla no queda bloqueada
+mientras dura la depuración.
+
+Uso:
+    python manage.py depurar_email_logs --dias 180
+    python manage.py depurar_email_logs --compactar --dias 0
+    python manage.py depurar_email_logs --dias 90 --dry-run
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import ProtectedError, Q
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = "Borra o compacta los EmailLog más antiguos que N días, en lotes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dias", type=int, default=180,
+                            help="Antigüedad mínima (días) de los registros a depurar.")
+        parser.add_argument("--lote", type=int, default=500,
+                            help="Registros por lote/transacción.")
+        parser.add_argument("--compactar", action="store_true",
+                            help="Mover los cuerpos en línea a EmailBody en lugar de borrar.")
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Solo contar lo que se depuraría.")
+
+    def handle(self, *args, **opts):
+        from reservas.models import EmailLog, EmailOutbox
+
+        limite = timezone.now() - timedelta(days=opts["dias"])
+        lote = max(1, opts["lote"])
+        logs = EmailLog.objects.filter(created_at__lt=limite)
+
+        if opts["compactar"]:
+            logs = logs.filter(Q(body_text__isnull=False) | Q(body_html__isnull=False))
+            if opts["dry_run"]:
+                self.stdout.write(f"{logs.count()} registro(s) con el cuerpo en línea.")
+                return
+            n = self._compactar(logs, lote)
+            self.stdout.write(self.style.SUCCESS(f"{n} registro(s) compactado(s)."))
+            return
+
+        bandeja = EmailOutbox.objects.filter(created_at__lt=limite, status__in=['ENVIADO', 'ERROR'])
+        if opts["dry_run"]:
+            self.stdout.write(f"{logs.count()} EmailLog y {bandeja.count()} correo(s) de la bandeja a borrar.")
+            return
+        borrados = self._borrar(logs, lote)
+        borrados_bandeja = self._borrar(bandeja, lote)
+        cuerpos = self._borrar_cuerpos_sin_uso(lote)
+        self.stdout.write(self.style.SUCCESS(
+            f"{borrados} EmailLog, {borrados_bandeja} correo(s) de la bandeja y "
+            f"{cuerpos} cuerpo(s) sin uso borrados."
+        ))
+
+    def _compactar(self, logs, lote):
+        from reservas.models import EmailLog
+
+        total, ultimo = 0, 0
+        while True:
+            filas = list(
+                logs.filter(pk__gt=ultimo).order_by("pk")
+                .only("pk", "body_text", "body_html", "text_body", "html_body")[:lote]
+            )
+            if not filas:
+                return total
+            with transaction.atomic():
+                EmailLog.mover_cuerpos(filas)
+                EmailLog.objects.bulk_update(filas, ["body_text", "body_html", "text_body", "html_body"])
+            total += len(filas)
+            ultimo = filas[-1].pk
+            self.stdout.write(f"  {total} compactado(s)...")
+
+    def _borrar(self, queryset, lote):
+        total = 0
+        while True:
+            pks = list(queryset.order_by("pk").values_list("pk", flat=True)[:lote])
+            if not pks:
+                return total
+            with transaction.atomic():
+                total += queryset.model.objects.filter(pk__in=pks).delete()[1].get(queryset.model._meta.label, 0)
+            self.stdout.write(f"  {queryset.model.__name__}: {total} borrado(s)...")
+
+    def _borrar_cuerpos_sin_uso(self, lote):
+        from reservas.models import EmailBody
+
+        sin_uso = EmailBody.objects.filter(logs_texto__isnull=True, logs_html__isnull=True)
+        total, saltar = 0, set()
+        while True:
+            hashes = list(sin_uso.exclude(hash__in=saltar).order_by("hash").values_list("hash", flat=True)[:lote])
+            if not hashes:
+                return total
+            try:
+                with transaction.atomic():
+                    # Bloquear y volver a comprobar: un EmailLog confirmado
+                    # mientras tanto (ver EmailBody.guardar) conserva su cuerpo
+                    bloqueados = list(EmailBody.objects.select_for_update()
+                                      .filter(hash__in=hashes).values_list("hash", flat=True))
+                    libres = list(sin_uso.filter(hash__in=bloqueados).values_list("hash", flat=True))
+                    total += EmailBody.objects.filter(hash__in=libres).delete()[0]
+                saltar.update(set(hashes) - set(libres))
+            except ProtectedError:
+                # Un EmailLog nuevo tomó alguno de estos cuerpos mientras tanto
+                saltar.update(hashes)
@@ -0,0 +1,32 @@
+"""Muestra los contadores de aciertos/fallos de las cachés de reservas.
+
+Uso:
+    python manage.py estadisticas_cache
+    python manage.py estadisticas_cache --reset
+"""
+from django.core.management.base import BaseCommand
+
+from reservas.cache import estadisticas, reiniciar_estadisticas
+
+
+GRUPOS = ['disponibilidad', 'catalogo', 'precios', 'contenido']
+
+
+class Command(BaseCommand):
+    help = "Muestra hits/misses de las cachés de disponibilidad, catálogo y precios."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset", action="store_true",
+                            help="Pone a cero los contadores después de mostrarlos.")
+
+    def handle(self, *args, **opts):
+        for grupo in GRUPOS:
+            st = estadisticas(grupo)
+            self.stdout.write(
+                f"{st['grupo']:<16} gen={st['generacion']} hits={st['hits']} "
+                f"misses={st['misses']} ratio={st['ratio']:.1%}"
+            )
+            if opts["reset"]:
+                reiniciar_estadisticas(grupo)
+        if opts["reset"]:
+            self.stdout.write(self.style.SUCCESS("Contadores reiniciados."))
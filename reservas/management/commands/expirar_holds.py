@@ -0,0 +1,34 @@
+"""Marca como EXPIRADO los apartados de horario (ReservaHold) vencidos.
+
+Pensado para ejecutarse cada pocos minutos (cron). La disponibilidad ya
+ignora los apartados vencidos por su fecha de expiración; este barrido
+solo deja el estado al día con un único UPDATE.
+
+Uso:
+    python manage.py expirar_holds
+    python manage.py expirar_holds --purgar-dias 30
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = "Expira en bloque los apartados de horario vencidos."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--purgar-dias", type=int, default=0,
+                            help="Además, borrar apartados ya cerrados con más de N días.")
+
+    def handle(self, *args, **opts):
+        from reservas.holds import expirar_vencidos
+        from reservas.models import ReservaHold
+
+        expirados = expirar_vencidos()
+        self.stdout.write(self.style.SUCCESS(f"Apartados expirados: {expirados}"))
+
+        if opts["purgar_dias"] > 0:
+            limite = timezone.now() - timedelta(days=opts["purgar_dias"])
+            borrados, _ = ReservaHold.objects.exclude(estado='ACTIVO').filter(expira__lt=limite).delete()
+            self.stdout.write(f"Apartados antiguos borrados: {borrados}")
@@ -0,0 +1,38 @@
+"""Genera el sprite SVG de los íconos de montaje en static/img.
+
+Correr después de cambiar un ícono en `reservas/templatetags/montaje_icons.py`
+y versionar el archivo resultante junto con el cambio. El tag
+`montaje_icon` lo referencia con `?v=<hash del contenido>`, así que los
+navegadores descargan el sprite nuevo al desplegar.
+
+Uso:
+    python manage.py generar_sprite_montajes
+    python manage.py generar_sprite_montajes --check
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Escribe static/img/montajes-sprite.svg con un <symbol> por tipo de montaje."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--check", action="store_true",
+                            help="No escribir; fallar si el sprite en disco está desactualizado.")
+
+    def handle(self, *args, **opts):
+        from reservas.templatetags.montaje_icons import ruta_sprite, sprite
+
+        contenido = sprite().encode()
+        ruta = ruta_sprite()
+        actual = ruta.read_bytes() if ruta.is_file() else None
+        if opts["check"]:
+            if actual != contenido:
+                raise CommandError(f"{ruta} está desactualizado: correr generar_sprite_montajes.")
+            self.stdout.write(self.style.SUCCESS(f"{ruta} está al día."))
+            return
+        if actual == contenido:
+            self.stdout.write(f"{ruta} ya estaba al día ({len(contenido)} bytes).")
+            return
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        ruta.write_bytes(contenido)
+        self.stdout.write(self.style.SUCCESS(f"Sprite escrito en {ruta} ({len(contenido)} bytes)."))
@@ -0,0 +1,63 @@
+"""Genera las variantes responsive (AVIF + WebP) de static/img en paralelo.
+
+Recorre static/img, procesa en un pool de procesos solo las imágenes nuevas
+o cuyo contenido cambió (hash en static/img/_responsive/manifest.json) y
+reescribe el manifiesto que usa el tag `cdn_img`. Al final refresca el
+manifiesto de imágenes en todos los procesos.
+
+Uso:
+    python manage.py generar_variantes
+    python manage.py generar_variantes --procesos 4
+    python manage.py generar_variantes --forzar          # regenerar todo (p.ej. tras cambiar ANCHOS)
+    python manage.py generar_variantes --formatos webp
+"""
+from django.core.management.base import BaseCommand
+
+
+def _mb(n):
+    return f"{n / (1024 * 1024):.1f} MB"
+
+
+class Command(BaseCommand):
+    help = "Genera variantes AVIF/WebP a varios anchos de static/img (pool de procesos, incremental)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--procesos", type=int, default=None,
+                            help="Procesos del pool (por defecto, uno por CPU).")
+        parser.add_argument("--forzar", action="store_true",
+                            help="Regenerar aunque el hash del original no haya cambiado.")
+        parser.add_argument("--formatos", default="avif,webp",
+                            help="Formatos separados por coma (default: avif,webp).")
+
+    def handle(self, *args, **opts):
+        from reservas import variantes
+        from reservas.imagenes import directorio_img, refrescar
+
+        formatos = tuple(f.strip().lower() for f in opts["formatos"].split(",") if f.strip())
+
+        def al_procesar(rel, entrada, error):
+            if error is not None:
+                self.stdout.write(self.style.ERROR(f"  {rel}: {error}"))
+            else:
+                self.stdout.write(f"  {rel} ({entrada['ancho']}x{entrada['alto']}): "
+                                  f"{len(entrada['variantes'])} variante(s)")
+
+        resumen = variantes.construir(
+            procesos=opts["procesos"], forzar=opts["forzar"], formatos=formatos,
+            al_procesar=al_procesar,
+        )
+        refrescar()
+
+        self.stdout.write(
+            f"{resumen['procesadas']} procesada(s), {resumen['sin_cambios']} sin cambios, "
+            f"{resumen['eliminadas']} variante(s) obsoleta(s) eliminada(s)."
+        )
+        for formato, (orig, var) in sorted(variantes.ahorro(resumen["imagenes"]).items()):
+            pct = (1 - var / orig) * 100 if orig else 0
+            self.stdout.write(
+                f"  {formato}: originales {_mb(orig)} -> variante más ancha {_mb(var)} "
+                f"({_mb(orig - var)} menos, -{pct:.0f}%)"
+            )
+        if resumen["errores"]:
+            self.stdout.write(self.style.WARNING(f"{len(resumen['errores'])} imagen(es) con error."))
+        self.stdout.write(self.style.SUCCESS(f"Manifiesto: {variantes.ruta_manifiesto(directorio_img())}"))
@@ -0,0 +1,39 @@
+"""Renderiza las páginas institucionales (TemplateView) y las deja en la caché.
+
+Pensado para correr al arrancar (ver entrypoint.sh), después de
+collectstatic: el primer visitante de cada página ya recibe la respuesta
+comprimida desde la caché compartida (ver CACHES en settings; con
+LocMemCache el precalentado se quedaría en este proceso).
+
+Uso:
+    python manage.py precalentar_paginas
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Precalienta la caché de respuesta completa de las páginas TemplateView."
+
+    def handle(self, *args, **opts):
+        from django.test import Client
+
+        from reservas import paginas
+
+        hosts = [h for h in settings.ALLOWED_HOSTS if h and '*' not in h and not h.startswith('.')]
+        client = Client(raise_request_exception=False, HTTP_HOST=hosts[0] if hosts else 'localhost')
+
+        guardadas = 0
+        for ruta in sorted(paginas.rutas()):
+            # La respuesta pasa por todo el stack; el middleware la guarda
+            response = client.get(ruta, HTTP_ACCEPT_ENCODING='identity')
+            client.cookies.clear()
+            if response.status_code == 200 and paginas.cache.get(paginas.clave(ruta)) is not None:
+                guardadas += 1
+                self.stdout.write(f"  {ruta}")
+            else:
+                self.stdout.write(self.style.WARNING(f"  {ruta}: no se guardó (HTTP {response.status_code})"))
+        variantes = "identidad, gzip" + (", br" if paginas.brotli is not None else "")
+        self.stdout.write(self.style.SUCCESS(
+            f"{guardadas} página(s) en la caché ({variantes})."
+        ))
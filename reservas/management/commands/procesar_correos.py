@@ -0,0 +1,82 @@
+"""Worker de la bandeja de salida de correos (`EmailOutbox`).
+
+Envía los correos pendientes en lotes, con una conexión SMTP por lote, y
+reintenta los fallidos con espera exponencial (ver reservas/bandeja_salida.py).
+Sin --una-vez queda corriendo y revisa la bandeja cada --intervalo segundos.
+Es un proceso del Procfile: entrypoint.sh lo arranca con honcho junto a
+gunicorn.
+
+Uso:
+    python manage.py procesar_correos
+    python manage.py procesar_correos --una-vez
+    python manage.py procesar_correos --lote 100
+    python manage.py procesar_correos --una-vez -v 2   # tiempos por plantilla
+"""
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Envía los correos de la bandeja de salida."
+
+    def add_arguments(self, parser):
+        from reservas import bandeja_salida
+
+        parser.add_argument("--una-vez", action="store_true",
+                            help="Enviar lo pendiente y terminar en lugar de quedar esperando.")
+        parser.add_argument("--intervalo", type=float, default=10.0,
+                            help="Segundos entre revisiones cuando no hay correos listos.")
+        parser.add_argument("--lote", type=int, default=bandeja_salida.LOTE,
+                            help="Correos por lote (una conexión SMTP por lote).")
+
+    def handle(self, *args, **opts):
+        from reservas import bandeja_salida
+
+        try:
+            while True:
+                close_old_connections()
+                try:
+                    reencolados = bandeja_salida.reencolar_vencidas()
+                    if reencolados:
+                        self.stdout.write(self.style.WARNING(f"{reencolados} correo(s) vencido(s) de vuelta en la cola."))
+                    resumen = bandeja_salida.enviar_lote(opts["lote"])
+                except Exception as exc:
+                    # Un lote fallido (p.ej. la base caída un momento) no detiene el worker
+                    logger.exception("Error procesando la bandeja de salida")
+                    self.stderr.write(f"Error procesando la bandeja de salida: {exc}")
+                    if opts["una_vez"]:
+                        break
+                    time.sleep(opts["intervalo"])
+                    continue
+                if resumen:
+                    self.stdout.write(
+                        f"Lote: {resumen['enviados']} enviado(s), {resumen['reintentar']} para reintentar, "
+                        f"{resumen['errores']} con error."
+                    )
+                    if opts["verbosity"] >= 2:
+                        self._tiempos()
+                    if resumen["enviados"]:
+                        continue
+                if opts["una_vez"]:
+                    break
+                time.sleep(opts["intervalo"])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS("Bandeja de salida procesada."))
+
+    def _tiempos(self):
+        from reservas import correos
+
+        for plantilla, t in sorted(correos.tiempos().items()):
+            n = t["renders"] or 1
+            self.stdout.write(
+                f"  {plantilla}: {t['renders']} render(s), {t['errores']} error(es), "
+                f"carga media {t['carga'] / n * 1000:.2f} ms (máx {t['carga_max'] * 1000:.2f} ms), "
+                f"render medio {t['render'] / n * 1000:.2f} ms"
+            )
@@ -0,0 +1,59 @@
+"""Worker de la cola de imágenes subidas desde el admin de salones.
+
+Toma lotes de `SubidaImagen` pendientes, los sube a Cloudinary y genera sus
+variantes en paralelo, y publica cada imagen en su salón al terminar (ver
+reservas/subidas.py). Sin --una-vez queda corriendo y revisa la cola cada
+--intervalo segundos. Es un proceso del Procfile: entrypoint.sh lo arranca
+con honcho junto a gunicorn.
+
+Uso:
+    python manage.py procesar_subidas
+    python manage.py procesar_subidas --una-vez
+    python manage.py procesar_subidas --concurrencia 8 --lote 20
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+
+class Command(BaseCommand):
+    help = "Procesa la cola de imágenes subidas (Cloudinary + variantes)."
+
+    def add_arguments(self, parser):
+        from reservas import subidas
+
+        parser.add_argument("--una-vez", action="store_true",
+                            help="Vaciar la cola y terminar en lugar de quedar esperando.")
+        parser.add_argument("--intervalo", type=float, default=5.0,
+                            help="Segundos entre revisiones cuando la cola está vacía.")
+        parser.add_argument("--lote", type=int, default=subidas.LOTE,
+                            help="Subidas por lote.")
+        parser.add_argument("--concurrencia", type=int, default=subidas.CONCURRENCIA,
+                            help="Archivos procesados en paralelo.")
+
+    def handle(self, *args, **opts):
+        from reservas import subidas
+
+        try:
+            while True:
+                close_old_connections()
+                reencoladas = subidas.reencolar_vencidas()
+                if reencoladas:
+                    self.stdout.write(self.style.WARNING(f"{reencoladas} subida(s) vencida(s) de vuelta en la cola."))
+                resumen = subidas.procesar_lote(opts["lote"], opts["concurrencia"])
+                if resumen:
+                    self.stdout.write(
+                        f"Lote: {resumen['listas']} lista(s), {resumen['reintentar']} para reintentar, "
+                        f"{resumen['errores']} con error."
+                    )
+                    if resumen["reintentar"]:
+                        # No reintentar en caliente lo que acaba de fallar
+                        time.sleep(opts["intervalo"])
+                    continue
+                if opts["una_vez"]:
+                    break
+                time.sleep(opts["intervalo"])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS("Cola de subidas procesada."))
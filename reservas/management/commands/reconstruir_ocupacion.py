@@ -0,0 +1,47 @@
+"""Reconstruye la tabla OcupacionDiaria a partir de Reserva y BloqueoEspacio.
+
+Uso:
+    python manage.py reconstruir_ocupacion
+    python manage.py reconstruir_ocupacion --desde 2025-01-01
+    python manage.py reconstruir_ocupacion --si-vacia
+
+Las señales mantienen la tabla al día; `--si-vacia` (entrypoint.sh) solo la
+llena en el primer arranque tras crearla o vaciarla en una migración.
+"""
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+
+class Command(BaseCommand):
+    help = "Reconstruye desde cero la ocupación diaria precalculada de los salones."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--desde", default="",
+                            help="Solo reconstruir desde esta fecha (YYYY-MM-DD). Por defecto, todo el historial.")
+        parser.add_argument("--si-vacia", action="store_true",
+                            help="No hacer nada si la tabla ya tiene filas.")
+
+    def handle(self, *args, **opts):
+        from reservas.cache import incrementar_generacion
+        from reservas.models import OcupacionDiaria
+        from reservas.ocupacion import reconstruir_todo
+
+        if opts["si_vacia"] and OcupacionDiaria.objects.exists():
+            self.stdout.write("La ocupación ya está calculada; nada que reconstruir.")
+            return
+
+        desde = None
+        if opts["desde"]:
+            try:
+                desde = datetime.strptime(opts["desde"], "%Y-%m-%d").date()
+            except ValueError:
+                raise CommandError("Formato de --desde inválido (usa YYYY-MM-DD).")
+
+        with transaction.atomic():
+            total = reconstruir_todo(desde=desde, stdout=self.stdout)
+        # La caché y los ETag de disponibilidad se basan en la tabla reconstruida
+        incrementar_generacion('disponibilidad')
+
+        self.stdout.write(self.style.SUCCESS(f"Ocupación reconstruida: {total} fila(s)."))
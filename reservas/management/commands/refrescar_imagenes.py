@@ -0,0 +1,32 @@
+"""Reconstruye el manifiesto de imágenes de static/img en todos los procesos.
+
+Usar después de copiar o borrar imágenes a mano en static/img (las subidas
+desde el admin de salones ya lo refrescan).
+
+Uso:
+    python manage.py refrescar_imagenes
+    python manage.py refrescar_imagenes --listar
+"""
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Reconstruye el manifiesto de static/img (ruta, tamaño, mtime y dimensiones)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--listar", action="store_true",
+                            help="Mostrar cada imagen con su tamaño y dimensiones.")
+
+    def handle(self, *args, **opts):
+        from reservas.imagenes import directorio_img, manifiesto, refrescar
+
+        gen = refrescar()
+        entradas = manifiesto()
+        if opts["listar"]:
+            for ruta in sorted(entradas):
+                im = entradas[ruta]
+                dims = f"{im.ancho}x{im.alto}" if im.ancho else "-"
+                self.stdout.write(f"{im.tamano:>10}  {dims:>11}  {ruta}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Manifiesto de {directorio_img()}: {len(entradas)} imagen(es) (generación {gen})."
+        ))
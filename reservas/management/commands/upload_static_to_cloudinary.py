@@ -1,5 +1,9 @@
 """Sube las imagenes de static/img/ a Cloudinary con public_id = ruta
-relativa sin extension. Idempotente: por defecto salta si ya existe.
+relativa sin extension. Idempotente y reanudable: un archivo JSON de estado
+guarda el MD5 de cada imagen subida, asi que una corrida cortada (p.ej. por
+rate limit) se retoma donde quedo y las siguientes solo suben lo que cambio.
+Las subidas van en paralelo (--concurrencia) con reintentos exponenciales
+ante 420/429. Ver reservas/subidas_cloudinary.py.
 
 Uso:
     # Configurar credenciales SOLO via env vars (NUNCA hardcodear):
@@ -12,12 +16,20 @@ Uso:
     #   --overwrite : re-sube las imagenes aunque ya existan
     #   --root=path : carpeta a procesar (default: static/img)
     #   --dry-run   : muestra que subiria sin subir
+    #   --concurrencia=N : subidas simultaneas (default: env CLOUDINARY_UPLOAD_CONCURRENCY o 4)
+    #   --estado=path : archivo JSON de estado (default: cloudinary_subidas.json)
+    #   --api-url=URL : base de la API (default: https://api.cloudinary.com;
+    #                   env CLOUDINARY_UPLOAD_PREFIX). Util para probar contra
+    #                   un servidor local.
 """
 import os
 from pathlib import Path
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
 
+from reservas import subidas_cloudinary
+from reservas.imagenes import DIR_VARIANTES
+
 
 IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".avif", ".gif"}
 
@@ -37,6 +49,14 @@ class Command(BaseCommand):
         parser.add_argument("--list", default="",
                             help="Archivo con rutas a subir (una por linea, ej. 'img/yotas1.jpeg'). "
                                  "Si se especifica, --root se ignora.")
+        parser.add_argument("--concurrencia", type=int,
+                            default=os.environ.get("CLOUDINARY_UPLOAD_CONCURRENCY",
+                                                   subidas_cloudinary.CONCURRENCIA),
+                            help="Subidas simultaneas.")
+        parser.add_argument("--estado", default=str(Path(settings.BASE_DIR) / "cloudinary_subidas.json"),
+                            help="Archivo JSON con el MD5 de lo ya subido (para reanudar).")
+        parser.add_argument("--api-url", default=os.environ.get("CLOUDINARY_UPLOAD_PREFIX", ""),
+                            help="Base de la API de Cloudinary (default: https://api.cloudinary.com).")
 
     def handle(self, *args, **opts):
         cloud_name = os.environ.get("CLOUDINARY_CLOUD_NAME") or getattr(settings, "CLOUDINARY_CLOUD_NAME", "")
@@ -56,12 +76,10 @@ class Command(BaseCommand):
         except ImportError as e:
             raise CommandError(f"La libreria `cloudinary` no esta disponible: {e}")
 
-        cloudinary.config(
-            cloud_name=cloud_name,
-            api_key=api_key,
-            api_secret=api_secret,
-            secure=True,
-        )
+        config = dict(cloud_name=cloud_name, api_key=api_key, api_secret=api_secret, secure=True)
+        if opts["api_url"]:
+            config["upload_prefix"] = opts["api_url"].rstrip("/")
+        cloudinary.config(**config)
 
         overwrite = opts["overwrite"]
         dry_run = opts["dry_run"]
@@ -104,61 +122,69 @@ class Command(BaseCommand):
                     continue
                 if p.suffix.lower() not in IMAGE_EXTS:
                     continue
+                # Las variantes de generar_variantes no se suben: Cloudinary transforma solo
+                if DIR_VARIANTES in p.relative_to(root).parts:
+                    continue
                 files.append(p)
 
         self.stdout.write(f"Encontrados {len(files)} archivos imagen para procesar.")
+        if limit:
+            files = files[:limit]
 
-        uploaded = 0
-        skipped = 0
-        failed = 0
-        total = len(files) if not limit else min(len(files), limit)
-
-        for i, fpath in enumerate(files):
-            if limit and uploaded + skipped + failed >= limit:
-                break
+        tareas = []
+        for fpath in files:
             # public_id = ruta relativa desde static/, sin extension
             # ej: 'static/img/yotas1.jpeg' -> 'img/yotas1'
             try:
                 rel_from_static = fpath.relative_to(Path("static").resolve()).as_posix()
             except ValueError:
                 rel_from_static = fpath.relative_to(root.parent).as_posix()
-            public_id = os.path.splitext(rel_from_static)[0]
-
-            prefix = f"[{i+1}/{total}]"
-
-            if not overwrite:
-                # Chequea si ya existe; si si, salta
-                try:
-                    cloudinary.api.resource(public_id)
-                    skipped += 1
-                    self.stdout.write(f"{prefix} skip (existe): {public_id}")
-                    continue
-                except cloudinary.exceptions.NotFound:
-                    pass
-                except Exception as e:
-                    self.stderr.write(self.style.WARNING(f"{prefix} chequeo existencia fallo para {public_id}: {e}"))
-                    # continuamos al upload
-
-            if dry_run:
-                self.stdout.write(f"{prefix} (dry) subiria: {public_id} <- {fpath}")
-                uploaded += 1
-                continue
+            tareas.append(subidas_cloudinary.Tarea(fpath, os.path.splitext(rel_from_static)[0]))
+
+        def subir(ruta, public_id, reemplazar):
+            return cloudinary.uploader.upload(
+                str(ruta),
+                public_id=public_id,
+                overwrite=reemplazar,
+                resource_type="image",
+                use_filename=False,
+                unique_filename=False,
+            )
 
+        def etag_remoto(public_id):
             try:
-                cloudinary.uploader.upload(
-                    str(fpath),
-                    public_id=public_id,
-                    overwrite=overwrite,
-                    resource_type="image",
-                    use_filename=False,
-                    unique_filename=False,
-                )
-                uploaded += 1
-                self.stdout.write(self.style.SUCCESS(f"{prefix} OK: {public_id}"))
-            except Exception as e:
-                failed += 1
-                self.stderr.write(self.style.ERROR(f"{prefix} FAIL {public_id}: {e}"))
+                return cloudinary.api.resource(public_id).get("etag")
+            except cloudinary.exceptions.NotFound:
+                return None
+
+        estado = subidas_cloudinary.EstadoSubidas(opts["estado"])
+        self.stdout.write(f"Estado: {estado.ruta} ({len(estado)} registradas) | concurrencia={opts['concurrencia']}")
+
+        total = len(tareas)
+        hechas = [0]
+
+        def al_terminar(tarea, resultado, detalle):
+            hechas[0] += 1
+            prefix = f"[{hechas[0]}/{total}]"
+            if resultado == "subido":
+                self.stdout.write(self.style.SUCCESS(f"{prefix} OK ({detalle}): {tarea.public_id}"))
+            elif resultado == "sin_cambios":
+                self.stdout.write(f"{prefix} skip ({detalle}): {tarea.public_id}")
+            elif resultado == "dry":
+                self.stdout.write(f"{prefix} (dry) {detalle}: {tarea.public_id} <- {tarea.ruta}")
+            else:
+                self.stderr.write(self.style.ERROR(f"{prefix} FAIL {tarea.public_id}: {detalle}"))
+
+        resumen = subidas_cloudinary.sincronizar(
+            tareas, estado, subir,
+            etag_remoto=etag_remoto,
+            overwrite=overwrite,
+            dry_run=dry_run,
+            concurrencia=opts["concurrencia"],
+            al_terminar=al_terminar,
+        )
 
         self.stdout.write(self.style.SUCCESS(
-            f"\nResumen: uploaded={uploaded} skipped={skipped} failed={failed}"
+            f"\nResumen: uploaded={resumen['subido'] + resumen['dry']} skipped={resumen['sin_cambios']} "
+            f"failed={resumen['fallido']}"
         ))
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservas', '0027_delete_imagencomunicado_alter_comunicado_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(fields=['configuracion_salon', 'fecha_evento'], name='reserva_config_fecha_idx'),
+        ),
+    ]
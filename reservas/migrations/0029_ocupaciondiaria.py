@@ -0,0 +1,37 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservas', '0028_reserva_config_fecha_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OcupacionDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('rangos', models.JSONField(blank=True, default=list, help_text='Lista de [inicio, fin, reserva_id] en minutos desde las 00:00 de la fecha (la madrugada siguiente cuenta como 24:00+).')),
+                ('num_reservas', models.PositiveIntegerField(default=0)),
+                ('minutos_ocupados', models.PositiveIntegerField(default=0)),
+                ('minutos_libres', models.PositiveIntegerField(default=0, help_text='Minutos libres dentro de la jornada 08:30 – 02:00')),
+                ('bloqueado', models.BooleanField(default=False)),
+                ('motivo_bloqueo', models.CharField(blank=True, max_length=100)),
+                ('descripcion_bloqueo', models.TextField(blank=True)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('salon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ocupaciones', to='reservas.salon')),
+            ],
+            options={
+                'verbose_name': 'Ocupación diaria',
+                'verbose_name_plural': 'Ocupación diaria',
+                'ordering': ['fecha', 'salon'],
+                'indexes': [models.Index(fields=['fecha', 'salon'], name='ocupacion_fecha_salon_idx')],
+                'unique_together': {('salon', 'fecha')},
+            },
+        ),
+    ]
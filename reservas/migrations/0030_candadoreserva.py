@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservas', '0029_ocupaciondiaria'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CandadoReserva',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('salon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='candados', to='reservas.salon')),
+            ],
+            options={
+                'verbose_name': 'Candado de reserva',
+                'verbose_name_plural': 'Candados de reserva',
+                'unique_together': {('salon', 'fecha')},
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:07
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservas', '0030_candadoreserva'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReservaHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('fecha', models.DateField()),
+                ('hora_inicio', models.TimeField(blank=True, null=True)),
+                ('duracion', models.CharField(choices=[('4H', '4 Horas'), ('8H', '8 Horas')], default='4H', max_length=2)),
+                ('tiempo_decoracion', models.PositiveIntegerField(default=0)),
+                ('estado', models.CharField(choices=[('ACTIVO', 'Activo'), ('CONVERTIDO', 'Convertido en reserva'), ('LIBERADO', 'Liberado'), ('EXPIRADO', 'Expirado')], default='ACTIVO', max_length=10)),
+                ('expira', models.DateTimeField()),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('configuracion_salon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='reservas.configuracionsalon')),
+            ],
+            options={
+                'verbose_name': 'Apartado de horario',
+                'verbose_name_plural': 'Apartados de horario',
+                'ordering': ['-creado'],
+                'indexes': [models.Index(fields=['fecha', 'estado', 'expira'], name='hold_fecha_estado_expira_idx'), models.Index(fields=['estado', 'expira'], name='hold_estado_expira_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservas', '0031_reservahold'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bloqueoespacio',
+            index=models.Index(fields=['salon', 'activo', 'fecha_inicio', 'fecha_fin'], name='bloqueo_salon_activo_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(fields=['estado', 'fecha_evento'], name='reserva_estado_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(fields=['fecha_evento'], name='reserva_fecha_evento_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(fields=['fecha_creacion'], name='reserva_creacion_idx'),
+        ),
+    ]
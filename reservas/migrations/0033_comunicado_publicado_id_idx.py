@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservas', '0032_indices_consultas_frecuentes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comunicado',
+            index=models.Index(fields=['publicado', 'id'], name='comunicado_publicado_id_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservas', '0033_comunicado_publicado_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubidaImagen',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('archivo', models.CharField(help_text="Ruta relativa a static/img (ej. 'salon_bar/foto.jpg')", max_length=255)),
+                ('nombre_original', models.CharField(blank=True, max_length=255)),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('PROCESANDO', 'Procesando'), ('LISTA', 'Lista'), ('ERROR', 'Error')], default='PENDIENTE', max_length=10)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('subida_cloudinary', models.BooleanField(default=False)),
+                ('variantes', models.PositiveSmallIntegerField(default=0, help_text='Variantes AVIF/WebP generadas')),
+                ('error', models.TextField(blank=True)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('iniciado', models.DateTimeField(blank=True, null=True)),
+                ('terminado', models.DateTimeField(blank=True, null=True)),
+                ('salon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subidas', to='reservas.salon')),
+            ],
+            options={
+                'verbose_name': 'Subida de imagen',
+                'verbose_name_plural': 'Subidas de imágenes',
+                'ordering': ['-creado'],
+                'indexes': [models.Index(fields=['estado', 'creado'], name='subida_estado_creado_idx')],
+            },
+        ),
+    ]
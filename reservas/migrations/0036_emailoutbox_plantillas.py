@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservas', '0035_emailoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailoutbox',
+            name='context',
+            field=models.JSONField(blank=True, default=dict, help_text='Contexto serializado (ver reservas.correos)'),
+        ),
+        migrations.AddField(
+            model_name='emailoutbox',
+            name='template_html',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='emailoutbox',
+            name='template_txt',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+    ]
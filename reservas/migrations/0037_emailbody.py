@@ -0,0 +1,45 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservas', '0036_emailoutbox_plantillas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailBody',
+            fields=[
+                ('hash', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('data', models.BinaryField()),
+                ('size', models.PositiveIntegerField(default=0, help_text='Bytes sin comprimir (UTF-8)')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Cuerpo de email',
+                'verbose_name_plural': 'Cuerpos de email',
+            },
+        ),
+        migrations.AddField(
+            model_name='emaillog',
+            name='html_body',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='logs_html', to='reservas.emailbody'),
+        ),
+        migrations.AddField(
+            model_name='emaillog',
+            name='text_body',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='logs_texto', to='reservas.emailbody'),
+        ),
+        migrations.AddIndex(
+            model_name='emaillog',
+            index=models.Index(fields=['success', 'created_at'], name='emaillog_success_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emaillog',
+            index=models.Index(fields=['created_at'], name='emaillog_created_idx'),
+        ),
+    ]
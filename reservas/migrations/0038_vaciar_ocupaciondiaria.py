@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+def vaciar_ocupacion(apps, schema_editor):
+    # Los bloqueos por horas ya no marcan el día completo: las filas se
+    # recalculan con `reconstruir_ocupacion --si-vacia` (entrypoint.sh)
+    OcupacionDiaria = apps.get_model('reservas', 'OcupacionDiaria')
+    OcupacionDiaria.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservas', '0037_emailbody'),
+    ]
+
+    operations = [
+        migrations.RunPython(vaciar_ocupacion, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:07
+
+import reservas.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservas', '0038_vaciar_ocupaciondiaria'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='comunicado',
+            name='comunicado_publicado_id_idx',
+        ),
+        migrations.AddIndex(
+            model_name='comunicado',
+            index=reservas.models.IndiceNullsLast(models.OrderBy(models.F('publicado'), descending=True, nulls_last=True), models.OrderBy(models.F('id'), descending=True), name='comunicado_pub_id_desc_idx'),
+        ),
+    ]
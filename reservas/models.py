@@ -1,7 +1,13 @@
-from django.db import models
+import hashlib
+import uuid
+import zlib
+
+from django.db import models, transaction
+from django.db.models import F, OrderBy
 from cloudinary.models import CloudinaryField
 from django.core.validators import MinValueValidator
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 
 # Create your models here.
 
@@ -159,6 +165,16 @@ class Reserva(models.Model):
         verbose_name = "Reserva"
         verbose_name_plural = "Reservas"
         ordering = ['-fecha_evento', '-fecha_creacion']
+        indexes = [
+            # Búsqueda de cruces de horario por salón y rango de fechas (reservas.disponibilidad)
+            models.Index(fields=['configuracion_salon', 'fecha_evento'], name='reserva_config_fecha_idx'),
+            # Panel, reportes y conteos por estado en un rango de fechas
+            models.Index(fields=['estado', 'fecha_evento'], name='reserva_estado_fecha_idx'),
+            # Calendario (ventana de fechas sin filtro de salón) y orden por defecto del admin
+            models.Index(fields=['fecha_evento'], name='reserva_fecha_evento_idx'),
+            # Listado del panel ordenado por creación
+            models.Index(fields=['fecha_creacion'], name='reserva_creacion_idx'),
+        ]
         # Permisos personalizados para control fino desde grupos
         permissions = (
             ("can_review_reserva", "Puede revisar reservas"),
@@ -169,28 +185,100 @@ class Reserva(models.Model):
     def __str__(self):
         return f"{self.configuracion_salon.salon.nombre} - {self.nombre_cliente} - {self.fecha_evento}"
     
+    def calcular_precio_base(self):
+        """Precio del salón según el tipo de cliente y la duración (sin servicios)."""
+        from .precios import motor, precio_configuracion
+        precio = motor().precio_base(self.configuracion_salon_id, self.tipo_cliente, self.duracion)
+        if precio is None:
+            # Configuración aún no incluida en la matriz: leerla directamente
+            precio = precio_configuracion(self.configuracion_salon, self.tipo_cliente, self.duracion)
+        return precio
+
+    # Campos que cambian la ocupación del salón (ver signals / ocupacion)
+    CAMPOS_OCUPACION = frozenset({
+        'configuracion_salon', 'fecha_evento', 'hora_inicio', 'duracion', 'tiempo_decoracion', 'estado',
+    })
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Recordar los valores leídos de la BD para detectar qué campos cambian."""
+        instance = super().from_db(db, field_names, values)
+        instance._valores_originales = dict(zip(field_names, values))
+        instance._leida_de_bd = True
+        return instance
+
+    def _recordar_valores(self):
+        self._valores_originales = {
+            f.attname: self.__dict__[f.attname]
+            for f in self._meta.concrete_fields if f.attname in self.__dict__
+        }
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        """Recarga desde la BD y toma los valores recargados como originales."""
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        self._leida_de_bd = True
+        anteriores = getattr(self, '_valores_originales', None)
+        self._recordar_valores()
+        if fields is not None and anteriores is not None:
+            # Los campos no recargados conservan sus cambios pendientes
+            recargados = {
+                f.attname for f in self._meta.concrete_fields if f.name in fields or f.attname in fields
+            }
+            self._valores_originales = {
+                k: v for k, v in self._valores_originales.items() if k in recargados
+            } | {k: v for k, v in anteriores.items() if k not in recargados}
+
+    def valor_original(self, campo):
+        """Valor de `campo` (name o attname) al cargarse/guardarse por última vez."""
+        attname = self._meta.get_field(campo).attname
+        return getattr(self, '_valores_originales', {}).get(attname)
+
+    def campos_modificados(self):
+        """Nombres de los campos cambiados desde que se cargó o guardó la instancia.
+
+        Devuelve None si la instancia no viene de la BD (todo es nuevo).
+        """
+        originales = getattr(self, '_valores_originales', None)
+        if originales is None:
+            return None
+        cambiados = set()
+        for f in self._meta.concrete_fields:
+            if f.attname not in self.__dict__:
+                continue  # campo diferido que no se tocó
+            if f.attname not in originales or originales[f.attname] != self.__dict__[f.attname]:
+                cambiados.add(f.name)
+        return cambiados
+
     def save(self, *args, **kwargs):
-        """Calcula automáticamente el precio según el tipo de cliente y duración"""
+        """Calcula automáticamente el precio según el tipo de cliente y duración.
+
+        Si la instancia se leyó de la BD (`from_db`/`refresh_from_db`) y no se
+        indica `update_fields`, solo se validan y escriben los campos
+        modificados (más `fecha_modificacion`). Como con `update_fields`
+        explícito, si la fila ya no existe Django lanza DatabaseError.
+        """
         if not self.precio_total or self.precio_total == 0:
-            if self.tipo_cliente == 'SOCIO':
-                if self.duracion == '4H':
-                    self.precio_total = self.configuracion_salon.precio_socio_4h
-                else:
-                    self.precio_total = self.configuracion_salon.precio_socio_8h or self.configuracion_salon.precio_socio_4h
-            else:  # PARTICULAR
-                if self.duracion == '4H':
-                    self.precio_total = self.configuracion_salon.precio_particular_4h
-                else:
-                    self.precio_total = self.configuracion_salon.precio_particular_8h or self.configuracion_salon.precio_particular_4h
+            self.precio_total = self.calcular_precio_base()
+
+        exclude = None
+        # Sin pk (copia con `pk = None`) se inserta entera
+        leida = getattr(self, '_leida_de_bd', False) and not self._state.adding and self.pk is not None
+        cambiados = self.campos_modificados() if leida else None
+        parcial = (cambiados is not None and not args and 'update_fields' not in kwargs
+                   and not kwargs.get('force_insert'))
+        if parcial:
+            kwargs['update_fields'] = cambiados | {'fecha_modificacion'}
+            exclude = [f.name for f in self._meta.concrete_fields if f.name not in cambiados]
         
         # Validate required fields at model level
         try:
-            self.full_clean()
+            self.full_clean(exclude=exclude)
         except ValidationError:
             # Re-raise to make validation failures explicit to callers
             raise
 
         super().save(*args, **kwargs)
+        self._recordar_valores()
 
     def clean(self):
         """Validaciones de modelo: exigir email del cliente."""
@@ -200,8 +288,70 @@ class Reserva(models.Model):
 
 
 
+class EmailBody(models.Model):
+    """Cuerpo de correo comprimido (zlib), guardado una vez por contenido.
+
+    La clave es el SHA-256 del texto: los miles de `EmailLog` con el mismo
+    render apuntan a una sola fila.
+    """
+
+    hash = models.CharField(max_length=64, primary_key=True)
+    data = models.BinaryField()
+    size = models.PositiveIntegerField(default=0, help_text='Bytes sin comprimir (UTF-8)')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Cuerpo de email'
+        verbose_name_plural = 'Cuerpos de email'
+
+    def __str__(self):
+        return f"{self.hash[:12]} ({self.size} B)"
+
+    @staticmethod
+    def clave(texto):
+        return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+    @property
+    def contenido(self):
+        return zlib.decompress(bytes(self.data)).decode('utf-8')
+
+    @classmethod
+    def guardar(cls, textos):
+        """Guarda los textos que falten (una sola consulta) y devuelve {texto: hash}.
+
+        Va dentro de la transacción que crea los `EmailLog`: los cuerpos
+        existentes quedan bloqueados hasta entonces y `depurar_email_logs`
+        no puede borrarlos entre esta consulta y el INSERT de los logs.
+        """
+        claves = {t: cls.clave(t) for t in set(textos) if t}
+        if claves:
+            existentes = set(
+                cls.objects.select_for_update().filter(hash__in=claves.values()).values_list('hash', flat=True))
+            nuevos = [
+                cls(hash=h, data=zlib.compress(t.encode('utf-8'), 6), size=len(t.encode('utf-8')))
+                for t, h in claves.items() if h not in existentes
+            ]
+            # Otro proceso puede guardar el mismo contenido a la vez
+            cls.objects.bulk_create(nuevos, ignore_conflicts=True)
+        return claves
+
+
+class EmailLogManager(models.Manager):
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        with transaction.atomic(using=self.db):
+            EmailLog.mover_cuerpos(objs)
+            return super().bulk_create(objs, *args, **kwargs)
+
+
 class EmailLog(models.Model):
-    """Registro de intentos de envío de correos electrónicos."""
+    """Registro de intentos de envío de correos electrónicos.
+
+    `body_text`/`body_html` se aceptan al crear, pero al guardar se mueven a
+    `EmailBody` (comprimidos y deduplicados); para leerlos usar `texto` y
+    `html`, que también resuelven registros antiguos con el cuerpo en línea.
+    """
     CHANNEL_CHOICES = [
         ('EMAIL', 'Email'),
     ]
@@ -212,18 +362,106 @@ class EmailLog(models.Model):
     subject = models.CharField(max_length=255, blank=True, null=True)
     body_text = models.TextField(blank=True, null=True)
     body_html = models.TextField(blank=True, null=True)
+    text_body = models.ForeignKey(EmailBody, on_delete=models.PROTECT, null=True, blank=True, related_name='logs_texto')
+    html_body = models.ForeignKey(EmailBody, on_delete=models.PROTECT, null=True, blank=True, related_name='logs_html')
     success = models.BooleanField(default=False)
     error = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = EmailLogManager()
+
     class Meta:
         verbose_name = 'Email Log'
         verbose_name_plural = 'Email Logs'
         ordering = ['-created_at']
+        indexes = [
+            # Filtro "success" del admin ordenado por fecha
+            models.Index(fields=['success', 'created_at'], name='emaillog_success_created_idx'),
+            # Orden por defecto del admin y depuración por antigüedad
+            models.Index(fields=['created_at'], name='emaillog_created_idx'),
+        ]
 
     def __str__(self):
         target = self.to_email or 'sin destino'
         return f"{self.get_channel_display()} -> {target} ({'OK' if self.success else 'FAIL'})"
+
+    @staticmethod
+    def mover_cuerpos(logs):
+        """Pasa los cuerpos en línea de `logs` a `EmailBody` (sin guardar los logs)."""
+        claves = EmailBody.guardar(
+            [l.body_text for l in logs if l.body_text] + [l.body_html for l in logs if l.body_html])
+        for log in logs:
+            if log.body_text:
+                log.text_body_id = claves[log.body_text]
+            if log.body_html:
+                log.html_body_id = claves[log.body_html]
+            log.body_text = log.body_html = None
+
+    def save(self, *args, **kwargs):
+        if not (self.body_text or self.body_html):
+            return super().save(*args, **kwargs)
+        # Cuerpos y log en una transacción (ver EmailBody.guardar)
+        with transaction.atomic(using=kwargs.get('using') or self._state.db):
+            EmailLog.mover_cuerpos([self])
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = set(kwargs['update_fields']) | {'body_text', 'body_html', 'text_body', 'html_body'}
+            super().save(*args, **kwargs)
+
+    @property
+    def texto(self):
+        return self.text_body.contenido if self.text_body_id else self.body_text
+
+    @property
+    def html(self):
+        return self.html_body.contenido if self.html_body_id else self.body_html
+
+
+class EmailOutbox(models.Model):
+    """Correo pendiente de envío (bandeja de salida).
+
+    `send_email_async` crea la fila dentro de la transacción de la reserva;
+    el comando `procesar_correos` (o el pool del proceso web) la renderiza,
+    la envía y registra el resultado en `EmailLog` (ver
+    `reservas.bandeja_salida` y `reservas.correos`).
+    """
+
+    STATUS_CHOICES = [
+        ('PENDIENTE', 'Pendiente'),
+        ('ENVIANDO', 'Enviando'),
+        ('ENVIADO', 'Enviado'),
+        ('ERROR', 'Error'),
+    ]
+
+    reserva = models.ForeignKey(Reserva, on_delete=models.SET_NULL, null=True, blank=True, related_name='correos_pendientes')
+    to_email = models.TextField(help_text='Destinatarios separados por coma')
+    subject = models.CharField(max_length=255, blank=True)
+    body_text = models.TextField(blank=True)
+    body_html = models.TextField(blank=True, null=True)
+    # Si hay plantillas y body_text está vacío, el worker renderiza antes de enviar
+    template_txt = models.CharField(max_length=200, blank=True)
+    template_html = models.CharField(max_length=200, blank=True)
+    context = models.JSONField(default=dict, blank=True, help_text='Contexto serializado (ver reservas.correos)')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDIENTE')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Correo en cola'
+        verbose_name_plural = 'Correos en cola'
+        ordering = ['-created_at']
+        indexes = [
+            # Cola del worker: pendientes cuyo próximo intento ya llegó
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_next_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {self.to_email} ({self.status})"
+
+
 class CodigoSocio(models.Model):
     """Modelo para gestionar códigos válidos de socios"""
     codigo = models.CharField(max_length=50, unique=True, help_text="Código único del socio")
@@ -270,6 +508,10 @@ class BloqueoEspacio(models.Model):
         verbose_name = "Bloqueo de Espacio"
         verbose_name_plural = "Bloqueos de Espacios"
         ordering = ['-fecha_inicio']
+        indexes = [
+            # ¿Está el salón bloqueado en esta fecha? (register, disponibilidad, ocupación)
+            models.Index(fields=['salon', 'activo', 'fecha_inicio', 'fecha_fin'], name='bloqueo_salon_activo_fecha_idx'),
+        ]
     
     def __str__(self):
         times = ''
@@ -286,6 +528,144 @@ class BloqueoEspacio(models.Model):
         return self.fecha_inicio <= fecha <= self.fecha_fin
 
 
+class OcupacionDiaria(models.Model):
+    """Ocupación precalculada de un salón en una fecha (tabla desnormalizada).
+
+    Se mantiene al día desde las señales de Reserva y BloqueoEspacio (ver
+    `reservas.ocupacion`) y se puede reconstruir con
+    `manage.py reconstruir_ocupacion`. Solo existen filas para los días con
+    reservas o bloqueos: si no hay fila, el salón está libre ese día.
+    """
+
+    salon = models.ForeignKey(Salon, on_delete=models.CASCADE, related_name='ocupaciones')
+    fecha = models.DateField()
+    rangos = models.JSONField(default=list, blank=True,
+                              help_text='Lista de [inicio, fin, reserva_id] en minutos desde las 00:00 de la fecha (la madrugada siguiente cuenta como 24:00+).')
+    num_reservas = models.PositiveIntegerField(default=0)
+    minutos_ocupados = models.PositiveIntegerField(default=0)
+    minutos_libres = models.PositiveIntegerField(default=0, help_text='Minutos libres dentro de la jornada 08:30 – 02:00')
+    bloqueado = models.BooleanField(default=False)
+    motivo_bloqueo = models.CharField(max_length=100, blank=True)
+    descripcion_bloqueo = models.TextField(blank=True)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Ocupación diaria'
+        verbose_name_plural = 'Ocupación diaria'
+        ordering = ['fecha', 'salon']
+        unique_together = ('salon', 'fecha')
+        indexes = [
+            models.Index(fields=['fecha', 'salon'], name='ocupacion_fecha_salon_idx'),
+        ]
+
+    def __str__(self):
+        estado = 'bloqueado' if self.bloqueado else f'{self.num_reservas} reserva(s)'
+        return f"{self.salon.nombre} - {self.fecha} ({estado})"
+
+
+class ReservaHold(models.Model):
+    """Apartado temporal de un horario mientras el cliente llena el formulario.
+
+    Mientras esté ACTIVO y no haya vencido (`expira`), el horario cuenta
+    como ocupado para los demás clientes (ver `reservas.holds`). Al crear
+    la reserva pasa a CONVERTIDO; los vencidos los marca EXPIRADO el
+    comando `expirar_holds` con un solo UPDATE.
+    """
+
+    ESTADO_CHOICES = [
+        ('ACTIVO', 'Activo'),
+        ('CONVERTIDO', 'Convertido en reserva'),
+        ('LIBERADO', 'Liberado'),
+        ('EXPIRADO', 'Expirado'),
+    ]
+
+    token = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    configuracion_salon = models.ForeignKey(ConfiguracionSalon, on_delete=models.CASCADE, related_name='holds')
+    fecha = models.DateField()
+    hora_inicio = models.TimeField(null=True, blank=True)
+    duracion = models.CharField(max_length=2, choices=Reserva.DURACION_CHOICES, default='4H')
+    tiempo_decoracion = models.PositiveIntegerField(default=0)
+    estado = models.CharField(max_length=10, choices=ESTADO_CHOICES, default='ACTIVO')
+    expira = models.DateTimeField()
+    creado = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Apartado de horario'
+        verbose_name_plural = 'Apartados de horario'
+        ordering = ['-creado']
+        indexes = [
+            # Consulta de apartados vivos de un salón/fecha y barrido de vencidos
+            models.Index(fields=['fecha', 'estado', 'expira'], name='hold_fecha_estado_expira_idx'),
+            models.Index(fields=['estado', 'expira'], name='hold_estado_expira_idx'),
+        ]
+
+    def __str__(self):
+        return f"Apartado {self.configuracion_salon_id} {self.fecha} {self.hora_inicio or ''} ({self.estado})"
+
+
+class CandadoReserva(models.Model):
+    """Fila de bloqueo por (salón, fecha) para serializar la creación de reservas.
+
+    `reservas.candados.reservar_horario` la toma con `select_for_update`
+    dentro de la transacción que valida el cruce de horario y crea la
+    reserva, así dos solicitudes simultáneas para el mismo salón y fecha
+    no pueden pasar la validación a la vez. No guarda datos de negocio.
+    """
+
+    salon = models.ForeignKey(Salon, on_delete=models.CASCADE, related_name='candados')
+    fecha = models.DateField()
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Candado de reserva'
+        verbose_name_plural = 'Candados de reserva'
+        unique_together = ('salon', 'fecha')
+
+    def __str__(self):
+        return f"{self.salon_id} - {self.fecha}"
+
+
+class SubidaImagen(models.Model):
+    """Imagen subida desde el admin de salones, pendiente de procesar.
+
+    `SalonAdmin.save_model` solo guarda el archivo en static/img y crea la
+    fila; el comando `procesar_subidas` la sube a Cloudinary, genera sus
+    variantes y, al terminar, la agrega al campo `imagen` del salón (ver
+    `reservas.subidas`).
+    """
+
+    ESTADO_CHOICES = [
+        ('PENDIENTE', 'Pendiente'),
+        ('PROCESANDO', 'Procesando'),
+        ('LISTA', 'Lista'),
+        ('ERROR', 'Error'),
+    ]
+
+    salon = models.ForeignKey(Salon, on_delete=models.CASCADE, related_name='subidas')
+    archivo = models.CharField(max_length=255, help_text="Ruta relativa a static/img (ej. 'salon_bar/foto.jpg')")
+    nombre_original = models.CharField(max_length=255, blank=True)
+    estado = models.CharField(max_length=10, choices=ESTADO_CHOICES, default='PENDIENTE')
+    intentos = models.PositiveSmallIntegerField(default=0)
+    subida_cloudinary = models.BooleanField(default=False)
+    variantes = models.PositiveSmallIntegerField(default=0, help_text='Variantes AVIF/WebP generadas')
+    error = models.TextField(blank=True)
+    creado = models.DateTimeField(auto_now_add=True)
+    iniciado = models.DateTimeField(null=True, blank=True)
+    terminado = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Subida de imagen'
+        verbose_name_plural = 'Subidas de imágenes'
+        ordering = ['-creado']
+        indexes = [
+            # Cola del worker: pendientes por antigüedad y procesando vencidos
+            models.Index(fields=['estado', 'creado'], name='subida_estado_creado_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.archivo} ({self.estado})"
+
+
 class ServicioAdicional(models.Model):
     """Modelo para servicios adicionales que se pueden agregar a las reservas"""
     
@@ -328,6 +708,25 @@ class ReservaServicioAdicional(models.Model):
         super().save(*args, **kwargs)
 
 
+class IndiceNullsLast(models.Index):
+    """`models.Index` con expresiones `desc(nulls_last=True)`.
+
+    SQLite no acepta NULLS LAST en un índice, pero ahí NULL es el menor
+    valor y `DESC` ya lo deja al final: se crea el mismo orden sin el
+    modificador. PostgreSQL lo recibe tal cual.
+    """
+
+    def create_sql(self, model, schema_editor, using="", **kwargs):
+        if schema_editor.connection.vendor != 'sqlite':
+            return super().create_sql(model, schema_editor, using=using, **kwargs)
+        _, args, opciones = self.deconstruct()
+        expresiones = [
+            OrderBy(e.expression, descending=e.descending) if isinstance(e, OrderBy) else e
+            for e in args
+        ]
+        return models.Index(*expresiones, **opciones).create_sql(model, schema_editor, using=using, **kwargs)
+
+
 class Comunicado(models.Model):
     """Comunicados de Gerencia (para la sección pública).
 
@@ -349,6 +748,11 @@ class Comunicado(models.Model):
         verbose_name = 'Comunicado'
         verbose_name_plural = 'Comunicados'
         ordering = ['-publicado', '-id']
+        indexes = [
+            # Paginación por cursor de la vista pública, en el mismo orden
+            # que la consulta (ver reservas.contenido)
+            IndiceNullsLast(F('publicado').desc(nulls_last=True), F('id').desc(), name='comunicado_pub_id_desc_idx'),
+        ]
 
     def __str__(self):
         return self.titulo or f'Comunicado #{self.id}'
@@ -0,0 +1,311 @@
+"""
+Mantenimiento de la tabla desnormalizada `OcupacionDiaria`.
+
+Cada fila resume un (salón, fecha): rangos de minutos reservados dentro de
+la jornada 08:30 – 02:00, si hay un bloqueo activo y cuántos minutos quedan
+libres. Un bloqueo con horas que no cubre toda la jornada entra en `rangos`
+como un rango más con id None; solo los que la cubren marcan `bloqueado`.
+Las señales de Reserva y BloqueoEspacio llaman a `recalcular` con las
+fechas afectadas, también en los borrados masivos del admin (`delete()` de
+un queryset envía `post_delete` por fila); `reconstruir_todo` regenera la
+tabla desde cero.
+
+Las consultas de disponibilidad leen una fila por día en vez de recorrer
+todo el historial de reservas y bloqueos.
+"""
+from datetime import date, timedelta
+
+from django.db.models import Q
+
+from .disponibilidad import (
+    ESTADOS_OCUPAN,
+    JORNADA_FIN,
+    JORNADA_INICIO,
+    MINUTOS_DIA,
+    Intervalo,
+    bloqueos_activos,
+    indexar_intervalos,
+    intervalo_bloqueo,
+    intervalos_solapados,
+)
+from .models import BloqueoEspacio, ConfiguracionSalon, OcupacionDiaria, Reserva
+
+
+MINUTOS_JORNADA = JORNADA_FIN - JORNADA_INICIO
+
+
+def _normalizar_bloqueo(fecha_inicio, fecha_fin):
+    """Algunos bloqueos tienen fecha_fin < fecha_inicio; se tratan como un solo día."""
+    if fecha_fin is None or fecha_fin < fecha_inicio:
+        return fecha_inicio, fecha_inicio
+    return fecha_inicio, fecha_fin
+
+
+def _bloqueo(fecha_inicio, hora_inicio, fecha_fin, hora_fin, motivo, descripcion):
+    """Tupla (fecha_inicio, fecha_fin, motivo, descripcion, intervalo) para `_filas_para`."""
+    return (*_normalizar_bloqueo(fecha_inicio, fecha_fin), motivo, descripcion,
+            intervalo_bloqueo(fecha_inicio, hora_inicio, fecha_fin, hora_fin))
+
+
+CAMPOS_BLOQUEO = ('fecha_inicio', 'hora_inicio', 'fecha_fin', 'hora_fin', 'motivo', 'descripcion')
+
+
+def _union(rangos):
+    """Minutos cubiertos por la unión de rangos [inicio, fin)."""
+    total = 0
+    fin_actual = None
+    for inicio, fin in sorted(rangos):
+        if fin_actual is None or inicio >= fin_actual:
+            total += fin - inicio
+            fin_actual = fin
+        elif fin > fin_actual:
+            total += fin - fin_actual
+            fin_actual = fin
+    return total
+
+
+def _filas_para(salon_id, fechas, reservas, bloqueos):
+    """Construye las filas OcupacionDiaria (sin guardar) de un salón.
+
+    `reservas` son tuplas (id, fecha_evento, hora_inicio, duracion, tiempo_decoracion)
+    y `bloqueos` tuplas de `_bloqueo`.
+    """
+    indice = indexar_intervalos(reservas)
+    motivos = dict(BloqueoEspacio.MOTIVO_CHOICES)
+    filas = []
+    for fecha in sorted(fechas):
+        base = fecha.toordinal() * MINUTOS_DIA
+        jornada_ini, jornada_fin = base + JORNADA_INICIO, base + JORNADA_FIN
+        rangos = []
+        ids = set()
+        for iv in intervalos_solapados(Intervalo(jornada_ini, jornada_fin, None), *indice):
+            ini, fin = max(iv.inicio, jornada_ini), min(iv.fin, jornada_fin)
+            if ini < fin:
+                rangos.append([ini - base, fin - base, iv.reserva_id])
+                ids.add(iv.reserva_id)
+        completo = parcial = None
+        for b in bloqueos:
+            ini, fin = max(b[4].inicio, jornada_ini), min(b[4].fin, jornada_fin)
+            if ini >= fin:
+                continue
+            if ini == jornada_ini and fin == jornada_fin:
+                completo = completo or b
+            else:
+                rangos.append([ini - base, fin - base, None])
+                parcial = parcial or b
+        bloqueo = completo or parcial
+        if not rangos and bloqueo is None:
+            continue
+        rangos.sort(key=lambda r: (r[0], r[1]))
+        ocupados = _union((r[0], r[1]) for r in rangos)
+        filas.append(OcupacionDiaria(
+            salon_id=salon_id,
+            fecha=fecha,
+            rangos=rangos,
+            num_reservas=len(ids),
+            minutos_ocupados=ocupados,
+            minutos_libres=0 if completo else MINUTOS_JORNADA - ocupados,
+            bloqueado=completo is not None,
+            motivo_bloqueo=motivos.get(bloqueo[2], bloqueo[2]) if bloqueo else '',
+            descripcion_bloqueo=bloqueo[3] if bloqueo else '',
+        ))
+    return filas
+
+
+def recalcular(salon_id, fechas):
+    """Recalcula las filas de `salon_id` para las fechas dadas.
+
+    Usa dos consultas de lectura (reservas y bloqueos del rango) y escribe
+    con un único upsert; los días que quedaron libres se borran.
+    """
+    fechas = {f for f in fechas if f}
+    if not salon_id or not fechas:
+        return
+    desde, hasta = min(fechas), max(fechas)
+    # Eventos de los días vecinos pueden entrar en la jornada de `desde`/`hasta`
+    reservas = list(
+        Reserva.objects.filter(
+            configuracion_salon__salon_id=salon_id,
+            fecha_evento__range=(desde - timedelta(days=1), hasta + timedelta(days=1)),
+            estado__in=ESTADOS_OCUPAN,
+        ).values_list('id', 'fecha_evento', 'hora_inicio', 'duracion', 'tiempo_decoracion')
+    )
+    bloqueos = [
+        _bloqueo(*fila)
+        for fila in bloqueos_activos(desde, hasta).filter(salon_id=salon_id).values_list(*CAMPOS_BLOQUEO)
+    ]
+    _guardar(salon_id, fechas, _filas_para(salon_id, fechas, reservas, bloqueos))
+
+
+def _guardar(salon_id, fechas, filas):
+    con_fila = {f.fecha for f in filas}
+    vacias = [f for f in fechas if f not in con_fila]
+    if vacias:
+        OcupacionDiaria.objects.filter(salon_id=salon_id, fecha__in=vacias).delete()
+    if filas:
+        OcupacionDiaria.objects.bulk_create(
+            filas,
+            update_conflicts=True,
+            unique_fields=['salon', 'fecha'],
+            update_fields=['rangos', 'num_reservas', 'minutos_ocupados', 'minutos_libres',
+                           'bloqueado', 'motivo_bloqueo', 'descripcion_bloqueo', 'actualizado'],
+        )
+
+
+def fechas_de_reserva(fecha_evento):
+    """Jornadas que puede tocar una reserva: la suya, la siguiente (eventos
+    que pasan de medianoche) y la anterior (decoración antes de las 08:30)."""
+    if not fecha_evento:
+        return set()
+    if isinstance(fecha_evento, str):
+        fecha_evento = date.fromisoformat(fecha_evento)
+    return {fecha_evento + timedelta(days=i) for i in (-1, 0, 1)}
+
+
+def fechas_de_bloqueo(fecha_inicio, fecha_fin):
+    if not fecha_inicio:
+        return set()
+    inicio, fin = _normalizar_bloqueo(fecha_inicio, fecha_fin)
+    return {inicio + timedelta(days=i) for i in range((fin - inicio).days + 1)}
+
+
+def salon_de_configuracion(configuracion_id):
+    if not configuracion_id:
+        return None
+    return ConfiguracionSalon.objects.filter(pk=configuracion_id).values_list('salon_id', flat=True).first()
+
+
+def reconstruir_todo(desde=None, stdout=None):
+    """Regenera la tabla completa (o desde una fecha) a partir de Reserva y BloqueoEspacio.
+
+    Devuelve el número de filas escritas.
+    """
+    borrar = OcupacionDiaria.objects.all()
+    if desde:
+        borrar = borrar.filter(fecha__gte=desde)
+    borrar.delete()
+
+    reservas = Reserva.objects.filter(estado__in=ESTADOS_OCUPAN)
+    bloqueos = BloqueoEspacio.objects.filter(activo=True)
+    if desde:
+        reservas = reservas.filter(fecha_evento__gte=desde - timedelta(days=1))
+        bloqueos = bloqueos.filter(Q(fecha_fin__gte=desde) | Q(fecha_inicio__gte=desde))
+
+    por_salon_reservas = {}
+    for row in reservas.values_list('configuracion_salon__salon_id', 'id', 'fecha_evento',
+                                    'hora_inicio', 'duracion', 'tiempo_decoracion').iterator():
+        por_salon_reservas.setdefault(row[0], []).append(row[1:])
+    por_salon_bloqueos = {}
+    for salon_id, *fila in bloqueos.values_list('salon_id', *CAMPOS_BLOQUEO):
+        por_salon_bloqueos.setdefault(salon_id, []).append(_bloqueo(*fila))
+
+    total = 0
+    for salon_id in set(por_salon_reservas) | set(por_salon_bloqueos):
+        res = por_salon_reservas.get(salon_id, [])
+        bloq = por_salon_bloqueos.get(salon_id, [])
+        fechas = set()
+        for _pk, f, _h, _d, _dec in res:
+            fechas |= fechas_de_reserva(f)
+        for fi, ff, *_ in bloq:
+            fechas |= fechas_de_bloqueo(fi, ff)
+        if desde:
+            fechas = {f for f in fechas if f >= desde}
+        filas = _filas_para(salon_id, fechas, res, bloq)
+        OcupacionDiaria.objects.bulk_create(filas, batch_size=500)
+        total += len(filas)
+        if stdout is not None:
+            stdout.write(f"Salón {salon_id}: {len(filas)} día(s) con ocupación")
+    return total
+
+
+def ocupacion_rango(desde, hasta, salon_id=None):
+    """Filas precalculadas entre dos fechas como dict {(salon_id, fecha): fila}."""
+    qs = OcupacionDiaria.objects.filter(fecha__range=(desde, hasta))
+    if salon_id:
+        qs = qs.filter(salon_id=salon_id)
+    return {(o.salon_id, o.fecha): o for o in qs}
+
+
+def formatear_rangos(rangos):
+    """[[1320, 1560, id], ...] -> [{'inicio': '22:00', 'fin': '02:00'}, ...]"""
+    def hhmm(minutos):
+        minutos %= MINUTOS_DIA
+        return f"{minutos // 60:02d}:{minutos % 60:02d}"
+    return [{'inicio': hhmm(r[0]), 'fin': hhmm(r[1])} for r in rangos]
+
+
+# Códigos compactos de disponibilidad por día para la grilla de `availability_range`
+LIBRE = 'L'
+PARCIAL = 'P'
+OCUPADO = 'O'
+BLOQUEADO = 'B'
+CERRADO = 'C'
+
+LEYENDA = {
+    LIBRE: 'libre',
+    PARCIAL: 'parcialmente reservado',
+    OCUPADO: 'sin horario libre de 4 horas',
+    BLOQUEADO: 'bloqueado',
+    CERRADO: 'cerrado (lunes)',
+}
+
+# Duración mínima de una reserva (4H): si no cabe, el día se marca OCUPADO
+MINUTOS_RESERVA_MINIMA = 4 * 60
+
+
+def hueco_maximo(rangos):
+    """Mayor intervalo libre (minutos) dentro de la jornada dados los rangos ocupados."""
+    mayor = 0
+    cursor = JORNADA_INICIO
+    for inicio, fin, *_ in sorted(rangos, key=lambda r: (r[0], r[1])):
+        if inicio > cursor:
+            mayor = max(mayor, inicio - cursor)
+        cursor = max(cursor, fin)
+    return max(mayor, JORNADA_FIN - cursor)
+
+
+def estado_dia(fecha, fila, apartados=()):
+    """Código de disponibilidad de un salón en `fecha` a partir de su fila (o None).
+
+    `apartados`: rangos de `holds.apartados_rango` que también ocupan el día.
+    """
+    if fecha.weekday() == 0:
+        return CERRADO
+    if fila is not None and fila.bloqueado:
+        return BLOQUEADO
+    rangos = (list(fila.rangos) if fila is not None else []) + list(apartados)
+    if not rangos:
+        return LIBRE
+    if hueco_maximo(rangos) < MINUTOS_RESERVA_MINIMA:
+        return OCUPADO
+    return PARCIAL
+
+
+def bloqueos_de_filas(filas):
+    """Agrupa días bloqueados consecutivos (mismo salón y motivo) en rangos.
+
+    Incluye los días con un bloqueo de algunas horas (`dia_completo` False).
+    """
+    rangos = []
+    con_bloqueo = (f for f in filas if f.bloqueado or f.motivo_bloqueo)
+    for fila in sorted(con_bloqueo, key=lambda f: (f.salon_id, f.fecha)):
+        ultimo = rangos[-1] if rangos else None
+        if (ultimo and ultimo['salon_id'] == fila.salon_id
+                and ultimo['motivo'] == fila.motivo_bloqueo
+                and ultimo['descripcion'] == fila.descripcion_bloqueo
+                and ultimo['dia_completo'] == fila.bloqueado
+                and ultimo['_fin'] + timedelta(days=1) == fila.fecha):
+            ultimo['_fin'] = fila.fecha
+            continue
+        rangos.append({
+            'salon_id': fila.salon_id,
+            '_inicio': fila.fecha,
+            '_fin': fila.fecha,
+            'motivo': fila.motivo_bloqueo,
+            'descripcion': fila.descripcion_bloqueo,
+            'dia_completo': fila.bloqueado,
+        })
+    for r in rangos:
+        r['fecha_inicio'] = r.pop('_inicio').strftime('%Y-%m-%d')
+        r['fecha_fin'] = r.pop('_fin').strftime('%Y-%m-%d')
+    return rangos
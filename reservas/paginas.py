@@ -0,0 +1,206 @@
+"""
+Caché de respuesta completa para las páginas institucionales.
+
+Las rutas de `clubelmeta/urls.py` servidas con `TemplateView` (políticas,
+visión, deportes, gastronomía...) no dependen de la base: para un
+visitante anónimo el HTML solo cambia con un despliegue. `PaginaCacheMiddleware`
+guarda la primera respuesta 200 de cada ruta con el cuerpo tal cual y sus
+variantes gzip y brotli ya comprimidas, y a partir de ahí responde desde la
+caché eligiendo la codificación según `Accept-Encoding` (sin volver a
+renderizar ni comprimir).
+
+La clave incluye la huella de las plantillas (`condicional.huella_plantillas`),
+así que un despliegue que cambie cualquier plantilla deja las entradas
+viejas huérfanas. El comando `precalentar_paginas` llena la caché al
+arrancar.
+
+brotli es opcional: si el paquete no está instalado solo se guardan las
+variantes identidad y gzip.
+"""
+import gzip
+import hashlib
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.urls import Resolver404, get_resolver, resolve
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.views.generic import TemplateView
+
+from .condicional import huella_plantillas
+
+try:
+    import brotli
+except ImportError:  # opcional: sin brotli se sirve gzip
+    brotli = None
+
+
+logger = logging.getLogger(__name__)
+
+# El HTML solo cambia con un despliegue (la huella va en la clave)
+TIMEOUT_PAGINAS = 24 * 60 * 60
+
+# La primera visita (fallo de caché) comprime dentro del request: brotli
+# con calidad 11 es decenas de veces más lento que con 5, que ya comprime
+# mejor que gzip -9
+CALIDAD_BROTLI = 5
+
+# Cabeceras que se recalculan en cada respuesta servida desde la caché
+_CABECERAS_PROPIAS = {'content-length', 'content-encoding', 'etag', 'vary'}
+
+# Rutas cacheables, por proceso
+_rutas = None
+
+
+def _es_template_view(callback):
+    vista = getattr(callback, 'view_class', None)
+    return vista is not None and issubclass(vista, TemplateView)
+
+
+def rutas():
+    """Rutas de nivel superior servidas por una `TemplateView` sin parámetros.
+
+    Se comprueba con `resolve()` que la ruta llegue de verdad a esa vista
+    (p.ej. '/politicas/' la atiende antes `reservas.urls`).
+    """
+    global _rutas
+    if _rutas is None:
+        encontradas = set()
+        for patron in get_resolver().url_patterns:
+            callback = getattr(patron, 'callback', None)
+            if callback is None or not _es_template_view(callback):
+                continue
+            ruta = '/' + str(patron.pattern)
+            if '<' in ruta or '^' in ruta:
+                continue
+            try:
+                if _es_template_view(resolve(ruta).func):
+                    encontradas.add(ruta)
+            except Resolver404:
+                continue
+        _rutas = frozenset(encontradas)
+    return _rutas
+
+
+def clave(path):
+    return f'pagina:{huella_plantillas()[0]}:{path}'
+
+
+def _comprimir(cuerpo):
+    variantes = {'gzip': gzip.compress(cuerpo, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variantes['br'] = brotli.compress(cuerpo, mode=brotli.MODE_TEXT, quality=CALIDAD_BROTLI)
+    return variantes
+
+
+def guardar(path, response):
+    """Guarda la respuesta si es un HTML 200 sin cookies; devuelve la entrada o None."""
+    if (
+        response.status_code != 200
+        or response.streaming
+        or response.cookies
+        or response.has_header('Content-Encoding')
+        or not response.get('Content-Type', '').startswith('text/html')
+    ):
+        return None
+    cuerpo = response.content
+    entrada = {
+        'cabeceras': [(k, v) for k, v in response.items() if k.lower() not in _CABECERAS_PROPIAS],
+        'vary': response.get('Vary', ''),
+        'etag': hashlib.sha1(cuerpo).hexdigest(),
+        'cuerpos': {'identity': cuerpo, **_comprimir(cuerpo)},
+    }
+    try:
+        cache.set(clave(path), entrada, TIMEOUT_PAGINAS)
+    except Exception:
+        logger.exception('No se pudo guardar la página %s en la caché', path)
+    return entrada
+
+
+def _aceptadas(accept_encoding):
+    """{codificación: q} de la cabecera Accept-Encoding."""
+    aceptadas = {}
+    for parte in accept_encoding.split(','):
+        nombre, _, params = parte.strip().partition(';')
+        nombre = nombre.strip().lower()
+        if not nombre:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        aceptadas[nombre] = q
+    return aceptadas
+
+
+def negociar(accept_encoding, disponibles):
+    """Mejor codificación disponible para el cliente: 'br', 'gzip' o 'identity'."""
+    aceptadas = _aceptadas(accept_encoding or '')
+    comodin = aceptadas.get('*')
+    for codificacion in ('br', 'gzip'):
+        if codificacion not in disponibles:
+            continue
+        q = aceptadas.get(codificacion, comodin)
+        if q:
+            return codificacion
+    return 'identity'
+
+
+def responder(request, entrada):
+    """Respuesta desde una entrada de la caché con la codificación negociada."""
+    codificacion = negociar(request.META.get('HTTP_ACCEPT_ENCODING', ''), entrada['cuerpos'])
+    cuerpo = entrada['cuerpos'][codificacion]
+    response = HttpResponse(cuerpo)
+    for k, v in entrada['cabeceras']:
+        response[k] = v
+    if entrada['vary']:
+        response['Vary'] = entrada['vary']
+    patch_vary_headers(response, ('Accept-Encoding',))
+    sufijo = '' if codificacion == 'identity' else f'-{codificacion}'
+    response['ETag'] = f'"{entrada["etag"]}{sufijo}"'
+    if codificacion != 'identity':
+        response['Content-Encoding'] = codificacion
+    response['Content-Length'] = str(len(cuerpo))
+    return get_conditional_response(request, etag=response['ETag'], response=response)
+
+
+class PaginaCacheMiddleware:
+    """Sirve las páginas `TemplateView` a visitantes anónimos desde la caché.
+
+    Va justo después de WhiteNoise: en un acierto no corren sesiones, CSRF
+    ni la vista. Solo GET sin query string y sin cookie de sesión ni de
+    mensajes: aquí todavía no hay `request.user` y la plantilla base cambia
+    para usuarios con sesión (enlaces de staff/login).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def _aplica(self, request):
+        return (
+            request.method == 'GET'
+            and not request.META.get('QUERY_STRING')
+            and request.path_info in rutas()
+            and settings.SESSION_COOKIE_NAME not in request.COOKIES
+            and 'messages' not in request.COOKIES
+        )
+
+    def __call__(self, request):
+        if not self._aplica(request):
+            return self.get_response(request)
+        try:
+            entrada = cache.get(clave(request.path_info))
+        except Exception:
+            logger.exception('Error leyendo la página %s de la caché', request.path_info)
+            entrada = None
+        if entrada is not None:
+            return responder(request, entrada)
+        response = self.get_response(request)
+        entrada = guardar(request.path_info, response)
+        if entrada is None:
+            return response
+        return responder(request, entrada)
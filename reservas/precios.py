@@ -0,0 +1,142 @@
+"""
+Motor de precios (`PriceQuote`) compartido por `Reserva.calcular_precio_base`,
+`register`, `reserva_manual` y la API `/quote/`.
+
+Mantiene precalculada la matriz (configuración × tipo de cliente × duración)
+y los precios unitarios de los servicios adicionales activos. La matriz se
+guarda en la caché de Django bajo la generación 'precios' de
+`reservas.cache` y cada proceso conserva su copia hasta que la generación
+cambia: las señales de `ConfiguracionSalon`/`ServicioAdicional` y las
+acciones masivas de precios del admin la incrementan.
+"""
+from decimal import Decimal
+
+from .cache import generacion, incrementar_generacion, obtener_o_calcular
+
+
+TIPOS_CLIENTE = ('SOCIO', 'PARTICULAR')
+DURACIONES = ('4H', '8H')
+
+
+def precio_configuracion(config, tipo_cliente, duracion):
+    """Precio del salón según el tipo de cliente y la duración (sin servicios).
+
+    Si la configuración no tiene precio de 8 horas se cobra el de 4 horas.
+    """
+    if tipo_cliente == 'SOCIO':
+        if duracion == '4H':
+            return config.precio_socio_4h
+        return config.precio_socio_8h or config.precio_socio_4h
+    # PARTICULAR
+    if duracion == '4H':
+        return config.precio_particular_4h
+    return config.precio_particular_8h or config.precio_particular_4h
+
+
+class PriceQuote:
+    """Matriz de precios precalculada y cotización de una reserva."""
+
+    def __init__(self, matriz, servicios):
+        # {(config_id, tipo_cliente, duracion): Decimal}
+        self.matriz = matriz
+        # {servicio_id: (nombre, precio_unitario)} solo servicios activos
+        self.servicios = servicios
+
+    @classmethod
+    def construir(cls):
+        """Lee precios de la base: una consulta por tabla."""
+        from .models import ConfiguracionSalon, ServicioAdicional
+
+        matriz = {}
+        configs = ConfiguracionSalon.objects.only(
+            'id', 'precio_socio_4h', 'precio_socio_8h', 'precio_particular_4h', 'precio_particular_8h',
+        ).order_by()
+        for c in configs:
+            for tipo in TIPOS_CLIENTE:
+                for duracion in DURACIONES:
+                    matriz[(c.id, tipo, duracion)] = precio_configuracion(c, tipo, duracion)
+        servicios = {
+            s_id: (nombre, precio)
+            for s_id, nombre, precio in ServicioAdicional.objects.filter(activo=True)
+            .values_list('id', 'nombre', 'precio_unitario').order_by()
+        }
+        return cls(matriz, servicios)
+
+    def precio_base(self, config_id, tipo_cliente, duracion):
+        """Precio del salón o None si la configuración no existe."""
+        return self.matriz.get((config_id, tipo_cliente, duracion))
+
+    def precio_servicio(self, servicio_id):
+        """Precio unitario del servicio o None si no existe o está inactivo."""
+        servicio = self.servicios.get(servicio_id)
+        return servicio[1] if servicio else None
+
+    def cotizar(self, config_id, tipo_cliente, duracion, servicios=None):
+        """Desglose del precio de una reserva.
+
+        `servicios` es {servicio_id: cantidad}; los inactivos o desconocidos
+        se ignoran. Devuelve None si la configuración no existe.
+        """
+        base = self.precio_base(config_id, tipo_cliente, duracion)
+        if base is None:
+            return None
+        lineas = []
+        for servicio_id, cantidad in (servicios or {}).items():
+            servicio = self.servicios.get(servicio_id)
+            if servicio is None or cantidad <= 0:
+                continue
+            nombre, precio = servicio
+            lineas.append({
+                'id': servicio_id,
+                'nombre': nombre,
+                'cantidad': cantidad,
+                'precio_unitario': precio,
+                'subtotal': precio * cantidad,
+            })
+        servicios_total = sum((l['subtotal'] for l in lineas), Decimal('0'))
+        return {
+            'configuracion_id': config_id,
+            'tipo_cliente': tipo_cliente,
+            'duracion': duracion,
+            'precio_base': base,
+            'servicios': lineas,
+            'servicios_total': servicios_total,
+            'total': base + servicios_total,
+        }
+
+
+# (generación, PriceQuote) por proceso
+_motor = None
+
+
+def motor():
+    """`PriceQuote` vigente; se reconstruye solo cuando cambia la generación 'precios'."""
+    global _motor
+    gen = generacion('precios')
+    if _motor is None or _motor[0] != gen:
+        datos, _ = obtener_o_calcular('precios', ['matriz'], lambda: _a_tupla(PriceQuote.construir()))
+        _motor = (gen, PriceQuote(*datos))
+    return _motor[1]
+
+
+def cotizar(config_id, tipo_cliente, duracion, servicios=None):
+    """Cotiza con el motor vigente.
+
+    Si la configuración no está en la matriz (creada en otro proceso antes de
+    que llegue la invalidación) se reconstruye una vez. Devuelve None si la
+    configuración no existe.
+    """
+    cotizacion = motor().cotizar(config_id, tipo_cliente, duracion, servicios)
+    if cotizacion is None:
+        invalidar()
+        cotizacion = motor().cotizar(config_id, tipo_cliente, duracion, servicios)
+    return cotizacion
+
+
+def _a_tupla(quote):
+    return quote.matriz, quote.servicios
+
+
+def invalidar():
+    """Descarta la matriz en todos los procesos (p.ej. tras un `queryset.update`)."""
+    incrementar_generacion('precios')
@@ -1,35 +1,11 @@
 from django.db.models.signals import post_save, pre_save
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
 from django.conf import settings
 from reservas.email_async import send_email_async
 from django.db import transaction
+import logging
 import traceback
 
-
-def _render_message(subject, template_txt, template_html, context):
-    """Render templates and return (text_content, html_content)."""
-    text_content = ''
-    html_content = None
-    try:
-        text_content = render_to_string(template_txt, context)
-    except Exception:
-        text_content = ''
-    try:
-        html_content = render_to_string(template_html, context)
-    except Exception:
-        html_content = None
-
-    if not text_content and html_content:
-        try:
-            text_content = strip_tags(html_content).strip()
-        except Exception:
-            text_content = ''
-
-    if not text_content:
-        text_content = subject
-
-    return text_content, html_content
+logger = logging.getLogger(__name__)
 
 
 def _save_email_log(reserva, to_email, subject, body_text, body_html, success, error):
@@ -51,17 +27,187 @@ def _save_email_log(reserva, to_email, subject, body_text, body_html, success, e
 
 
 def reserva_pre_save(sender, instance, **kwargs):
-    """Guardar el estado previo antes de guardar la reserva para detectar transiciones."""
+    """Guardar el estado previo antes de guardar la reserva para detectar transiciones.
+
+    Usa los valores originales que Reserva recuerda al cargarse (`from_db`);
+    solo consulta la BD si la instancia se construyó a mano con un pk.
+    """
+    instance._old_estado = None
+    instance._old_ocupacion = None
+    if not instance.pk or instance._state.adding:
+        return
+    if instance.campos_modificados() is not None:
+        instance._old_estado = instance.valor_original('estado')
+        instance._old_ocupacion = (instance.valor_original('configuracion_salon'),
+                                   instance.valor_original('fecha_evento'))
+        return
+    try:
+        old = sender.objects.filter(pk=instance.pk).values_list(
+            'estado', 'configuracion_salon_id', 'fecha_evento').first()
+        if old:
+            instance._old_estado = old[0]
+            instance._old_ocupacion = (old[1], old[2])
+    except Exception:
+        pass
+
+
+def _sin_cambios_de_ocupacion(sender, update_fields):
+    """True si un guardado parcial no tocó ningún campo que afecte la ocupación."""
+    campos = getattr(sender, 'CAMPOS_OCUPACION', None)
+    return campos is not None and update_fields is not None and not (set(update_fields) & campos)
+
+
+def _recalcular_ocupacion(afectados):
+    """Recalcula OcupacionDiaria para {salon_id: fechas} al confirmar la transacción.
+
+    Se difiere con on_commit para que los borrados en cascada (p.ej. un salón
+    con sus reservas y bloqueos) terminen antes de recalcular. Nunca rompe el guardado.
+    """
+    from . import ocupacion
+
+    def _run():
+        for salon_id, fechas in afectados.items():
+            try:
+                ocupacion.recalcular(salon_id, fechas)
+            except Exception:
+                logger.exception('Error recalculando ocupación del salón %s', salon_id)
+
+    transaction.on_commit(_run)
+
+
+def reserva_ocupacion_changed(sender, instance, **kwargs):
+    """post_save/post_delete de Reserva: actualizar la ocupación de las fechas tocadas."""
+    from . import ocupacion
+    if _sin_cambios_de_ocupacion(sender, kwargs.get('update_fields')):
+        return
+    afectados = {}
+    try:
+        salon_id = instance.configuracion_salon.salon_id
+        afectados.setdefault(salon_id, set()).update(ocupacion.fechas_de_reserva(instance.fecha_evento))
+        old = getattr(instance, '_old_ocupacion', None)
+        if old and old[1]:
+            old_salon_id = salon_id if old[0] == instance.configuracion_salon_id else ocupacion.salon_de_configuracion(old[0])
+            afectados.setdefault(old_salon_id, set()).update(ocupacion.fechas_de_reserva(old[1]))
+    except Exception:
+        logger.exception('Error calculando fechas afectadas por la reserva %s', getattr(instance, 'pk', None))
+        return
+    _recalcular_ocupacion(afectados)
+
+
+def bloqueo_pre_save(sender, instance, **kwargs):
+    """Guardar salón y fechas previas del bloqueo para recalcular también el rango anterior."""
+    instance._old_ocupacion = None
     if instance.pk:
+        instance._old_ocupacion = (
+            sender.objects.filter(pk=instance.pk)
+            .values_list('salon_id', 'fecha_inicio', 'fecha_fin')
+            .first()
+        )
+
+
+def bloqueo_ocupacion_changed(sender, instance, **kwargs):
+    """post_save/post_delete de BloqueoEspacio: actualizar la ocupación del rango."""
+    from . import ocupacion
+    afectados = {instance.salon_id: ocupacion.fechas_de_bloqueo(instance.fecha_inicio, instance.fecha_fin)}
+    old = getattr(instance, '_old_ocupacion', None)
+    if old:
+        afectados.setdefault(old[0], set()).update(ocupacion.fechas_de_bloqueo(old[1], old[2]))
+    _recalcular_ocupacion(afectados)
+
+
+def invalidar_disponibilidad(sender, instance, **kwargs):
+    """post_save/post_delete de Reserva, BloqueoEspacio, Salon y ConfiguracionSalon:
+    incrementar la generación de la caché de disponibilidad al confirmar."""
+    from .cache import incrementar_generacion
+    if _sin_cambios_de_ocupacion(sender, kwargs.get('update_fields')):
+        return
+
+    def _run():
+        try:
+            incrementar_generacion('disponibilidad')
+        except Exception:
+            logger.exception('Error invalidando la caché de disponibilidad')
+
+    transaction.on_commit(_run)
+
+
+def invalidar_catalogo(sender, instance, **kwargs):
+    """post_save/post_delete de Salon, ConfiguracionSalon y ServicioAdicional:
+    invalidar el catálogo de espacios (`reservas.catalogo` y el índice de
+    capacidad de `reservas.sugerencias`)."""
+    from .cache import incrementar_generacion
+
+    def _run():
         try:
-            old = sender.objects.get(pk=instance.pk)
-            instance._old_estado = old.estado
+            incrementar_generacion('catalogo')
         except Exception:
-            instance._old_estado = None
+            logger.exception('Error invalidando la caché del catálogo')
+
+    # Como con los precios: ya dentro de la transacción y otra vez al confirmar
+    _run()
+    transaction.on_commit(_run)
+
+
+def invalidar_precios(sender, instance, **kwargs):
+    """post_save/post_delete de ConfiguracionSalon y ServicioAdicional:
+    invalidar la matriz de `reservas.precios`.
+
+    Se incrementa de inmediato (para que el resto de la transacción ya cotice
+    con el precio nuevo) y otra vez al confirmar, por si otro proceso
+    reconstruyó la matriz con los datos anteriores mientras tanto.
+    """
+    from .cache import incrementar_generacion
+
+    def _run():
+        try:
+            incrementar_generacion('precios')
+        except Exception:
+            logger.exception('Error invalidando la caché de precios')
+
+    _run()
+    transaction.on_commit(_run)
+
+
+def invalidar_socios(sender, instance, **kwargs):
+    """post_save/post_delete de CodigoSocio: recargar el índice de `reservas.socios`."""
+    from .cache import incrementar_generacion
+
+    def _run():
+        try:
+            incrementar_generacion('socios')
+        except Exception:
+            logger.exception('Error invalidando el índice de socios')
+
+    # Igual que con los precios: ya dentro de la transacción y otra vez al confirmar
+    _run()
+    transaction.on_commit(_run)
+
+
+def marcar_cambio_datos(sender, instance, **kwargs):
+    """post_save/post_delete de los modelos públicos: nueva generación del grupo
+    `datos:<modelo>` para los ETag de `reservas.condicional`."""
+    from .cache import incrementar_generacion
+    from .condicional import grupo_modelo
+
+    def _run():
+        try:
+            incrementar_generacion(grupo_modelo(sender))
+        except Exception:
+            logger.exception('Error marcando el cambio de %s', sender.__name__)
+
+    # Ya dentro de la transacción y otra vez al confirmar (un ETag calculado
+    # entre ambos momentos quedaría ligado a datos sin confirmar)
+    _run()
+    transaction.on_commit(_run)
 
 
 def reserva_post_save(sender, instance, created, **kwargs):
-    """Enviar correos cuando se crea una reserva o cuando cambia a CONFIRMADA."""
+    """Enviar correos cuando se crea una reserva o cuando cambia a CONFIRMADA.
+
+    Los correos se encolan en la bandeja de salida dentro de la misma
+    transacción que la reserva y el worker de la bandeja los renderiza una
+    sola vez al enviarlos (ver `reservas.bandeja_salida` y `reservas.correos`).
+    """
 
     # ===== COMPORTAMIENTO AL CREAR =====
     if created:
@@ -80,96 +226,49 @@ def reserva_post_save(sender, instance, created, **kwargs):
 
         # ----- 1. ENVIO AL CLIENTE -----
         if instance.email_cliente:
-            subject = f"Confirmación de Reserva #{instance.id} - {instance.configuracion_salon.salon.nombre}"
-            txt, html = _render_message(subject,
-                                        'reservas/emails/reserva_cliente.txt',
-                                        'reservas/emails/reserva_cliente.html',
-                                        context)
-            # Dispatch send AFTER the DB transaction commits to avoid rollbacks
             try:
-                transaction.on_commit(lambda: send_email_async(
+                subject = f"Confirmación de Reserva #{instance.id} - {instance.configuracion_salon.salon.nombre}"
+                send_email_async(
                     subject,
                     'reservas/emails/reserva_cliente.txt',
                     'reservas/emails/reserva_cliente.html',
                     context,
                     [instance.email_cliente]
-                ))
+                )
             except Exception:
-                # swallow — on_commit may not be available in some contexts but it's best-effort
-                try:
-                    send_email_async(
-                        subject,
-                        'reservas/emails/reserva_cliente.txt',
-                        'reservas/emails/reserva_cliente.html',
-                        context,
-                        [instance.email_cliente]
-                    )
-                except Exception:
-                    pass
+                logger.exception('Error encolando el correo al cliente de la reserva %s', instance.pk)
 
         # ----- 2. SI ES SOCIO -> NOTIFICAR -----
         if instance.tipo_cliente == 'SOCIO':
             try:
-                from .models import Socio
-                socio = Socio.objects.filter(email__iexact=instance.email_cliente).first()
+                from .models import CodigoSocio
+                socio = CodigoSocio.objects.filter(email__iexact=instance.email_cliente, activo=True).first()
                 if socio and socio.email:
-                    subject = f"Notificación de Reserva Socio #{instance.id} - {socio.nombre}"
-                    txt, html = _render_message(subject,
-                                                'reservas/emails/reserva_socio.txt',
-                                                'reservas/emails/reserva_socio.html',
-                                                {**context, 'socio': socio})
-                    try:
-                        transaction.on_commit(lambda: send_email_async(
-                            subject,
-                            'reservas/emails/reserva_socio.txt',
-                            'reservas/emails/reserva_socio.html',
-                            {**context, 'socio': socio},
-                            [socio.email]
-                        ))
-                    except Exception:
-                        try:
-                            send_email_async(
-                                subject,
-                                'reservas/emails/reserva_socio.txt',
-                                'reservas/emails/reserva_socio.html',
-                                {**context, 'socio': socio},
-                                [socio.email]
-                            )
-                        except Exception:
-                            pass
+                    subject = f"Notificación de Reserva Socio #{instance.id} - {socio.nombre_socio}"
+                    send_email_async(
+                        subject,
+                        'reservas/emails/reserva_socio.txt',
+                        'reservas/emails/reserva_socio.html',
+                        {**context, 'socio': socio},
+                        [socio.email]
+                    )
             except Exception:
-                pass
+                logger.exception('Error encolando el correo al socio de la reserva %s', instance.pk)
 
         # ----- 3. COPIA AL ADMIN -----
         admin_email = getattr(settings, 'ADMIN_EMAIL', None)
         if admin_email:
             try:
                 subject = f"Nueva Reserva #{instance.id} - {instance.configuracion_salon.salon.nombre}"
-                txt, html = _render_message(subject,
-                                            'reservas/emails/reserva_admin.txt',
-                                            'reservas/emails/reserva_admin.html',
-                                            {**context, 'admin': True})
-                try:
-                    transaction.on_commit(lambda: send_email_async(
-                        subject,
-                        'reservas/emails/reserva_admin.txt',
-                        'reservas/emails/reserva_admin.html',
-                        {**context, 'admin': True},
-                        [admin_email]
-                    ))
-                except Exception:
-                    try:
-                        send_email_async(
-                            subject,
-                            'reservas/emails/reserva_admin.txt',
-                            'reservas/emails/reserva_admin.html',
-                            {**context, 'admin': True},
-                            [admin_email]
-                        )
-                    except Exception:
-                        pass
+                send_email_async(
+                    subject,
+                    'reservas/emails/reserva_admin.txt',
+                    'reservas/emails/reserva_admin.html',
+                    {**context, 'admin': True},
+                    [admin_email]
+                )
             except Exception:
-                pass
+                logger.exception('Error encolando la copia al admin de la reserva %s', instance.pk)
 
         return
 
@@ -185,50 +284,15 @@ def reserva_post_save(sender, instance, created, **kwargs):
         }
 
         try:
-            txt, html = _render_message(subject,
-                                        'reservas/emails/reserva_confirmada.txt',
-                                        'reservas/emails/reserva_confirmada.html',
-                                        context)
-            try:
-                transaction.on_commit(lambda: send_email_async(
-                    subject,
-                    'reservas/emails/reserva_confirmada.txt',
-                    'reservas/emails/reserva_confirmada.html',
-                    context,
-                    [instance.email_cliente]
-                ))
-            except Exception:
-                try:
-                    send_email_async(
-                        subject,
-                        'reservas/emails/reserva_confirmada.txt',
-                        'reservas/emails/reserva_confirmada.html',
-                        context,
-                        [instance.email_cliente]
-                    )
-                except Exception:
-                    pass
+            send_email_async(
+                subject,
+                'reservas/emails/reserva_confirmada.txt',
+                'reservas/emails/reserva_confirmada.html',
+                context,
+                [instance.email_cliente]
+            )
         except Exception:
-            # If rendering fails, still attempt send (it will use subject as text body in async helper)
-            try:
-                transaction.on_commit(lambda: send_email_async(
-                    subject,
-                    'reservas/emails/reserva_confirmada.txt',
-                    'reservas/emails/reserva_confirmada.html',
-                    context,
-                    [instance.email_cliente]
-                ))
-            except Exception:
-                try:
-                    send_email_async(
-                        subject,
-                        'reservas/emails/reserva_confirmada.txt',
-                        'reservas/emails/reserva_confirmada.html',
-                        context,
-                        [instance.email_cliente]
-                    )
-                except Exception:
-                    pass
+            logger.exception('Error encolando la confirmación de la reserva %s', instance.pk)
 
 
 # La conexión a post_save se realiza en apps.ReservasConfig.ready()
@@ -0,0 +1,73 @@
+"""
+Índice en memoria de los códigos de socio activos (`CodigoSocio`).
+
+`validate_socio_code` se llama en cada pausa del teclado del formulario de
+`register` y `register` valida el código al procesar el POST. Cada proceso
+carga una vez los códigos activos con los datos de autocompletado y los
+reutiliza mientras no cambie la generación 'socios' de `reservas.cache`
+(la incrementan las señales de `CodigoSocio`). La generación se revisa con
+`generacion_local`, como mucho cada `REVISION_LOCAL` segundos: en régimen
+estable una consulta cuesta cero queries y un cambio hecho en otro proceso
+se ve a los pocos segundos.
+
+El índice guarda como máximo `MAX_CODIGOS` entradas; si hay más socios
+activos, los códigos que no entraron se consultan en la base.
+"""
+from .cache import generacion_local, incrementar_generacion
+
+
+MAX_CODIGOS = 20000
+
+CAMPOS_AUTOCOMPLETAR = ('nombre_socio', 'email', 'celular', 'empresa')
+
+# (generación, {codigo: (nombre_socio, email, celular, empresa)}, completo) por proceso
+_indice = None
+
+
+def _cargar():
+    from .models import CodigoSocio
+
+    filas = list(
+        CodigoSocio.objects.filter(activo=True)
+        .order_by('codigo')
+        .values_list('codigo', *CAMPOS_AUTOCOMPLETAR)[:MAX_CODIGOS + 1]
+    )
+    completo = len(filas) <= MAX_CODIGOS
+    return {fila[0]: fila[1:] for fila in filas[:MAX_CODIGOS]}, completo
+
+
+def indice():
+    """Códigos activos del proceso; se recarga solo cuando cambia la generación."""
+    global _indice
+    gen = generacion_local('socios')
+    if _indice is None or _indice[0] != gen:
+        codigos, completo = _cargar()
+        _indice = (gen, codigos, completo)
+    return _indice[1], _indice[2]
+
+
+def buscar(code):
+    """Datos de autocompletado del socio activo con ese código, o None."""
+    code = (code or '').strip()
+    if not code:
+        return None
+    codigos, completo = indice()
+    datos = codigos.get(code)
+    if datos is None and not completo:
+        from .models import CodigoSocio
+        datos = (
+            CodigoSocio.objects.filter(codigo=code, activo=True)
+            .values_list(*CAMPOS_AUTOCOMPLETAR).first()
+        )
+    if datos is None:
+        return None
+    return dict(zip(CAMPOS_AUTOCOMPLETAR, datos))
+
+
+def es_valido(code):
+    """¿Existe un socio activo con ese código?"""
+    return buscar(code) is not None
+
+
+def invalidar():
+    incrementar_generacion('socios')
@@ -0,0 +1,233 @@
+"""
+Cola en base de datos para las imágenes subidas desde el admin de salones.
+
+`SalonAdmin.save_model` subía cada archivo a Cloudinary dentro del request;
+con varias fotos se pasaba del timeout de gunicorn. Ahora:
+
+1. `encolar()` (en el request del admin) solo escribe los archivos en
+   static/img/salon_<slug>/ y crea una fila `SubidaImagen` PENDIENTE por
+   archivo.
+2. El comando `procesar_subidas` toma lotes de la cola (`procesar_lote()`),
+   sube a Cloudinary y genera las variantes AVIF/WebP en paralelo, y al
+   terminar agrega cada ruta al campo `imagen` del salón, así la imagen solo
+   aparece en el sitio cuando ya está en el CDN.
+
+El worker corre en el mismo host que el web (entrypoint.sh arranca los
+procesos del Procfile juntos): lee el archivo de static/img y deja las
+variantes al lado, donde el web las sirve. En varios hosts static/img
+tendría que ser un volumen compartido.
+
+No hace falta broker: los workers se reparten las filas con un UPDATE
+condicional (`estado='PENDIENTE'` → `PROCESANDO`), que funciona igual en
+SQLite y PostgreSQL. Las filas PROCESANDO de un worker caído vuelven a la
+cola pasado `ESPERA_PROCESANDO`.
+"""
+import logging
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import imagenes, variantes
+from .subidas_cloudinary import con_reintentos
+
+
+logger = logging.getLogger(__name__)
+
+MAX_INTENTOS = 3
+
+ESPERA_PROCESANDO = timedelta(minutes=15)
+
+LOTE = 10
+
+CONCURRENCIA = 4
+
+
+def carpeta_salon(salon):
+    """Carpeta bajo static/img de las imágenes subidas de un salón."""
+    from django.utils.text import slugify
+    # 'salon_<slug>' para evitar problemas con espacios
+    return f'salon_{slugify(salon.nombre)}' if salon.nombre else 'salon_sin_nombre'
+
+
+def encolar(salon, archivos):
+    """Guarda los archivos subidos en static/img y crea sus filas PENDIENTE.
+
+    Devuelve (subidas creadas, [(nombre, error)] de los que no se pudieron guardar).
+    """
+    from django.utils.text import get_valid_filename
+    from .models import SubidaImagen
+
+    carpeta = carpeta_salon(salon)
+    carpeta_local = imagenes.directorio_img() / carpeta
+    carpeta_local.mkdir(parents=True, exist_ok=True)
+
+    filas, errores = [], []
+    for f in archivos:
+        try:
+            safe_name = get_valid_filename(f.name)
+            local_path = carpeta_local / safe_name
+            # Si ya existe, agregar sufijo numerico para no sobreescribir
+            stem = local_path.stem
+            ext = local_path.suffix
+            counter = 1
+            while local_path.exists() and counter <= 100:
+                local_path = carpeta_local / f'{stem}_{counter}{ext}'
+                counter += 1
+            with open(local_path, 'wb') as outf:
+                for chunk in f.chunks():
+                    outf.write(chunk)
+            filas.append(SubidaImagen(
+                salon=salon,
+                archivo=f'{carpeta}/{local_path.name}',
+                nombre_original=f.name[:255],
+            ))
+        except Exception as e:
+            logger.exception('Error guardando %s', f.name)
+            errores.append((f.name, e))
+    return SubidaImagen.objects.bulk_create(filas), errores
+
+
+def reencolar_vencidas():
+    """Devuelve a la cola las subidas PROCESANDO de un worker que no terminó."""
+    from .models import SubidaImagen
+
+    limite = timezone.now() - ESPERA_PROCESANDO
+    return SubidaImagen.objects.filter(estado='PROCESANDO', iniciado__lt=limite).update(estado='PENDIENTE')
+
+
+def tomar(limite=LOTE):
+    """Reserva hasta `limite` subidas pendientes para este worker (las más antiguas)."""
+    from .models import SubidaImagen
+
+    tomadas = []
+    candidatas = SubidaImagen.objects.filter(estado='PENDIENTE').order_by('creado').values_list('pk', flat=True)
+    for pk in list(candidatas[:limite]):
+        # Si otro worker la tomó primero, el UPDATE no afecta filas
+        if SubidaImagen.objects.filter(pk=pk, estado='PENDIENTE').update(
+            estado='PROCESANDO', iniciado=timezone.now(), intentos=F('intentos') + 1,
+        ):
+            tomadas.append(pk)
+    return list(SubidaImagen.objects.filter(pk__in=tomadas).select_related('salon').order_by('creado'))
+
+
+def configurar_cloudinary():
+    """Configura el SDK con las env vars; False si faltan credenciales o la librería."""
+    from django.conf import settings
+
+    cloud_name = os.environ.get('CLOUDINARY_CLOUD_NAME') or getattr(settings, 'CLOUDINARY_CLOUD_NAME', '')
+    api_key = os.environ.get('CLOUDINARY_API_KEY', '')
+    api_secret = os.environ.get('CLOUDINARY_API_SECRET', '')
+    if not (cloud_name and api_key and api_secret):
+        return False
+    try:
+        import cloudinary
+    except ImportError:
+        return False
+    config = dict(cloud_name=cloud_name, api_key=api_key, api_secret=api_secret, secure=True)
+    if os.environ.get('CLOUDINARY_UPLOAD_PREFIX'):
+        config['upload_prefix'] = os.environ['CLOUDINARY_UPLOAD_PREFIX']
+    cloudinary.config(**config)
+    return True
+
+
+def _subir(ruta, public_id):
+    import cloudinary.uploader
+    return cloudinary.uploader.upload(
+        str(ruta),
+        public_id=public_id,
+        overwrite=True,
+        resource_type='image',
+        use_filename=False,
+        unique_filename=False,
+    )
+
+
+def _procesar(subida, cloudinary_listo, formatos):
+    """Sube y genera variantes de una subida (en un hilo). Devuelve (subida, entrada de variantes)."""
+    base = imagenes.directorio_img()
+    ruta = base / subida.archivo
+    if not ruta.is_file():
+        raise FileNotFoundError(f'No existe {ruta}')
+    if cloudinary_listo:
+        public_id = f'img/{os.path.splitext(subida.archivo)[0]}'
+        con_reintentos(lambda: _subir(ruta, public_id))
+    entrada = None
+    if formatos:
+        entrada = variantes.procesar(str(base), subida.archivo, variantes.hash_archivo(ruta), formatos=formatos)
+    return subida, entrada
+
+
+def _publicar(salon_id, rutas):
+    """Agrega las rutas al campo `imagen` del salón (sin pisar ediciones concurrentes)."""
+    from .models import Salon
+
+    with transaction.atomic():
+        salon = Salon.objects.select_for_update().get(pk=salon_id)
+        actuales = [p.strip() for p in (salon.imagen or '').split(',') if p.strip()]
+        nuevas = [r for r in rutas if r not in actuales]
+        if nuevas:
+            salon.imagen = ','.join(actuales + nuevas)
+            salon.save(update_fields=['imagen'])
+
+
+def procesar_lote(limite=LOTE, concurrencia=CONCURRENCIA):
+    """Procesa un lote de la cola. Devuelve un Counter con 'listas', 'reintentar', 'errores'."""
+    from .models import SubidaImagen
+
+    resumen = Counter()
+    subidas = tomar(limite)
+    if not subidas:
+        return resumen
+
+    cloudinary_listo = configurar_cloudinary()
+    formatos = tuple(variantes.formatos_disponibles())
+    resultados = []
+    with ThreadPoolExecutor(max_workers=max(1, concurrencia)) as pool:
+        futuros = [pool.submit(_procesar, s, cloudinary_listo, formatos) for s in subidas]
+        for subida, futuro in zip(subidas, futuros):
+            try:
+                resultados.append((subida, futuro.result(), None))
+            except Exception as exc:
+                logger.exception('Error procesando la subida %s', subida.archivo)
+                resultados.append((subida, None, exc))
+
+    # Manifiesto de variantes y estado de las filas desde este hilo
+    entradas = {s.archivo: r[1] for s, r, e in resultados if e is None and r[1] is not None}
+    if entradas:
+        variantes.registrar(entradas)
+
+    por_salon = {}
+    ahora = timezone.now()
+    for subida, resultado, error in resultados:
+        if error is None:
+            SubidaImagen.objects.filter(pk=subida.pk).update(
+                estado='LISTA', error='', terminado=ahora,
+                subida_cloudinary=cloudinary_listo,
+                variantes=len(resultado[1]['variantes']) if resultado[1] else 0,
+            )
+            por_salon.setdefault(subida.salon_id, []).append(subida.archivo)
+            resumen['listas'] += 1
+        else:
+            agotada = subida.intentos >= MAX_INTENTOS
+            SubidaImagen.objects.filter(pk=subida.pk).update(
+                estado='ERROR' if agotada else 'PENDIENTE', error=str(error)[:2000],
+                terminado=ahora if agotada else None,
+            )
+            resumen['errores' if agotada else 'reintentar'] += 1
+
+    for salon_id, rutas in por_salon.items():
+        _publicar(salon_id, rutas)
+    if por_salon:
+        # Incluir los archivos nuevos en el manifiesto de static/img
+        imagenes.refrescar()
+    return resumen
+
+
+def reintentar(queryset):
+    """Devuelve a la cola subidas en ERROR (acción del admin)."""
+    return queryset.filter(estado='ERROR').update(estado='PENDIENTE', intentos=0, error='', terminado=None)
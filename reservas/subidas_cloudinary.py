@@ -0,0 +1,172 @@
+"""
+Subida concurrente y reanudable de las imágenes de static/ a Cloudinary.
+
+Lo usa el comando `upload_static_to_cloudinary`. Las subidas en serie se
+cortaban a mitad de camino por el límite de tasa de Cloudinary (ver
+`_PENDING_CLOUDINARY_UPLOAD` en views). Aquí:
+
+- Las subidas van en un pool de hilos con concurrencia acotada.
+- Un 420/429 (`RateLimited`) se reintenta con espera exponencial y jitter.
+- Un archivo JSON de estado guarda, por public_id, el MD5 del contenido
+  subido. Se escribe tras cada subida, así una corrida interrumpida se
+  reanuda donde quedó y las siguientes solo envían lo que cambió.
+- Sin estado previo, el MD5 local se compara con el `etag` del recurso
+  remoto (Cloudinary lo calcula como MD5 del archivo): si coinciden no se
+  vuelve a subir.
+
+La lógica no depende del SDK: `sincronizar()` recibe las funciones que
+suben y consultan, y el comando las arma con `cloudinary` (apuntando a
+`upload_prefix`, que en pruebas puede ser un servidor HTTP local).
+"""
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+
+logger = logging.getLogger(__name__)
+
+CONCURRENCIA = 4
+
+REINTENTOS = 6
+
+ESPERA_BASE = 1.0
+
+ESPERA_MAX = 60.0
+
+Tarea = namedtuple('Tarea', ['ruta', 'public_id'])
+
+
+def md5_archivo(path):
+    h = hashlib.md5()
+    with open(path, 'rb') as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def es_limite_de_tasa(exc):
+    """¿La excepción es un 420/429 de Cloudinary?"""
+    try:
+        from cloudinary.exceptions import RateLimited
+        if isinstance(exc, RateLimited):
+            return True
+    except ImportError:
+        pass
+    # Respuestas sin JSON llegan como `Error` con el código en el mensaje
+    return bool(re.search(r'\b(420|429)\b', str(exc)))
+
+
+def con_reintentos(funcion, reintentos=REINTENTOS, espera_base=ESPERA_BASE,
+                   espera_max=ESPERA_MAX, dormir=time.sleep):
+    """Ejecuta `funcion()` reintentando con espera exponencial ante límite de tasa."""
+    intento = 0
+    while True:
+        try:
+            return funcion()
+        except Exception as exc:
+            if not es_limite_de_tasa(exc) or intento >= reintentos:
+                raise
+            espera = min(espera_max, espera_base * (2 ** intento)) * (0.5 + random.random() / 2)
+            logger.warning('Límite de tasa de Cloudinary; reintento %d en %.1fs', intento + 1, espera)
+            dormir(espera)
+            intento += 1
+
+
+class EstadoSubidas:
+    """Archivo JSON {public_id: {'md5', 'ruta', 'version'}} de lo ya subido.
+
+    Seguro entre hilos; cada `registrar` reescribe el archivo de forma
+    atómica (temporal + rename).
+    """
+
+    def __init__(self, ruta):
+        self.ruta = Path(ruta)
+        self._lock = threading.Lock()
+        try:
+            self._datos = json.loads(self.ruta.read_text(encoding='utf-8'))
+            if not isinstance(self._datos, dict):
+                self._datos = {}
+        except (OSError, ValueError):
+            self._datos = {}
+
+    def md5(self, public_id):
+        return (self._datos.get(public_id) or {}).get('md5')
+
+    def registrar(self, public_id, md5, ruta, version=None):
+        with self._lock:
+            self._datos[public_id] = {'md5': md5, 'ruta': ruta, 'version': version}
+            self._guardar()
+
+    def _guardar(self):
+        self.ruta.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.ruta.with_name(self.ruta.name + '.tmp')
+        tmp.write_text(json.dumps(self._datos, indent=1, sort_keys=True, ensure_ascii=False), encoding='utf-8')
+        os.replace(tmp, self.ruta)
+
+    def __len__(self):
+        return len(self._datos)
+
+
+def _procesar(tarea, estado, subir, etag_remoto, overwrite, dry_run, opciones_reintento):
+    """Devuelve (resultado, detalle) con resultado en 'subido', 'sin_cambios', 'dry'."""
+    md5 = md5_archivo(tarea.ruta)
+    anterior = estado.md5(tarea.public_id)
+    if anterior == md5 and not overwrite:
+        return 'sin_cambios', 'estado local'
+
+    reemplazar = overwrite or anterior is not None
+    if anterior is None and not overwrite and etag_remoto is not None:
+        etag = con_reintentos(lambda: etag_remoto(tarea.public_id), **opciones_reintento)
+        if etag == md5:
+            # --dry-run no escribe el estado
+            if not dry_run:
+                estado.registrar(tarea.public_id, md5, str(tarea.ruta))
+            return 'sin_cambios', 'igual en Cloudinary'
+        # Existe con otro contenido: reemplazarlo
+        reemplazar = etag is not None
+
+    if dry_run:
+        return 'dry', 'reemplazaría' if reemplazar else 'subiría'
+
+    respuesta = con_reintentos(lambda: subir(tarea.ruta, tarea.public_id, reemplazar), **opciones_reintento)
+    estado.registrar(tarea.public_id, md5, str(tarea.ruta), (respuesta or {}).get('version'))
+    return 'subido', 'reemplazado' if reemplazar else 'nuevo'
+
+
+def sincronizar(tareas, estado, subir, etag_remoto=None, overwrite=False, dry_run=False,
+                concurrencia=CONCURRENCIA, al_terminar=None, **opciones_reintento):
+    """Sube las `tareas` pendientes en un pool de `concurrencia` hilos.
+
+    - `subir(ruta, public_id, overwrite)` sube un archivo y devuelve la
+      respuesta de Cloudinary (dict).
+    - `etag_remoto(public_id)` devuelve el etag del recurso o None si no
+      existe; solo se consulta para archivos que no están en el estado.
+    - `al_terminar(tarea, resultado, detalle)` se llama por cada archivo;
+      resultado es 'subido', 'sin_cambios', 'dry' o 'fallido'.
+
+    Devuelve un Counter con los resultados.
+    """
+    resumen = Counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrencia)) as pool:
+        futuros = {
+            pool.submit(_procesar, t, estado, subir, etag_remoto, overwrite, dry_run, opciones_reintento): t
+            for t in tareas
+        }
+        for futuro in as_completed(futuros):
+            tarea = futuros[futuro]
+            try:
+                resultado, detalle = futuro.result()
+            except Exception as exc:
+                resultado, detalle = 'fallido', str(exc)
+            resumen[resultado] += 1
+            if al_terminar:
+                al_terminar(tarea, resultado, detalle)
+    return resumen
@@ -0,0 +1,165 @@
+"""
+Sugerencias de horario alternativo cuando `register` rechaza una fecha
+(salón bloqueado, horario ocupado o capacidad insuficiente).
+
+Devuelve las fechas libres más cercanas para la misma configuración y los
+otros salones/configuraciones que admiten `numero_personas` en la fecha
+pedida. Usa:
+
+- un índice de capacidad en memoria (configuraciones ordenadas por
+  `capacidad_efectiva_max`), reconstruido solo cuando cambia la
+  generación 'catalogo' de `reservas.cache`;
+- el mismo criterio de cruce que `register` (`reservas.disponibilidad`:
+  intervalos con la decoración, aunque empiece antes de las 08:30, bloqueos
+  por horas y apartados vivos), con tres consultas para toda la ventana y
+  todos los salones: reservas, bloqueos y apartados.
+"""
+from bisect import bisect_left
+from collections import namedtuple
+from datetime import date, timedelta
+
+from django.utils import timezone
+
+from .cache import generacion
+from .disponibilidad import (
+    ESTADOS_OCUPAN,
+    _rango_fechas,
+    bloqueos_activos,
+    indexar,
+    indexar_intervalos,
+    intervalo_bloqueo,
+    intervalo_reserva,
+    intervalos_solapados,
+)
+from .holds import vivos
+from .models import ConfiguracionSalon, Reserva
+
+
+VENTANA_DIAS = 90
+MAX_FECHAS = 5
+MAX_SALONES = 5
+
+EntradaCapacidad = namedtuple('EntradaCapacidad', [
+    'capacidad_max', 'config_id', 'salon_id', 'salon_nombre', 'configuracion', 'capacidad',
+])
+
+# (generación, entradas ordenadas por capacidad, capacidades) por proceso
+_indice = None
+
+
+def indice_capacidad():
+    """Configuraciones de salones disponibles ordenadas por capacidad máxima."""
+    global _indice
+    gen = generacion('catalogo')
+    if _indice is None or _indice[0] != gen:
+        entradas = sorted(
+            EntradaCapacidad(c.capacidad_efectiva_max, c.id, c.salon_id, c.salon.nombre,
+                             c.get_tipo_configuracion_display(), c.capacidad_display)
+            for c in ConfiguracionSalon.objects.filter(salon__disponible=True).select_related('salon').order_by()
+        )
+        _indice = (gen, entradas, [e.capacidad_max for e in entradas])
+    return _indice[1], _indice[2]
+
+
+def configuraciones_para(numero_personas):
+    """Entradas con capacidad suficiente, de la más ajustada a la más grande."""
+    entradas, capacidades = indice_capacidad()
+    return entradas[bisect_left(capacidades, numero_personas):]
+
+
+def indices_ocupacion(salones, candidatos):
+    """{salon_id: [índice de reservas, de bloqueos, de apartados]} que pueden cruzarse con los candidatos.
+
+    `candidatos` son `Intervalo`s; se hace una consulta por tipo para todos los salones.
+    """
+    desde = date.fromordinal(min(_rango_fechas(iv)[0] for iv in candidatos))
+    hasta = date.fromordinal(max(_rango_fechas(iv)[1] for iv in candidatos))
+    reservas, bloqueos, apartados = {}, {}, {}
+    for salon_id, *fila in Reserva.objects.filter(
+        configuracion_salon__salon_id__in=salones,
+        fecha_evento__range=(desde, hasta),
+        estado__in=ESTADOS_OCUPAN,
+    ).values_list('configuracion_salon__salon_id', 'id', 'fecha_evento', 'hora_inicio', 'duracion',
+                  'tiempo_decoracion').order_by():
+        reservas.setdefault(salon_id, []).append(fila)
+    for salon_id, pk, fi, hi, ff, hf in bloqueos_activos(desde, hasta).filter(salon_id__in=salones).values_list(
+            'salon_id', 'id', 'fecha_inicio', 'hora_inicio', 'fecha_fin', 'hora_fin').order_by():
+        bloqueos.setdefault(salon_id, []).append(intervalo_bloqueo(fi, hi, ff, hf, bloqueo_id=pk))
+    for salon_id, *fila in vivos().filter(
+        configuracion_salon__salon_id__in=salones, fecha__range=(desde, hasta),
+    ).values_list('configuracion_salon__salon_id', 'id', 'fecha', 'hora_inicio', 'duracion', 'tiempo_decoracion'):
+        apartados.setdefault(salon_id, []).append(fila)
+    return {
+        salon_id: [
+            indexar_intervalos(reservas.get(salon_id, [])),
+            indexar(bloqueos.get(salon_id, [])),
+            indexar_intervalos(apartados.get(salon_id, [])),
+        ]
+        for salon_id in salones
+    }
+
+
+def _libre(candidato, indices):
+    """¿El `Intervalo` candidato no se cruza con ninguna reserva, bloqueo ni apartado?"""
+    return not any(intervalos_solapados(candidato, *indice) for indice in indices)
+
+
+def sugerir(configuracion, fecha, numero_personas, hora_inicio=None, duracion='4H',
+            tiempo_decoracion=0, ventana=VENTANA_DIAS, max_fechas=MAX_FECHAS, max_salones=MAX_SALONES):
+    """Alternativas para una solicitud rechazada.
+
+    Devuelve {'fechas': [...], 'salones': [...]}: fechas libres más cercanas
+    para la misma configuración (si tiene capacidad suficiente) y otras
+    configuraciones con capacidad para `numero_personas` libres en `fecha`.
+    """
+    hoy = timezone.localdate()
+    # Ventana de `ventana` días centrada en la fecha pedida, sin fechas pasadas
+    desde = max(hoy, fecha - timedelta(days=ventana // 2))
+    hasta = desde + timedelta(days=ventana)
+
+    aptas = configuraciones_para(numero_personas)
+    salones = {e.salon_id for e in aptas}
+    if configuracion is not None:
+        salones.add(configuracion.salon_id)
+
+    def candidato(d):
+        return intervalo_reserva(d, hora_inicio, duracion, tiempo_decoracion)
+
+    dias = [desde + timedelta(days=i) for i in range((hasta - desde).days + 1)]
+    indices = indices_ocupacion(salones, [candidato(d) for d in dias + [fecha]])
+
+    fechas = []
+    if configuracion is not None and configuracion.capacidad_efectiva_max >= numero_personas:
+        propios = indices[configuracion.salon_id]
+        for d in sorted(dias, key=lambda d: (abs((d - fecha).days), d)):
+            if d != fecha and d.weekday() != 0 and _libre(candidato(d), propios):
+                fechas.append(d)
+                if len(fechas) == max_fechas:
+                    break
+        fechas.sort()
+
+    alternativas = []
+    if fecha >= hoy and fecha.weekday() != 0:
+        pedido = candidato(fecha)
+        libres = {}
+        for e in aptas:
+            if configuracion is not None and e.config_id == configuracion.id:
+                continue
+            if e.salon_id not in libres:
+                libres[e.salon_id] = _libre(pedido, indices[e.salon_id])
+            if libres[e.salon_id]:
+                alternativas.append({
+                    'id': e.config_id,
+                    'salon_id': e.salon_id,
+                    'salon_nombre': e.salon_nombre,
+                    'configuracion': e.configuracion,
+                    'capacidad': e.capacidad,
+                    'capacidad_max': e.capacidad_max,
+                })
+                if len(alternativas) == max_salones:
+                    break
+
+    return {
+        'fechas': [d.strftime('%Y-%m-%d') for d in fechas],
+        'salones': alternativas,
+    }
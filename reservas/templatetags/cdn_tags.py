@@ -13,15 +13,32 @@ Uso:
     # Con transformaciones extra (ej. recorte centrado a 800x600)
     <img src="{% cdn_static 'img/fondin.webp' transforms='c_fill,w_800,h_600' %}" alt="...">
 
+    # Imagen responsive: srcset/sizes con varios anchos
+    {% cdn_img 'img/tenis/tenis1.avif' crop='c_fill,ar_16:9' max_width=1600 alt="Cancha" class="d-block w-100" %}
+
 Si CLOUDINARY_ENABLED=false (default en dev) o no hay CLOUDINARY_CLOUD_NAME,
-el tag cae a la URL estatica clasica.
+el tag cae a la URL estatica clasica. `cdn_img` en ese caso arma el srcset
+con las variantes AVIF/WebP de `static/img/_responsive` (comando
+`generar_variantes`, ver `reservas.variantes`).
+
+Las URLs se memoizan por proceso (LRU); la memoria se limpia si cambian los
+settings (tests con override_settings). `cdn_img` memoiza por (ruta,
+generación 'imagenes'): la generación se resuelve una vez por render de
+plantilla (`generacion_local`, sin leer la caché en cada tag).
 """
 import os
+from functools import lru_cache
+
 from django import template
 from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
 from urllib.parse import quote
 
+from reservas.variantes import ANCHOS
+
 register = template.Library()
 
 
@@ -51,30 +68,24 @@ def _cloudinary_upload_url(public_id: str, transforms: str) -> str:
     return f"https://res.cloudinary.com/{cloud}/image/upload/{chain}/{public_id}"
 
 
-@register.simple_tag
-def cdn_static(path, transforms: str = ""):
-    """Devuelve URL de Cloudinary (image/upload mode) para una imagen estatica
-    ya subida, o la URL estatica clasica si Cloudinary esta desactivado.
+def _cloudinary_activo() -> bool:
+    return bool(getattr(settings, "CLOUDINARY_ENABLED", False) and getattr(settings, "CLOUDINARY_CLOUD_NAME", ""))
+
+
+@lru_cache(maxsize=2048)
+def construir_url(path: str, transforms: str = "") -> str:
+    """URL final (Cloudinary o static) de una imagen estatica, memoizada.
 
     `path` es la ruta relativa desde static/ (ej: 'img/yotas1.jpeg').
     """
-    cloud = getattr(settings, "CLOUDINARY_CLOUD_NAME", "")
-    enabled = getattr(settings, "CLOUDINARY_ENABLED", False)
-    if not (enabled and cloud):
+    if not _cloudinary_activo():
         return static(path)
     public_id = _public_id_from_path(_strip_static_prefix(path))
     return _cloudinary_upload_url(public_id, transforms)
 
 
-@register.simple_tag
-def cdn_url(url, transforms: str = ""):
-    """Compatibilidad. Para URLs ya resueltas que apunten a /static/img/.
-    Si Cloudinary esta deshabilitado devuelve la URL tal cual.
-    """
-    cloud = getattr(settings, "CLOUDINARY_CLOUD_NAME", "")
-    enabled = getattr(settings, "CLOUDINARY_ENABLED", False)
-    if not (enabled and cloud) or not url:
-        return url
+@lru_cache(maxsize=2048)
+def _cdn_url(url: str, transforms: str) -> str:
     # Solo transformamos URLs que apunten al static local
     rel = _strip_static_prefix(url)
     if rel == url and not url.startswith("img/"):
@@ -82,3 +93,140 @@ def cdn_url(url, transforms: str = ""):
         return url
     public_id = _public_id_from_path(rel)
     return _cloudinary_upload_url(public_id, transforms)
+
+
+@receiver(setting_changed)
+def _limpiar_memoria(**kwargs):
+    if kwargs["setting"].startswith(("CLOUDINARY_", "STATIC")):
+        construir_url.cache_clear()
+        _cdn_url.cache_clear()
+        _atributos_img.cache_clear()
+
+
+@register.simple_tag
+def cdn_static(path, transforms: str = ""):
+    """Devuelve URL de Cloudinary (image/upload mode) para una imagen estatica
+    ya subida, o la URL estatica clasica si Cloudinary esta desactivado.
+
+    `path` es la ruta relativa desde static/ (ej: 'img/yotas1.jpeg').
+    """
+    return construir_url(path, transforms)
+
+
+@register.simple_tag
+def cdn_url(url, transforms: str = ""):
+    """Compatibilidad. Para URLs ya resueltas que apunten a /static/img/.
+    Si Cloudinary esta deshabilitado devuelve la URL tal cual.
+    """
+    if not _cloudinary_activo() or not url:
+        return url
+    return _cdn_url(url, transforms)
+
+
+def _anchos(max_width, original):
+    """Anchos del srcset de Cloudinary: los de ANCHOS menores que `max_width`
+    más `max_width`, sin pasar del ancho original de la imagen si se conoce."""
+    tope = max_width or ANCHOS[-1]
+    if original:
+        tope = min(tope, original)
+    return sorted({a for a in ANCHOS if a < tope} | {tope})
+
+
+def _variantes_locales(entrada, max_width):
+    """{formato: [(url, ancho)]} de las variantes generadas hasta `max_width`
+    (más la siguiente mayor, para pantallas de alta densidad)."""
+    fuentes = {}
+    for formato in ("avif", "webp"):
+        anchos = sorted(
+            (v["ancho"], v["ruta"]) for v in entrada.get("variantes", []) if v["formato"] == formato
+        )
+        if max_width:
+            menores = [a for a in anchos if a[0] <= max_width]
+            mayores = [a for a in anchos if a[0] > max_width]
+            anchos = menores + mayores[:1]
+        if anchos:
+            fuentes[formato] = [(static(f"img/{ruta}"), ancho) for ancho, ruta in anchos]
+    return fuentes
+
+
+@lru_cache(maxsize=1024)
+def _atributos_img(path: str, crop: str, max_width, generacion_imagenes):
+    """(src, {formato: [(url, ancho)]}, ancho, alto) de `cdn_img`.
+
+    Con Cloudinary el formato es 'auto' (f_auto); en local 'avif'/'webp'
+    según el manifiesto de variantes. Sin variantes el dict va vacío.
+    `generacion_imagenes` solo forma parte de la clave: invalida la memoria
+    cuando se regeneran las variantes o el manifiesto de static/img.
+    """
+    from reservas import imagenes, variantes
+
+    rel = _strip_static_prefix(path)
+    rel_img = rel[len("img/"):] if rel.startswith("img/") else rel
+
+    entrada = variantes.manifiesto().get(rel_img)
+    if entrada is not None:
+        original = entrada["ancho"], entrada["alto"]
+    else:
+        info = imagenes.info(rel_img)
+        original = (info.ancho, info.alto) if info else (None, None)
+
+    if _cloudinary_activo():
+        base = [t for t in (crop or "c_limit").split(",") if t]
+        candidatos = []
+        for ancho in _anchos(max_width, original[0]):
+            transforms = ",".join(base + [f"w_{ancho}", "f_auto", "q_auto"])
+            candidatos.append((construir_url(path, transforms), ancho))
+        # Dimensiones del `src` (el candidato mayor): mismo aspecto que el original
+        ancho_src = candidatos[-1][1]
+        alto_src = round(original[1] * ancho_src / original[0]) if all(original) else None
+        return candidatos[-1][0], {"auto": candidatos}, ancho_src if alto_src else None, alto_src
+
+    if entrada is None:
+        return construir_url(path), {}, *original
+    return construir_url(path), _variantes_locales(entrada, max_width), *original
+
+
+def _generacion_imagenes(context):
+    """Generación 'imagenes' del render en curso (la primera vez, de `generacion_local`)."""
+    from reservas.cache import generacion_local
+
+    gen = context.render_context.get(_generacion_imagenes)
+    if gen is None:
+        gen = context.render_context[_generacion_imagenes] = generacion_local("imagenes")
+    return gen
+
+
+@register.simple_tag(takes_context=True)
+def cdn_img(context, path, crop: str = "", max_width=None, sizes: str = "100vw", **attrs):
+    """`<img>` responsive con `srcset`/`sizes`.
+
+    - Cloudinary activo: un candidato por ancho con `w_<ancho>` (más `crop`,
+      p.ej. 'c_fill,ar_16:9'; por defecto 'c_limit' para no agrandar).
+    - Local: las variantes AVIF/WebP de `generar_variantes` (manifiesto en
+      static/img/_responsive); con AVIF se emite un `<picture>`.
+
+    `max_width` es el ancho mayor que tiene sentido servir (el tamaño de
+    diseño); `sizes` el ancho que ocupa en pantalla. El resto de argumentos
+    (alt, class, loading...) se copian como atributos del `<img>`.
+    """
+    max_width = int(max_width) if max_width else None
+    src, fuentes, ancho, alto = _atributos_img(path, crop, max_width, _generacion_imagenes(context))
+    atributos = {"src": src}
+    candidatos = fuentes.get("auto") or fuentes.get("webp")
+    if candidatos:
+        atributos["srcset"] = _srcset(candidatos)
+        atributos["sizes"] = sizes
+    if ancho and alto and not crop:
+        atributos["width"], atributos["height"] = ancho, alto
+    atributos.update((k.replace("_", "-"), v) for k, v in attrs.items())
+    img = format_html("<img{}>", format_html_join("", ' {}="{}"', atributos.items()))
+    if "avif" not in fuentes:
+        return img
+    return format_html(
+        '<picture><source type="image/avif" srcset="{}" sizes="{}">{}</picture>',
+        _srcset(fuentes["avif"]), sizes, img,
+    )
+
+
+def _srcset(candidatos):
+    return ", ".join(f"{url} {ancho}w" for url, ancho in candidatos)
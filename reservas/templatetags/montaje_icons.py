@@ -1,13 +1,29 @@
 """
-Template tag que devuelve un SVG inline representando esquemáticamente cada
-tipo de montaje (auditorio, banquete, escuela, mesa en U, etc).
-
-Reemplaza las imágenes estáticas: el ícono se genera dinámicamente a partir
-del código del tipo de configuración (ConfiguracionSalon.TIPO_CONFIGURACION_CHOICES).
+Template tags con el ícono SVG que representa esquemáticamente cada tipo de
+montaje (auditorio, banquete, escuela, mesa en U, etc).
+
+Los íconos se generan a partir del código del tipo de configuración
+(ConfiguracionSalon.TIPO_CONFIGURACION_CHOICES) y se compilan una vez en un
+sprite estático (`static/img/montajes-sprite.svg`, un `<symbol>` por tipo;
+regenerar con `manage.py generar_sprite_montajes`). `montaje_icon` emite
+solo un `<svg><use href="sprite.svg?v=<hash>#montaje-…"></svg>`: el navegador
+descarga el sprite una vez y el HTML no repite el dibujo en cada tarjeta.
+
+`montaje_icon_inline` devuelve el SVG completo (para contextos sin acceso
+al sprite, p.ej. correos); está memoizado por tipo.
 """
+import hashlib
+import logging
+from functools import lru_cache
+from pathlib import Path
+
 from django import template
+from django.conf import settings
+from django.templatetags.static import static
 from django.utils.safestring import mark_safe
 
+logger = logging.getLogger(__name__)
+
 register = template.Library()
 
 
@@ -18,12 +34,10 @@ GOLD = "#d97706"
 INK = "#475569"
 
 
-def _svg(content, viewbox="0 0 64 64"):
-    return (
-        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="{viewbox}" '
-        f'aria-hidden="true" focusable="false" class="montaje-svg">'
-        f'{content}</svg>'
-    )
+VIEWBOX = "0 0 64 64"
+
+# Ruta del sprite dentro de static/
+SPRITE = "img/montajes-sprite.svg"
 
 
 def _auditorio():
@@ -37,7 +51,7 @@ def _auditorio():
         for cx in xs:
             seats.append(f'<circle cx="{cx}" cy="{cy}" r="2" fill="{NAVY}"/>')
     stage = f'<rect x="14" y="12" width="40" height="4" rx="2" fill="{GOLD}"/>'
-    return _svg(stage + "".join(seats))
+    return stage + "".join(seats)
 
 
 def _escuela():
@@ -50,7 +64,7 @@ def _escuela():
         # Sillas detrás (círculos)
         for cx in [20, 28, 36, 44]:
             parts.append(f'<circle cx="{cx}" cy="{y+8}" r="1.8" fill="{NAVY}"/>')
-    return _svg("".join(parts))
+    return "".join(parts)
 
 
 def _banquete():
@@ -67,7 +81,7 @@ def _banquete():
             sx = cx + 10 * math.cos(ang)
             sy = cy + 10 * math.sin(ang)
             parts.append(f'<circle cx="{sx:.1f}" cy="{sy:.1f}" r="1.6" fill="{GOLD}"/>')
-    return _svg("".join(parts))
+    return "".join(parts)
 
 
 def _mesa_u():
@@ -81,7 +95,7 @@ def _mesa_u():
                    (54, 18), (54, 26), (54, 34), (54, 42), (54, 50),
                    (18, 10), (26, 10), (34, 10), (42, 10), (50, 10)]:
         parts.append(f'<circle cx="{cx}" cy="{cy}" r="1.8" fill="{GOLD}"/>')
-    return _svg("".join(parts))
+    return "".join(parts)
 
 
 def _imperial():
@@ -95,7 +109,7 @@ def _imperial():
     for cy in [26, 34, 42]:
         parts.append(f'<circle cx="12" cy="{cy}" r="1.8" fill="{GOLD}"/>')
         parts.append(f'<circle cx="52" cy="{cy}" r="1.8" fill="{GOLD}"/>')
-    return _svg("".join(parts))
+    return "".join(parts)
 
 
 def _mesa_12():
@@ -107,7 +121,7 @@ def _mesa_12():
         sx = 32 + 20 * math.cos(ang)
         sy = 32 + 20 * math.sin(ang)
         parts.append(f'<circle cx="{sx:.1f}" cy="{sy:.1f}" r="2" fill="{GOLD}"/>')
-    return _svg("".join(parts))
+    return "".join(parts)
 
 
 def _empresarial():
@@ -120,7 +134,7 @@ def _empresarial():
     # Sillas cabeza
     parts.append(f'<circle cx="10" cy="32" r="2" fill="{GOLD}"/>')
     parts.append(f'<circle cx="54" cy="32" r="2" fill="{GOLD}"/>')
-    return _svg("".join(parts))
+    return "".join(parts)
 
 
 def _sofa():
@@ -133,7 +147,7 @@ def _sofa():
     parts.append(f'<rect x="30" y="38" width="20" height="8" rx="2" fill="{NAVY}" opacity="0.85"/>')
     # Mesa de centro
     parts.append(f'<circle cx="32" cy="32" r="4" fill="{GOLD}"/>')
-    return _svg("".join(parts))
+    return "".join(parts)
 
 
 def _cortesia():
@@ -145,7 +159,7 @@ def _cortesia():
     parts.append(f'<circle cx="32" cy="14" r="3" fill="{GOLD}"/>')
     # Cinta vertical
     parts.append(f'<rect x="30" y="22" width="4" height="28" fill="{GOLD}"/>')
-    return _svg("".join(parts))
+    return "".join(parts)
 
 
 def _generic():
@@ -154,10 +168,11 @@ def _generic():
     for x in (18, 36):
         for y in (18, 36):
             parts.append(f'<rect x="{x}" y="{y}" width="10" height="10" rx="2" fill="{NAVY}" opacity="0.85"/>')
-    return _svg("".join(parts))
+    return "".join(parts)
 
 
-# Mapeo desde TIPO_CONFIGURACION_CHOICES (código) a renderer
+# Mapeo desde TIPO_CONFIGURACION_CHOICES (código) a renderer. Cada renderer
+# devuelve solo el dibujo; el envoltorio <svg> o <symbol> lo pone quien lo usa
 _RENDERERS = {
     'AUDITORIO': _auditorio,
     'ESCUELA': _escuela,
@@ -189,22 +204,92 @@ _LABEL_TO_CODE = {
 }
 
 
+GENERICO = 'GENERICO'
+
+
+@lru_cache(maxsize=256)
+def _codigo(tipo):
+    """Código del renderer para `tipo` (código o etiqueta legible); GENERICO si no se reconoce."""
+    if not tipo:
+        return GENERICO
+    key = str(tipo).strip()
+    # Primero intentar por código directo (mayúsculas)
+    if key.upper() in _RENDERERS:
+        return key.upper()
+    # Si no, intentar por etiqueta humana
+    return _LABEL_TO_CODE.get(key.lower(), GENERICO)
+
+
+@lru_cache(maxsize=None)
+def _dibujo(codigo):
+    renderer = _RENDERERS.get(codigo, _generic)
+    return renderer()
+
+
+def _id_simbolo(codigo):
+    return f"montaje-{codigo.lower().replace('_', '-')}"
+
+
+@lru_cache(maxsize=1)
+def sprite():
+    """Contenido del sprite: un `<symbol>` por tipo de montaje (más el genérico)."""
+    simbolos = [
+        f'<symbol id="{_id_simbolo(codigo)}" viewBox="{VIEWBOX}">{_dibujo(codigo)}</symbol>'
+        for codigo in [*_RENDERERS, GENERICO]
+    ]
+    return (
+        '<svg xmlns="http://www.w3.org/2000/svg">'
+        + "".join(simbolos) + '</svg>\n'
+    )
+
+
+def ruta_sprite():
+    """Archivo del sprite en el primer directorio de STATICFILES_DIRS."""
+    static_dirs = getattr(settings, 'STATICFILES_DIRS', [])
+    base = Path(static_dirs[0]) if static_dirs else Path(settings.BASE_DIR) / 'static'
+    return base / SPRITE
+
+
+@lru_cache(maxsize=1)
+def _url_sprite():
+    contenido = sprite().encode()
+    try:
+        if ruta_sprite().read_bytes() != contenido:
+            logger.warning('%s no coincide con los íconos actuales: correr generar_sprite_montajes', SPRITE)
+    except OSError:
+        logger.warning('Falta %s: correr generar_sprite_montajes', SPRITE)
+    version = hashlib.sha1(contenido).hexdigest()[:12]
+    return f"{static(SPRITE)}?v={version}"
+
+
+@lru_cache(maxsize=64)
+def _uso(codigo):
+    return mark_safe(
+        f'<svg viewBox="{VIEWBOX}" aria-hidden="true" focusable="false" class="montaje-svg">'
+        f'<use href="{_url_sprite()}#{_id_simbolo(codigo)}"/></svg>'
+    )
+
+
+@lru_cache(maxsize=64)
+def _inline(codigo):
+    return mark_safe(
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="{VIEWBOX}" '
+        f'aria-hidden="true" focusable="false" class="montaje-svg">'
+        f'{_dibujo(codigo)}</svg>'
+    )
+
+
 @register.simple_tag
 def montaje_icon(tipo):
-    """Devuelve un SVG inline para el tipo de montaje dado.
+    """Ícono del tipo de montaje dado, referenciando el sprite estático.
 
     `tipo` puede ser el código (ej. 'AUDITORIO') o la etiqueta legible
     (ej. 'Auditorio', 'Mesa en U').
     """
-    if not tipo:
-        return mark_safe(_generic())
-    key = str(tipo).strip()
-    # Primero intentar por código directo (mayúsculas)
-    renderer = _RENDERERS.get(key.upper())
-    if renderer is None:
-        # Si no, intentar por etiqueta humana
-        code = _LABEL_TO_CODE.get(key.lower())
-        renderer = _RENDERERS.get(code) if code else None
-    if renderer is None:
-        return mark_safe(_generic())
-    return mark_safe(renderer())
+    return _uso(_codigo(tipo))
+
+
+@register.simple_tag
+def montaje_icon_inline(tipo):
+    """SVG inline completo del tipo de montaje (sin depender del sprite)."""
+    return _inline(_codigo(tipo))
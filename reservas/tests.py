@@ -1,3 +1,1593 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time as time_mod
+from collections import Counter
+from datetime import date, time, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+from urllib.parse import unquote
 
-# Create your tests here.
+from django.contrib.admin.sites import AdminSite
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F
+from django.template import Context, Template
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import (
+    bandeja_salida, cache, candados, catalogo, contenido, correos, disponibilidad, holds, imagenes, ocupacion, paginas, socios,
+    subidas, subidas_cloudinary, sugerencias, variantes,
+)
+from .models import (
+    BloqueoEspacio, CandadoReserva, CodigoSocio, Comunicado, ConfiguracionSalon, EmailBody, EmailLog, EmailOutbox,
+    OcupacionDiaria, Reserva, ReservaHold, ReservaServicioAdicional, Salon, ServicioAdicional, SubidaImagen,
+)
+from .admin import SocioAdmin
+from .templatetags import montaje_icons
+
+
+def proxima_fecha(dias=10):
+    """Fecha futura que no cae en lunes (el club no abre los lunes)."""
+    fecha = date.today() + timedelta(days=dias)
+    while fecha.weekday() == 0:
+        fecha += timedelta(days=1)
+    return fecha
+
+
+def crear_configuracion(nombre='Salón Prueba', capacidad=50, tipo='AUDITORIO'):
+    salon = Salon.objects.create(nombre=nombre)
+    return ConfiguracionSalon.objects.create(
+        salon=salon, tipo_configuracion=tipo, capacidad=capacidad,
+        precio_socio_4h=100, precio_particular_4h=200,
+    )
+
+
+def crear_reserva(config, fecha, hora, duracion='4H', **kwargs):
+    datos = {
+        'nombre_cliente': 'Cliente', 'email_cliente': 'cliente@example.com',
+        'telefono_cliente': '3001234567', 'numero_personas': 10, 'precio_total': 100,
+    }
+    datos.update(kwargs)
+    return Reserva.objects.create(
+        configuracion_salon=config, fecha_evento=fecha, hora_inicio=hora, duracion=duracion, **datos)
+
+
+# Caché propia de los tests: la de archivos del proyecto la comparte el servidor de desarrollo
+CACHES_TESTS = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'reservas-tests'}}
+
+
+class CacheLimpiaMixin:
+    """La caché no se revierte con la transacción del test: vaciarla antes de cada uno."""
+
+    def run(self, result=None):
+        caches['default'].clear()
+        cache.olvidar_locales()
+        return super().run(result)
+
+
+# El pool de la bandeja de salida envía desde otro hilo, con otra conexión que
+# no ve las filas de la transacción del test: en los tests envía el propio test.
+@override_settings(CACHES=CACHES_TESTS, EMAIL_OUTBOX_EN_PROCESO=False)
+class ReservasTestCase(CacheLimpiaMixin, TestCase):
+    pass
+
+
+@override_settings(CACHES=CACHES_TESTS, EMAIL_OUTBOX_EN_PROCESO=False)
+class ReservasTransactionTestCase(CacheLimpiaMixin, TransactionTestCase):
+    pass
+
+
+class MotorConflictosTests(ReservasTestCase):
+    """`reservas.disponibilidad`: intervalos semiabiertos por salón."""
+
+    def setUp(self):
+        self.config = crear_configuracion()
+        self.salon_id = self.config.salon_id
+        self.fecha = proxima_fecha()
+
+    def test_intervalo_madrugada_y_decoracion(self):
+        base = self.fecha.toordinal() * disponibilidad.MINUTOS_DIA
+        iv = disponibilidad.intervalo_reserva(self.fecha, time(1, 0), '4H')
+        self.assertEqual((iv.inicio - base, iv.fin - base), (25 * 60, 29 * 60))
+        iv = disponibilidad.intervalo_reserva(self.fecha, time(10, 0), '8H', tiempo_decoracion=2)
+        self.assertEqual((iv.inicio - base, iv.fin - base), (8 * 60, 18 * 60))
+        iv = disponibilidad.intervalo_reserva(self.fecha, None, '4H')
+        self.assertEqual((iv.inicio - base, iv.fin - base),
+                         (disponibilidad.JORNADA_INICIO, disponibilidad.JORNADA_FIN))
+
+    def test_horarios_contiguos_no_se_cruzan(self):
+        crear_reserva(self.config, self.fecha, time(10, 0))
+        self.assertFalse(disponibilidad.hay_conflicto(self.salon_id, self.fecha, time(14, 0), '4H'))
+        self.assertTrue(disponibilidad.hay_conflicto(self.salon_id, self.fecha, time(13, 0), '4H'))
+
+    def test_decoracion_invade_reserva_anterior(self):
+        crear_reserva(self.config, self.fecha, time(10, 0))
+        self.assertFalse(disponibilidad.hay_conflicto(self.salon_id, self.fecha, time(15, 0), '4H'))
+        self.assertTrue(disponibilidad.hay_conflicto(self.salon_id, self.fecha, time(15, 0), '4H',
+                                                     tiempo_decoracion=2))
+
+    def test_evento_que_cruza_medianoche(self):
+        # 22:00 + 8 h termina a las 06:00 del día siguiente
+        reserva = crear_reserva(self.config, self.fecha, time(22, 0), duracion='8H')
+        siguiente = self.fecha + timedelta(days=1)
+        self.assertEqual(
+            [r.pk for r in disponibilidad.buscar_conflictos(self.salon_id, self.fecha, time(1, 0), '4H')],
+            [reserva.pk])
+        self.assertFalse(disponibilidad.hay_conflicto(self.salon_id, siguiente, time(9, 0), '4H'))
+
+    def test_otro_salon_y_cancelada_no_ocupan(self):
+        crear_reserva(crear_configuracion('Otro salón'), self.fecha, time(10, 0))
+        crear_reserva(self.config, self.fecha, time(10, 0), estado='CANCELADA')
+        self.assertFalse(disponibilidad.hay_conflicto(self.salon_id, self.fecha, time(10, 0), '4H'))
+
+    def test_excluir_la_propia_reserva(self):
+        reserva = crear_reserva(self.config, self.fecha, time(10, 0))
+        self.assertEqual(disponibilidad.buscar_conflictos(self.salon_id, self.fecha, time(11, 0), '4H',
+                                                          excluir_id=reserva.pk), [])
+
+    def test_configuraciones_del_mismo_salon_comparten_espacio(self):
+        banquete = ConfiguracionSalon.objects.create(
+            salon=self.config.salon, tipo_configuracion='BANQUETE', capacidad=30,
+            precio_socio_4h=100, precio_particular_4h=200,
+        )
+        crear_reserva(banquete, self.fecha, time(10, 0))
+        self.assertTrue(disponibilidad.hay_conflicto(self.salon_id, self.fecha, time(12, 0), '4H'))
+
+    def test_conflictos_en_lote(self):
+        reserva = crear_reserva(self.config, self.fecha, time(10, 0))
+        candidatos = [
+            (self.fecha, time(9, 0), '4H', 0),
+            (self.fecha, time(14, 0), '4H', 0),
+            (self.fecha + timedelta(days=1), time(10, 0), '4H', 0),
+        ]
+        self.assertEqual(disponibilidad.conflictos_en_lote(self.salon_id, candidatos), [[reserva.pk], [], []])
+        self.assertEqual(disponibilidad.conflictos_en_lote(self.salon_id, []), [])
+
+
+class ReservaConcurrenteTests(ReservasTransactionTestCase):
+    """Solicitudes simultáneas de `register` para el mismo salón y fecha."""
+
+    HILOS = 6
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('SQLite en memoria no admite varias conexiones')
+        salon = Salon.objects.create(nombre='Salón Concurrencia')
+        self.config = ConfiguracionSalon.objects.create(
+            salon=salon, tipo_configuracion='AUDITORIO', capacidad=50,
+            precio_socio_4h=100, precio_particular_4h=200,
+        )
+        self.fecha = date.today() + timedelta(days=10)
+        while self.fecha.weekday() == 0:
+            self.fecha += timedelta(days=1)
+
+    def _post_paralelo(self, datos_por_hilo):
+        barrera = threading.Barrier(len(datos_por_hilo))
+        estados = []
+
+        def enviar(datos):
+            try:
+                barrera.wait()
+                estados.append(Client().post('/register/', datos).status_code)
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=enviar, args=(d,)) for d in datos_por_hilo]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+        return estados
+
+    def _datos(self, hora):
+        return {
+            'nombre_cliente': 'Cliente', 'email_cliente': 'cliente@example.com',
+            'telefono_cliente': '3001234567', 'num_personas': '10',
+            'fecha_evento': self.fecha.isoformat(), 'duracion_horas': '4',
+            'hora_inicio': hora, 'espacio_id': str(self.config.id),
+        }
+
+    def test_no_hay_doble_reserva(self):
+        estados = self._post_paralelo([self._datos('10:00')] * self.HILOS)
+        self.assertEqual(Reserva.objects.filter(fecha_evento=self.fecha).count(), 1)
+        self.assertEqual(sorted(estados), [200] + [400] * (self.HILOS - 1))
+
+    def test_horarios_distintos_no_se_bloquean(self):
+        horas = ['09:00', '14:00', '19:00']
+        estados = self._post_paralelo([self._datos(h) for h in horas])
+        self.assertEqual(estados, [200] * len(horas))
+        self.assertEqual(Reserva.objects.filter(fecha_evento=self.fecha).count(), len(horas))
+
+
+class OcupacionDiariaTests(ReservasTestCase):
+    """`reservas.ocupacion`: la tabla precalculada sigue a reservas y bloqueos."""
+
+    def setUp(self):
+        self.config = crear_configuracion()
+        self.salon = self.config.salon
+        self.fecha = proxima_fecha()
+
+    def _fila(self, fecha=None):
+        return OcupacionDiaria.objects.filter(salon=self.salon, fecha=fecha or self.fecha).first()
+
+    def _bloquear(self, fecha_inicio, fecha_fin, hora_inicio=None, hora_fin=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return BloqueoEspacio.objects.create(
+                salon=self.salon, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin,
+                hora_inicio=hora_inicio, hora_fin=hora_fin, motivo='MANTENIMIENTO',
+            )
+
+    def test_reserva_ocupa_y_cancelarla_libera(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            reserva = crear_reserva(self.config, self.fecha, time(22, 0), duracion='8H')
+        self.assertEqual(self._fila().rangos, [[22 * 60, 26 * 60, reserva.pk]])
+        self.assertIsNone(self._fila(self.fecha + timedelta(days=1)))
+        with self.captureOnCommitCallbacks(execute=True):
+            reserva.estado = 'CANCELADA'
+            reserva.save()
+        self.assertIsNone(self._fila())
+
+    def test_bloqueo_de_dia_completo(self):
+        self._bloquear(self.fecha, self.fecha + timedelta(days=1))
+        fila = self._fila()
+        self.assertTrue(fila.bloqueado)
+        self.assertEqual(fila.minutos_libres, 0)
+        self.assertEqual(ocupacion.estado_dia(self.fecha, fila), ocupacion.BLOQUEADO)
+        self.assertTrue(self._fila(self.fecha + timedelta(days=1)).bloqueado)
+
+    def test_bloqueo_por_horas_solo_ocupa_esas_horas(self):
+        self._bloquear(self.fecha, self.fecha, time(10, 0), time(12, 0))
+        fila = self._fila()
+        self.assertFalse(fila.bloqueado)
+        self.assertEqual(fila.rangos, [[10 * 60, 12 * 60, None]])
+        self.assertEqual(fila.num_reservas, 0)
+        self.assertEqual(fila.motivo_bloqueo, 'Mantenimiento')
+        self.assertEqual(ocupacion.estado_dia(self.fecha, fila), ocupacion.PARCIAL)
+        self.assertTrue(disponibilidad.bloqueos_en_conflicto(self.salon.pk, self.fecha, time(11, 0), '4H'))
+        self.assertFalse(disponibilidad.bloqueos_en_conflicto(self.salon.pk, self.fecha, time(14, 0), '4H'))
+
+    def test_bloqueo_por_horas_de_varios_dias(self):
+        self._bloquear(self.fecha, self.fecha + timedelta(days=2), time(18, 0), time(12, 0))
+        self.assertEqual(self._fila().rangos, [[18 * 60, disponibilidad.JORNADA_FIN, None]])
+        self.assertTrue(self._fila(self.fecha + timedelta(days=1)).bloqueado)
+        self.assertEqual(self._fila(self.fecha + timedelta(days=2)).rangos,
+                         [[disponibilidad.JORNADA_INICIO, 12 * 60, None]])
+
+    def test_bloqueo_con_rango_invertido_es_de_un_dia(self):
+        self._bloquear(self.fecha, self.fecha - timedelta(days=3))
+        self.assertTrue(self._fila().bloqueado)
+        self.assertEqual(OcupacionDiaria.objects.filter(salon=self.salon).count(), 1)
+
+    def test_get_bloqueos_salon_lee_la_ocupacion(self):
+        self._bloquear(self.fecha, self.fecha + timedelta(days=1))
+        self._bloquear(self.fecha + timedelta(days=5), self.fecha + timedelta(days=5), time(10, 0), time(12, 0))
+        datos = self.client.get('/get-bloqueos-salon/', {'salon_id': self.salon.pk}).json()
+        self.assertEqual(datos['bloqueos'], [
+            {'fecha_inicio': self.fecha.isoformat(),
+             'fecha_fin': (self.fecha + timedelta(days=1)).isoformat(),
+             'motivo': 'Mantenimiento', 'descripcion': '', 'dia_completo': True},
+            {'fecha_inicio': (self.fecha + timedelta(days=5)).isoformat(),
+             'fecha_fin': (self.fecha + timedelta(days=5)).isoformat(),
+             'motivo': 'Mantenimiento', 'descripcion': '', 'dia_completo': False},
+        ])
+
+    def test_borrado_masivo_del_admin_recalcula(self):
+        from django.contrib import admin as django_admin
+
+        self._bloquear(self.fecha, self.fecha)
+        reserva = crear_reserva(self.config, self.fecha + timedelta(days=3), time(10, 0))
+        ocupacion.recalcular(self.salon.pk, ocupacion.fechas_de_reserva(reserva.fecha_evento))
+        # delete() del queryset envía post_delete por fila: las señales recalculan
+        with self.captureOnCommitCallbacks(execute=True):
+            django_admin.site._registry[BloqueoEspacio].delete_queryset(None, BloqueoEspacio.objects.all())
+            django_admin.site._registry[Reserva].delete_queryset(None, Reserva.objects.all())
+        self.assertFalse(OcupacionDiaria.objects.filter(salon=self.salon).exists())
+
+    def test_reconstruir_si_vacia(self):
+        from io import StringIO
+        from django.core.management import call_command
+
+        crear_reserva(self.config, self.fecha, time(10, 0))
+        call_command('reconstruir_ocupacion', '--si-vacia', stdout=StringIO())
+        self.assertIsNotNone(self._fila())
+        OcupacionDiaria.objects.filter(salon=self.salon).update(num_reservas=7)
+        call_command('reconstruir_ocupacion', '--si-vacia', stdout=StringIO())
+        self.assertEqual(self._fila().num_reservas, 7)
+
+
+class DisponibilidadRangoTests(ReservasTestCase):
+    """`availability_range`: grilla por día con apartados y GET condicional."""
+
+    def setUp(self):
+        self.config = crear_configuracion()
+        self.fecha = proxima_fecha()
+        with self.captureOnCommitCallbacks(execute=True):
+            crear_reserva(self.config, self.fecha, time(20, 0))
+
+    def _get(self, **headers):
+        return self.client.get('/availability-range/', {
+            'desde': self.fecha.isoformat(), 'hasta': self.fecha.isoformat(),
+            'salon_id': self.config.salon_id,
+        }, **headers)
+
+    def test_apartados_vivos_ocupan_el_dia(self):
+        self.assertEqual(self._get().json()['dias'][self.fecha.isoformat()], ocupacion.PARCIAL)
+        holds.crear_hold(self.config, self.fecha, time(12, 0), '8H')
+        self.assertEqual(self._get().json()['dias'][self.fecha.isoformat()], ocupacion.OCUPADO)
+
+    def test_etag_se_evalua_antes_de_armar_la_grilla(self):
+        etag = self._get()['ETag']
+        with mock.patch('reservas.ocupacion.ocupacion_rango') as ocupacion_rango:
+            respuesta = self._get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 304)
+        ocupacion_rango.assert_not_called()
+
+    def test_etag_cambia_con_los_parametros_y_los_datos(self):
+        etag = self._get()['ETag']
+        otro = self.client.get('/availability-range/', {
+            'desde': self.fecha.isoformat(), 'hasta': (self.fecha + timedelta(days=1)).isoformat(),
+        })
+        self.assertNotEqual(otro['ETag'], etag)
+        with self.captureOnCommitCallbacks(execute=True):
+            crear_reserva(self.config, self.fecha, time(10, 0))
+        self.assertEqual(self._get(HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class CacheDisponibilidadTests(ReservasTestCase):
+    """`reservas.cache`: generaciones por grupo invalidadas desde las señales."""
+
+    def setUp(self):
+        self.config = crear_configuracion()
+        self.fecha = proxima_fecha()
+
+    def test_la_cache_por_defecto_es_compartida_y_sin_base(self):
+        from clubelmeta import settings as proyecto
+        if os.getenv('CACHE_BACKEND'):
+            self.skipTest('CACHE_BACKEND definido en el entorno')
+        self.assertEqual(proyecto.CACHES['default']['BACKEND'],
+                         'django.core.cache.backends.filebased.FileBasedCache')
+
+    def test_la_generacion_no_expira_tras_incrementar(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        archivos = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': tmp.name}}
+        with self.settings(CACHES=archivos):
+            cache.generacion('prueba')
+            gen = cache.incrementar_generacion('prueba')
+            # Pasado el timeout por defecto (300 s) de `incr`
+            with mock.patch('time.time', return_value=time_mod.time() + 3600):
+                self.assertEqual(cache.generacion('prueba'), gen)
+
+    def test_un_acierto_no_escribe_en_la_cache(self):
+        cache.obtener_o_calcular('prueba', ['a'], lambda: 1)
+        with mock.patch.object(cache.cache, 'add') as add, mock.patch.object(cache.cache, 'incr') as incr:
+            cache.obtener_o_calcular('prueba', ['a'], lambda: 1)
+        add.assert_not_called()
+        incr.assert_not_called()
+
+    def test_los_contadores_se_vuelcan_por_tandas(self):
+        with mock.patch.object(cache, 'VOLCAR_CADA', 3):
+            for _ in range(4):
+                cache.obtener_o_calcular('prueba', ['a'], lambda: 1)
+        # 1 fallo pendiente y 3 aciertos ya sumados a la caché compartida
+        self.assertEqual(caches['default'].get('stats:prueba:hits'), 3)
+        self.assertIsNone(caches['default'].get('stats:prueba:misses'))
+        stats = cache.estadisticas('prueba')
+        self.assertEqual((stats['hits'], stats['misses']), (3, 1))
+
+    def test_generacion_local_relee_cada_pocos_segundos(self):
+        gen = cache.generacion_local('prueba')
+        # Otro proceso incrementa la generación en la caché compartida
+        caches['default'].incr('gen:prueba')
+        with mock.patch.object(cache.cache, 'get') as get:
+            self.assertEqual(cache.generacion_local('prueba'), gen)
+        get.assert_not_called()
+        with mock.patch('time.monotonic', return_value=time_mod.monotonic() + cache.REVISION_LOCAL):
+            self.assertEqual(cache.generacion_local('prueba'), gen + 1)
+        self.assertEqual(cache.generacion_local('prueba'), gen + 1)
+
+    def test_obtener_o_calcular_y_generacion(self):
+        calcular = mock.Mock(return_value=[1, 2])
+        self.assertEqual(cache.obtener_o_calcular('prueba', ['a'], calcular), ([1, 2], False))
+        self.assertEqual(cache.obtener_o_calcular('prueba', ['a'], calcular), ([1, 2], True))
+        cache.incrementar_generacion('prueba')
+        self.assertEqual(cache.obtener_o_calcular('prueba', ['a'], calcular), ([1, 2], False))
+        self.assertEqual(calcular.call_count, 2)
+        stats = cache.estadisticas('prueba')
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+
+    def test_check_availability_se_invalida_al_reservar(self):
+        def consultar():
+            return self.client.get('/check-availability/', {'fecha': self.fecha.isoformat()})
+
+        self.assertEqual(consultar()['X-Cache'], 'MISS')
+        # Solo los apartados vigentes (vencen con el reloj); nada de la caché
+        with self.assertNumQueries(1):
+            respuesta = consultar()
+        self.assertEqual(respuesta['X-Cache'], 'HIT')
+        self.assertEqual(respuesta.json()['espacios'][0]['horarios_ocupados'], [])
+        with self.captureOnCommitCallbacks(execute=True):
+            crear_reserva(self.config, self.fecha, time(10, 0))
+        respuesta = consultar()
+        self.assertEqual(respuesta['X-Cache'], 'MISS')
+        self.assertEqual(respuesta.json()['espacios'][0]['horarios_ocupados'],
+                         [{'inicio': '10:00', 'fin': '14:00'}])
+
+    def test_guardar_sin_cambios_de_ocupacion_no_invalida(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            reserva = crear_reserva(self.config, self.fecha, time(10, 0))
+        gen = cache.generacion('disponibilidad')
+        reserva = Reserva.objects.get(pk=reserva.pk)  # como el admin: leída de la BD
+        with self.captureOnCommitCallbacks(execute=True):
+            reserva.observaciones = 'Llevan torta'
+            reserva.save()
+        self.assertEqual(cache.generacion('disponibilidad'), gen)
+
+
+class ReservarHorarioTests(ReservasTestCase):
+    """`candados.reservar_horario`: la comprobación final ya con el candado tomado."""
+
+    def setUp(self):
+        self.config = crear_configuracion()
+        self.salon_id = self.config.salon_id
+        self.fecha = proxima_fecha()
+
+    def test_rechaza_cruce_y_revierte(self):
+        crear_reserva(self.config, self.fecha, time(10, 0))
+        with self.assertRaises(candados.HorarioOcupado):
+            with candados.reservar_horario(self.salon_id, self.fecha, time(12, 0), '4H'):
+                crear_reserva(self.config, self.fecha, time(12, 0))
+        # La transacción se revierte entera, candados incluidos
+        self.assertEqual(Reserva.objects.count(), 1)
+        self.assertFalse(CandadoReserva.objects.exists())
+
+    def test_permite_horario_libre_y_cruce_forzado(self):
+        crear_reserva(self.config, self.fecha, time(10, 0))
+        with candados.reservar_horario(self.salon_id, self.fecha, time(14, 0), '4H'):
+            crear_reserva(self.config, self.fecha, time(14, 0))
+        with candados.reservar_horario(self.salon_id, self.fecha, time(12, 0), '4H', permitir_cruce=True):
+            crear_reserva(self.config, self.fecha, time(12, 0))
+        self.assertEqual(Reserva.objects.count(), 3)
+        self.assertEqual(
+            set(CandadoReserva.objects.filter(salon_id=self.salon_id).values_list('fecha', flat=True)),
+            ocupacion.fechas_de_reserva(self.fecha),
+        )
+
+    def test_apartado_de_otro_cliente(self):
+        hold = holds.crear_hold(self.config, self.fecha, time(10, 0), '4H')
+        with self.assertRaises(candados.HorarioApartado):
+            with candados.reservar_horario(self.salon_id, self.fecha, time(11, 0), '4H'):
+                pass
+        with candados.reservar_horario(self.salon_id, self.fecha, time(11, 0), '4H', hold_token=hold.token):
+            pass
+
+
+class ApartadosTests(ReservasTestCase):
+    """`reservas.holds`: apartados con vencimiento y su parte del ETag."""
+
+    def setUp(self):
+        self.config = crear_configuracion()
+        self.fecha = proxima_fecha()
+
+    def test_generacion_solo_cambia_al_confirmar(self):
+        gen = cache.generacion('holds')
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                holds.crear_hold(self.config, self.fecha, time(10, 0), '4H')
+                raise RuntimeError
+        self.assertEqual(callbacks, [])
+        self.assertEqual(cache.generacion('holds'), gen)
+        with self.captureOnCommitCallbacks(execute=True):
+            holds.crear_hold(self.config, self.fecha, time(10, 0), '4H')
+        self.assertNotEqual(cache.generacion('holds'), gen)
+
+    def test_marca_vigencia_sigue_el_proximo_vencimiento(self):
+        self.assertEqual(holds.marca_vigencia(), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            primero = holds.crear_hold(self.config, self.fecha, time(10, 0), '4H', ttl_minutos=5)
+            segundo = holds.crear_hold(self.config, self.fecha, time(16, 0), '4H', ttl_minutos=10)
+        self.assertEqual(holds.marca_vigencia(), primero.expira.timestamp())
+        # Vence el primero sin ninguna señal: la marca pasa al siguiente
+        ReservaHold.objects.filter(pk=primero.pk).update(expira=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(holds.marca_vigencia(), segundo.expira.timestamp())
+
+    def test_renovar_con_token_libera_el_anterior(self):
+        hold = holds.crear_hold(self.config, self.fecha, time(10, 0), '4H')
+        nuevo = holds.crear_hold(self.config, self.fecha, time(12, 0), '4H', token=hold.token)
+        hold.refresh_from_db()
+        self.assertEqual(hold.estado, 'LIBERADO')
+        self.assertEqual(holds.apartados_del_dia(self.fecha), {self.config.salon_id: [[12 * 60, 16 * 60]]})
+        self.assertEqual(holds.liberar_hold(nuevo.token), 1)
+        self.assertEqual(holds.apartados_del_dia(self.fecha), {})
+
+
+class ConsultasIndexadasTests(ReservasTestCase):
+    """Filtros del calendario y `benchmark_consultas` sobre los listados del admin."""
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+
+        self.config = crear_configuracion()
+        self.client.force_login(User.objects.create_user('staff', password='x', is_staff=True))
+
+    def test_calendario_incluye_bloqueos_con_rango_invertido(self):
+        hoy = date.today()
+        BloqueoEspacio.objects.create(salon=self.config.salon, fecha_inicio=hoy + timedelta(days=3),
+                                      fecha_fin=hoy - timedelta(days=30))
+        BloqueoEspacio.objects.create(salon=self.config.salon, fecha_inicio=hoy - timedelta(days=60),
+                                      fecha_fin=hoy - timedelta(days=50))
+        eventos = self.client.get('/get-calendar-events/', {
+            'start': hoy.isoformat(), 'end': (hoy + timedelta(days=42)).isoformat(),
+        }).json()
+        bloqueos = [e for e in eventos if e['extendedProps']['tipo'] == 'bloqueo']
+        self.assertEqual([(e['start'], e['end']) for e in bloqueos], [
+            ((hoy + timedelta(days=3)).isoformat(), (hoy + timedelta(days=4)).isoformat()),
+        ])
+
+    def test_changelist_filtrado_no_cuenta_toda_la_tabla(self):
+        from .management.commands.benchmark_consultas import sql_de_changelist
+
+        consultas = sql_de_changelist(Reserva, {'estado__exact': 'PENDIENTE'})
+        self.assertTrue(consultas)
+        for sql in consultas:
+            self.assertIn('WHERE', sql.upper())
+
+    def test_benchmark_sin_recorridos_completos(self):
+        from io import StringIO
+        from django.core.management import call_command
+
+        salida = StringIO()
+        call_command('benchmark_consultas', '--reservas', '3000', stdout=salida)
+        self.assertIn('admin reservas: estado + mes', salida.getvalue())
+        self.assertFalse(Reserva.objects.exists())
+
+
+class SugerenciasTests(ReservasTestCase):
+    """`reservas.sugerencias`: mismo criterio de cruce que `register`."""
+
+    def setUp(self):
+        self.config = crear_configuracion(capacidad=50)
+        self.fecha = date.today() + timedelta(days=20)
+        while self.fecha.weekday() not in (2, 3):
+            self.fecha += timedelta(days=1)
+
+    def _fechas(self, hora, decoracion=0):
+        sugerencias.indice_capacidad()  # índice de capacidad fuera del conteo
+        datos = sugerencias.sugerir(self.config, self.fecha, 10, hora, '4H', decoracion,
+                                    ventana=6, max_fechas=10)
+        return [date.fromisoformat(f) for f in datos['fechas']]
+
+    def test_decoracion_antes_de_la_jornada(self):
+        dia = self.fecha + timedelta(days=1)
+        # 01:00 del día anterior: ocupa `dia` de 01:00 a 05:00, fuera de la jornada 08:30 – 02:00
+        crear_reserva(self.config, dia - timedelta(days=1), time(1, 0))
+        self.assertIn(dia, self._fechas(time(8, 30)))
+        self.assertNotIn(dia, self._fechas(time(8, 30), decoracion=4))
+
+    def test_apartados_y_bloqueos_por_horas(self):
+        apartado = self.fecha + timedelta(days=1)
+        bloqueado = self.fecha - timedelta(days=1)
+        holds.crear_hold(self.config, apartado, time(12, 0), '4H')
+        BloqueoEspacio.objects.create(salon=self.config.salon, fecha_inicio=bloqueado, fecha_fin=bloqueado,
+                                      hora_inicio=time(9, 0), hora_fin=time(11, 0))
+        fechas = self._fechas(time(10, 0))
+        self.assertNotIn(apartado, fechas)
+        self.assertNotIn(bloqueado, fechas)
+        self.assertIn(self.fecha + timedelta(days=2), fechas)
+        self.assertIn(apartado, self._fechas(time(18, 0)))
+        self.assertIn(bloqueado, self._fechas(time(18, 0)))
+
+    def test_otros_salones_libres_en_la_fecha(self):
+        otra = crear_configuracion('Salón Grande', capacidad=80)
+        ocupada = crear_configuracion('Salón Ocupado', capacidad=80)
+        crear_reserva(ocupada, self.fecha, time(9, 0))
+        crear_reserva(self.config, self.fecha, time(10, 0))
+        sugerencias.indice_capacidad()
+        # Reservas, bloqueos y apartados de todos los salones (la generación sale de la caché)
+        with self.assertNumQueries(3):
+            datos = sugerencias.sugerir(self.config, self.fecha, 40, time(10, 0), '4H', 0, ventana=6)
+        self.assertEqual([s['id'] for s in datos['salones']], [otra.pk])
+
+
+class RegisterServiciosTests(ReservasTestCase):
+    """`register`: la reserva y sus servicios se guardan juntos con el precio cotizado."""
+
+    def setUp(self):
+        self.config = crear_configuracion()
+        self.fecha = proxima_fecha()
+        self.sillas = ServicioAdicional.objects.create(nombre='Sillas', precio_unitario=10)
+        self.sonido = ServicioAdicional.objects.create(nombre='Sonido', precio_unitario=50)
+        self.inactivo = ServicioAdicional.objects.create(nombre='Viejo', precio_unitario=99, activo=False)
+
+    def _post(self, **extra):
+        datos = {
+            'nombre_cliente': 'Cliente', 'email_cliente': 'cliente@example.com',
+            'telefono_cliente': '3001234567', 'num_personas': '10',
+            'fecha_evento': self.fecha.isoformat(), 'duracion_horas': '4',
+            'hora_inicio': '10:00', 'espacio_id': str(self.config.id),
+        }
+        datos.update(extra)
+        return self.client.post('/register/', datos)
+
+    def test_servicios_en_un_solo_insert_con_precio_total(self):
+        respuesta = self._post(**{
+            f'servicio_{self.sillas.pk}': '3',
+            f'servicio_{self.sonido.pk}': '1',
+            f'servicio_{self.inactivo.pk}': '2',
+            'servicio_9999': '1',
+            'servicio_abc': '1',
+        })
+        self.assertEqual(respuesta.status_code, 200)
+        reserva = Reserva.objects.get()
+        lineas = {l.servicio_id: (l.cantidad, l.subtotal) for l in reserva.servicios_adicionales.all()}
+        self.assertEqual(lineas, {self.sillas.pk: (3, 30), self.sonido.pk: (1, 50)})
+        self.assertEqual(reserva.precio_total, 200 + 30 + 50)
+
+    def test_consultas_constantes_con_mas_servicios(self):
+        servicios = [ServicioAdicional.objects.create(nombre=f'Extra {i}', precio_unitario=5) for i in range(8)]
+
+        def consultas(hora, elegidos):
+            with CaptureQueriesContext(connection) as ctx:
+                respuesta = self._post(hora_inicio=hora, **{f'servicio_{s.pk}': '1' for s in elegidos})
+            self.assertEqual(respuesta.status_code, 200)
+            return len(ctx.captured_queries)
+
+        consultas('08:30', [])  # cachés de catálogo y precios ya calientes
+        self.assertEqual(consultas('13:30', servicios[:1]), consultas('18:30', servicios))
+        self.assertEqual(ReservaServicioAdicional.objects.count(), 9)
+
+    def test_conflicto_no_deja_servicios_huerfanos(self):
+        crear_reserva(self.config, self.fecha, time(11, 0))
+        respuesta = self._post(**{f'servicio_{self.sillas.pk}': '3'})
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(Reserva.objects.count(), 1)
+        self.assertFalse(ReservaServicioAdicional.objects.exists())
+
+
+class CamposModificadosTests(ReservasTestCase):
+    """`Reserva.save` parcial: solo con instancias leídas de la BD."""
+
+    def setUp(self):
+        self.config = crear_configuracion()
+        self.fecha = proxima_fecha()
+        self.reserva = Reserva.objects.get(pk=crear_reserva(self.config, self.fecha, time(10, 0)).pk)
+
+    def test_refresh_from_db_toma_los_valores_recargados(self):
+        Reserva.objects.filter(pk=self.reserva.pk).update(precio_total=999)
+        self.reserva.refresh_from_db()
+        self.assertEqual(self.reserva.campos_modificados(), set())
+        self.assertEqual(self.reserva.valor_original('precio_total'), 999)
+
+        self.reserva.nombre_cliente = 'Pendiente'
+        Reserva.objects.filter(pk=self.reserva.pk).update(precio_total=500)
+        self.reserva.refresh_from_db(fields=['precio_total'])
+        self.assertEqual(self.reserva.campos_modificados(), {'nombre_cliente'})
+
+    def test_copia_con_pk_none_inserta(self):
+        copia = self.reserva
+        copia.pk = None
+        copia.hora_inicio = time(16, 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            copia.save()
+        self.assertEqual(Reserva.objects.count(), 2)
+        self.assertEqual(Reserva.objects.get(pk=copia.pk).hora_inicio, time(16, 0))
+
+    def test_fila_borrada_lanza_como_django(self):
+        Reserva.objects.filter(pk=self.reserva.pk).delete()
+        self.reserva.nombre_cliente = 'Otra vez'
+        with self.assertRaisesMessage(DatabaseError, 'did not affect any rows'), transaction.atomic():
+            self.reserva.save()
+        self.assertFalse(Reserva.objects.exists())
+
+    def test_instancia_nueva_guarda_entera(self):
+        reserva = crear_reserva(self.config, self.fecha, time(16, 0))
+        reserva.nombre_cliente = 'Cambio'
+        with CaptureQueriesContext(connection) as ctx:
+            reserva.save()
+        updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE "reservas_reserva"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"email_cliente"', updates[0])
+
+    def test_fila_existente_solo_escribe_lo_cambiado(self):
+        self.reserva.nombre_cliente = 'Cambio'
+        with self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as ctx:
+                self.reserva.save()
+        updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE "reservas_reserva"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"nombre_cliente"', updates[0])
+        self.assertNotIn('"email_cliente"', updates[0])
+
+
+class CotizacionTests(ReservasTestCase):
+    """`/quote/` y el motor de precios compartido (`reservas.precios`)."""
+
+    def setUp(self):
+        self.config = crear_configuracion()
+        self.sillas = ServicioAdicional.objects.create(nombre='Sillas', precio_unitario=10)
+        CodigoSocio.objects.create(codigo='S-1', nombre_socio='Socio')
+
+    def _quote(self, **params):
+        datos = {'espacio_id': str(self.config.id), 'duracion_horas': '4'}
+        datos.update(params)
+        return self.client.get('/quote/', datos)
+
+    def test_desglose_particular_con_servicios(self):
+        datos = self._quote(**{f'servicio_{self.sillas.pk}': '3', 'servicio_9999': '1'}).json()
+        self.assertEqual(datos['tipo_cliente'], 'PARTICULAR')
+        self.assertEqual(datos['precio_base'], 200)
+        self.assertEqual(datos['servicios'], [
+            {'id': self.sillas.pk, 'nombre': 'Sillas', 'cantidad': 3, 'precio_unitario': 10, 'subtotal': 30},
+        ])
+        self.assertEqual(datos['total'], 230)
+
+    def test_precio_de_socio_solo_con_codigo_valido(self):
+        self.assertEqual(self._quote(es_socio='si', socio_code='S-1').json()['total'], 100)
+        self.assertEqual(self._quote(es_socio='si', socio_code='NO').json()['total'], 200)
+
+    def test_ocho_horas_sin_precio_usa_el_de_cuatro(self):
+        self.assertEqual(self._quote(duracion_horas='8').json()['precio_base'], 200)
+
+    def test_parametros_invalidos_o_espacio_inexistente(self):
+        self.assertEqual(self._quote(espacio_id='x').status_code, 400)
+        self.assertEqual(self._quote(espacio_id='999999').status_code, 404)
+
+    def test_motor_en_memoria_sin_consultas_de_precios(self):
+        self._quote()
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self._quote().status_code, 200)
+        self.assertFalse([q for q in ctx.captured_queries if 'reservas_' in q['sql']])
+
+    def test_accion_masiva_del_admin_invalida_la_matriz(self):
+        self.assertEqual(self._quote().json()['total'], 200)
+        User.objects.create_superuser('admin', 'admin@example.com', 'clave')
+        self.client.login(username='admin', password='clave')
+        respuesta = self.client.post('/admin/reservas/configuracionsalon/', {
+            'action': 'cambiar_precios_seleccionados', '_selected_action': [self.config.pk],
+            'apply': '1', 'field_name': 'precio_particular_4h', 'precio': '350',
+        })
+        self.assertEqual(respuesta.status_code, 302)
+        self.assertEqual(self._quote().json()['total'], 350)
+
+    def test_reserva_usa_el_mismo_precio(self):
+        reserva = crear_reserva(self.config, proxima_fecha(), time(10, 0), precio_total=0)
+        self.assertEqual(reserva.precio_total, 200)
+
+
+class IndiceSociosTests(ReservasTestCase):
+    """`validate_socio_code` y `register` resuelven los códigos con `reservas.socios`."""
+
+    def setUp(self):
+        self.socio = CodigoSocio.objects.create(
+            codigo='S-1', nombre_socio='Ana', email='ana@example.com', celular='300', empresa='Club')
+        CodigoSocio.objects.create(codigo='S-2', nombre_socio='Inactivo', activo=False)
+
+    def _validar(self, code):
+        return self.client.get('/validate-socio-code/', {'code': code}).json()
+
+    def test_codigo_activo_con_datos_de_autocompletado(self):
+        datos = self._validar(' S-1 ')
+        self.assertTrue(datos['valid'])
+        self.assertEqual(datos['socio'], {
+            'nombre_socio': 'Ana', 'email': 'ana@example.com', 'celular': '300', 'empresa': 'Club'})
+        self.assertFalse(self._validar('S-2')['valid'])
+        self.assertFalse(self._validar('S-9')['valid'])
+
+    def test_consulta_estable_sin_queries(self):
+        self._validar('S-1')
+        with self.assertNumQueries(0), mock.patch.object(cache.cache, 'get') as get:
+            self.assertTrue(self._validar('S-1')['valid'])
+            self.assertFalse(self._validar('S-9')['valid'])
+        get.assert_not_called()
+
+    def test_cambio_en_otro_proceso_se_ve_al_revisar(self):
+        self.assertFalse(self._validar('S-3')['valid'])
+        # Otro proceso crea el código y sube la generación compartida
+        with mock.patch.object(cache, '_locales', {}):
+            CodigoSocio.objects.create(codigo='S-3', nombre_socio='Nuevo')
+            socios.invalidar()
+        self.assertFalse(self._validar('S-3')['valid'])
+        with mock.patch('time.monotonic', return_value=time_mod.monotonic() + cache.REVISION_LOCAL):
+            self.assertTrue(self._validar('S-3')['valid'])
+
+    def test_cambios_de_codigosocio_recargan_el_indice(self):
+        self.assertTrue(self._validar('S-1')['valid'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.socio.activo = False
+            self.socio.save()
+            CodigoSocio.objects.create(codigo='S-3', nombre_socio='Nuevo')
+        self.assertFalse(self._validar('S-1')['valid'])
+        self.assertTrue(self._validar('S-3')['valid'])
+
+    def test_indice_acotado_consulta_los_que_no_entran(self):
+        CodigoSocio.objects.create(codigo='S-0', nombre_socio='Primero')
+        with mock.patch('reservas.socios.MAX_CODIGOS', 1):
+            socios.invalidar()
+            codigos, completo = socios.indice()
+            self.assertEqual(list(codigos), ['S-0'])
+            self.assertFalse(completo)
+            self.assertTrue(self._validar('S-1')['valid'])
+            self.assertFalse(self._validar('S-9')['valid'])
+
+
+class CatalogoTests(ReservasTestCase):
+    """`reservas.catalogo`: consultas fijas y payload en caché para espacios y register."""
+
+    def setUp(self):
+        self.config = crear_configuracion('Salón A')
+        ServicioAdicional.objects.create(nombre='Sillas', precio_unitario=10)
+        ServicioAdicional.objects.create(nombre='Montaje especial', precio_unitario=10)
+
+    def _consultas_construir(self):
+        with CaptureQueriesContext(connection) as ctx:
+            datos = catalogo.construir()
+        return datos, len(ctx.captured_queries)
+
+    def test_consultas_fijas_sin_importar_los_salones(self):
+        _, una = self._consultas_construir()
+        for nombre in ('Salón B', 'Salón C', 'Salón D'):
+            crear_configuracion(nombre)
+        datos, varias = self._consultas_construir()
+        self.assertEqual(varias, una)
+        self.assertEqual(una, 3)
+        self.assertEqual(len(datos['salones']), 4)
+
+    def test_excluye_no_disponibles_y_montajes(self):
+        oculto = crear_configuracion('Salón Oculto')
+        Salon.objects.filter(pk=oculto.salon_id).update(disponible=False)
+        datos = catalogo.construir()
+        self.assertEqual([s['name'] for s in datos['salones']], ['Salón A'])
+        self.assertEqual([o['id'] for o in datos['configuraciones']], [self.config.id])
+        self.assertEqual([s['nombre'] for s in datos['servicios']], ['Sillas'])
+        self.assertIn(oculto.salon_id, datos['nombres'])
+
+    def test_paginas_desde_la_cache_e_invalidacion(self):
+        self.assertContains(self.client.get('/register/'), 'Salón A')
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertContains(self.client.get('/espacios/'), 'Salón A')
+            self.assertContains(self.client.get('/register/'), 'Salón A')
+        self.assertFalse([q for q in ctx.captured_queries if 'reservas_' in q['sql']])
+
+        salon = self.config.salon
+        salon.nombre = 'Salón Renombrado'
+        with self.captureOnCommitCallbacks(execute=True):
+            salon.save()
+        self.assertContains(self.client.get('/espacios/'), 'Salón Renombrado')
+
+
+class ManifiestoImagenesTests(ReservasTestCase):
+    """`reservas.imagenes`: static/img se recorre una vez por generación."""
+
+    def setUp(self):
+        from PIL import Image
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.img = Path(tmp.name) / 'img'
+        for carpeta in ('salon', '_responsive'):
+            (self.img / carpeta).mkdir(parents=True)
+        Image.new('RGB', (40, 30)).save(self.img / 'salon' / 'a.png')
+        Image.new('RGB', (8, 8)).save(self.img / '_responsive' / 'a-320.png')
+        (self.img / 'salon' / 'icono.svg').write_text('<svg/>')
+        (self.img / 'notas.txt').write_text('x')
+        ajustes = self.settings(STATICFILES_DIRS=[tmp.name])
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        imagenes.refrescar()
+
+    def test_entradas_con_tamano_y_dimensiones(self):
+        entradas = imagenes.manifiesto()
+        self.assertEqual(sorted(entradas), ['salon/a.png', 'salon/icono.svg'])
+        png = imagenes.info('salon/a.png')
+        self.assertEqual((png.ancho, png.alto), (40, 30))
+        self.assertEqual(png.tamano, (self.img / 'salon' / 'a.png').stat().st_size)
+        self.assertIsNone(imagenes.info('salon/icono.svg').ancho)
+
+    def test_sin_tocar_el_disco_hasta_refrescar(self):
+        imagenes.manifiesto()
+        (self.img / 'salon' / 'b.png').write_bytes(b'')
+        with mock.patch.object(Path, 'rglob') as rglob:
+            self.assertFalse(imagenes.existe('salon/b.png'))
+        rglob.assert_not_called()
+        call_command('refrescar_imagenes', stdout=StringIO())
+        self.assertTrue(imagenes.existe('salon/b.png'))
+
+    def test_consultas_repetidas_sin_leer_la_cache(self):
+        imagenes.manifiesto()
+        with self.assertNumQueries(0), mock.patch.object(cache.cache, 'get') as get:
+            for _ in range(7):
+                self.assertTrue(imagenes.existe('salon/a.png'))
+                self.assertIsNotNone(imagenes.info('salon/a.png'))
+        get.assert_not_called()
+
+    def test_get_salon_images_filtra_con_el_manifiesto(self):
+        from .views import get_salon_images
+
+        salon = Salon(nombre='Salón X', imagen='salon/a.png, salon/borrada.png')
+        self.assertEqual(get_salon_images(salon), ['salon/a.png'])
+
+
+class GetCondicionalTests(ReservasTestCase):
+    """`reservas.condicional`: ETag por generación de datos y 304 sin consultar la base."""
+
+    def setUp(self):
+        self.config = crear_configuracion()
+        self.url_bloqueos = f'/get-bloqueos-salon/?salon_id={self.config.salon_id}'
+
+    def test_validadores_y_304_sin_consultas(self):
+        respuesta = self.client.get('/espacios/')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta.has_header('Last-Modified'))
+        self.assertIn('no-cache', respuesta['Cache-Control'])
+        self.assertIn('public', respuesta['Cache-Control'])
+        with self.assertNumQueries(0), mock.patch.object(cache.cache, 'add') as add:
+            repetida = self.client.get('/espacios/', HTTP_IF_NONE_MATCH=respuesta['ETag'])
+        self.assertEqual(repetida.status_code, 304)
+        add.assert_not_called()
+
+    def test_cambio_de_datos_cambia_el_etag(self):
+        etag = self.client.get(self.url_bloqueos)['ETag']
+        self.assertEqual(self.client.get(self.url_bloqueos, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            BloqueoEspacio.objects.create(salon=self.config.salon, fecha_inicio=proxima_fecha(),
+                                          fecha_fin=proxima_fecha(), motivo='MANTENIMIENTO')
+        respuesta = self.client.get(self.url_bloqueos, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta['ETag'], etag)
+        self.assertEqual(len(respuesta.json()['bloqueos']), 1)
+
+    def test_reserva_nueva_invalida_la_disponibilidad(self):
+        url = f'/check-availability/?fecha={proxima_fecha().isoformat()}'
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            crear_reserva(self.config, proxima_fecha(), time(10, 0))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_paginas_sin_validadores_para_usuarios_con_sesion(self):
+        self.client.force_login(User.objects.create_user('staff', password='x', is_staff=True))
+        self.assertFalse(self.client.get('/espacios/').has_header('ETag'))
+        calendario = self.client.get('/get-calendar-events/')
+        self.assertTrue(calendario.has_header('ETag'))
+        self.assertIn('private', calendario['Cache-Control'])
+
+
+class PaginasCacheTests(ReservasTestCase):
+    """`PaginaCacheMiddleware`: páginas `TemplateView` con cuerpos ya comprimidos."""
+
+    url = '/bienvenidos/vision/'
+
+    def test_guarda_y_sirve_la_variante_negociada(self):
+        primera = self.client.get(self.url)
+        self.assertEqual(primera.status_code, 200)
+        with mock.patch('reservas.paginas.TemplateView.get') as vista:
+            gzip_ = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+            plano = self.client.get(self.url, HTTP_ACCEPT_ENCODING='identity')
+        vista.assert_not_called()
+        self.assertEqual(gzip_['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', gzip_['Vary'])
+        self.assertEqual(gzip.decompress(gzip_.content), primera.content)
+        self.assertFalse(plano.has_header('Content-Encoding'))
+        self.assertEqual(plano.content, primera.content)
+        self.assertEqual(
+            self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=gzip_['ETag']).status_code,
+            304)
+
+    def test_no_aplica_con_sesion_o_query_string(self):
+        self.client.get(self.url)
+        self.client.force_login(User.objects.create_user('staff', password='x', is_staff=True))
+        with mock.patch('reservas.paginas.cache.get') as get:
+            self.client.get(self.url)
+            Client().get(self.url + '?x=1')
+        get.assert_not_called()
+
+    def test_negociacion(self):
+        disponibles = {'identity', 'gzip', 'br'}
+        self.assertEqual(paginas.negociar('gzip, br', disponibles), 'br')
+        self.assertEqual(paginas.negociar('br;q=0, gzip', disponibles), 'gzip')
+        self.assertEqual(paginas.negociar('*', {'identity', 'gzip'}), 'gzip')
+        self.assertEqual(paginas.negociar('', disponibles), 'identity')
+
+    def test_brotli_con_calidad_de_request(self):
+        with mock.patch.object(paginas, 'brotli') as brotli:
+            brotli.compress.return_value = b'br'
+            variantes = paginas._comprimir(b'<html></html>')
+        self.assertEqual(variantes['br'], b'br')
+        self.assertEqual(brotli.compress.call_args.kwargs['quality'], paginas.CALIDAD_BROTLI)
+        self.assertLess(paginas.CALIDAD_BROTLI, 11)
+
+
+class ComunicadosCursorTests(ReservasTestCase):
+    """`comunicados` paginado por cursor sobre (publicado desc, id desc)."""
+
+    def setUp(self):
+        base = timezone.now()
+        fechas = [base - timedelta(days=d % 7) for d in range(18)] + [None] * 5
+        for i, fecha in enumerate(fechas):
+            Comunicado.objects.create(titulo=f'C{i}', publicado=fecha, activo=i != 3)
+        self.esperados = list(
+            Comunicado.objects.filter(activo=True)
+            .order_by(F('publicado').desc(nulls_last=True), '-id').values_list('id', flat=True)
+        )
+
+    def test_paginas_recorren_todo_en_orden_sin_repetir(self):
+        vistos, cursor = [], None
+        while True:
+            pagina = contenido.pagina_comunicados(cursor)
+            self.assertLessEqual(len(pagina['comunicados']), contenido.POR_PAGINA)
+            vistos += [c['id'] for c in pagina['comunicados']]
+            cursor = pagina['siguiente']
+            if cursor is None:
+                break
+        self.assertEqual(vistos, self.esperados)
+
+    def test_vista_sigue_el_cursor_y_uno_invalido_vuelve_al_inicio(self):
+        primera = contenido.pagina_comunicados()
+        respuesta = self.client.get('/comunicados/', {'despues': primera['siguiente']})
+        self.assertEqual(respuesta.status_code, 200)
+        ids = [c['id'] for c in respuesta.context['comunicados']]
+        self.assertEqual(ids, self.esperados[contenido.POR_PAGINA:2 * contenido.POR_PAGINA])
+        self.assertEqual(contenido.pagina_comunicados('basura'), primera)
+
+    def test_indice_en_el_orden_de_la_consulta(self):
+        with connection.cursor() as cursor:
+            restricciones = connection.introspection.get_constraints(cursor, Comunicado._meta.db_table)
+        self.assertEqual(restricciones['comunicado_pub_id_desc_idx']['orders'], ['DESC', 'DESC'])
+
+
+class SpriteMontajesTests(ReservasTestCase):
+    """Íconos de montaje servidos desde el sprite estático versionado."""
+
+    def test_sprite_versionado_esta_al_dia(self):
+        call_command('generar_sprite_montajes', check=True, stdout=StringIO())
+
+    def test_tag_referencia_el_simbolo_del_sprite(self):
+        html = Template(
+            '{% load montaje_icons %}{% montaje_icon "Mesa en U" %}{% montaje_icon "???" %}'
+        ).render(Context())
+        version = hashlib.sha1(montaje_icons.sprite().encode()).hexdigest()[:12]
+        self.assertIn(f'montajes-sprite.svg?v={version}#montaje-mesa-u"', html)
+        self.assertIn('#montaje-generico"', html)
+        self.assertNotIn('<path', html)
+        for simbolo in re.findall(r'#(montaje-[a-z0-9-]+)"', html):
+            self.assertIn(f'<symbol id="{simbolo}"', montaje_icons.sprite())
+
+    def test_inline_dibuja_sin_sprite(self):
+        html = montaje_icons.montaje_icon_inline('AUDITORIO')
+        self.assertNotIn('<use', html)
+        self.assertIn(montaje_icons._dibujo('AUDITORIO'), html)
+
+    def test_comando_detecta_y_regenera_un_sprite_viejo(self):
+        with tempfile.TemporaryDirectory() as tmp, self.settings(STATICFILES_DIRS=[tmp]):
+            ruta = Path(tmp) / montaje_icons.SPRITE
+            ruta.parent.mkdir(parents=True)
+            ruta.write_text('<svg/>')
+            with self.assertRaises(CommandError):
+                call_command('generar_sprite_montajes', check=True, stdout=StringIO())
+            call_command('generar_sprite_montajes', stdout=StringIO())
+            self.assertEqual(ruta.read_text(), montaje_icons.sprite())
+
+
+class CdnImgTests(ReservasTestCase):
+    """`cdn_img`: srcset y dimensiones del `<img>` en Cloudinary y en local."""
+
+    def setUp(self):
+        from PIL import Image
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.img = Path(tmp.name) / 'img'
+        (self.img / 'salon').mkdir(parents=True)
+        Image.new('RGB', (1600, 900)).save(self.img / 'salon' / 'a.png')
+        ajustes = self.settings(STATICFILES_DIRS=[tmp.name], CLOUDINARY_CLOUD_NAME='demo')
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        imagenes.refrescar()
+
+    def _render(self, args, cloudinary=True):
+        with self.settings(CLOUDINARY_ENABLED=cloudinary):
+            return Template('{% load cdn_tags %}{% cdn_img ' + args + ' %}').render(Context())
+
+    def _con_variantes(self):
+        variantes_ = [
+            {'formato': f, 'ancho': a, 'alto': a * 9 // 16, 'ruta': variantes.ruta_variante('salon/a.png', a, f)}
+            for f in ('avif', 'webp') for a in (480, 800)
+        ]
+        ruta = variantes.ruta_manifiesto()
+        ruta.parent.mkdir(parents=True)
+        ruta.write_text(json.dumps({'version': 1, 'imagenes': {'salon/a.png': {
+            'hash': 'x', 'ancho': 1600, 'alto': 900, 'bytes': 1, 'variantes': variantes_}}}))
+        imagenes.refrescar()
+
+    def test_cloudinary_con_dimensiones_del_src(self):
+        html = self._render("'img/salon/a.png' max_width=800 alt='Salón'")
+        url = 'https://res.cloudinary.com/demo/image/upload/c_limit,w_800,f_auto,q_auto/img/salon/a'
+        self.assertIn(f'src="{url}"', html)
+        self.assertIn('c_limit,w_480,f_auto,q_auto/img/salon/a 480w', html)
+        self.assertIn('width="800" height="450"', html)
+        self.assertIn('alt="Salón"', html)
+
+    def test_cloudinary_usa_el_manifiesto_de_variantes(self):
+        self._con_variantes()
+        (self.img / 'salon' / 'a.png').unlink()
+        imagenes.refrescar()
+        self.assertIn('width="1600" height="900"', self._render("'img/salon/a.png'"))
+
+    def test_cloudinary_sin_dimensiones_con_recorte_o_imagen_desconocida(self):
+        self.assertNotIn('width=', self._render("'img/salon/a.png' crop='c_fill,ar_1:1'"))
+        html = self._render("'img/salon/otra.png'")
+        self.assertNotIn('width=', html)
+        self.assertIn(f'w_{variantes.ANCHOS[-1]},f_auto', html)
+
+    def test_local_con_variantes_emite_picture(self):
+        self._con_variantes()
+        html = self._render("'img/salon/a.png' max_width=480", cloudinary=False)
+        self.assertTrue(html.startswith('<picture><source type="image/avif"'))
+        self.assertIn('a.png-480w.avif 480w', html)
+        self.assertIn('a.png-800w.webp 800w', html)
+        self.assertIn('width="1600" height="900"', html)
+
+    def test_carrusel_memoizado_sin_leer_la_cache(self):
+        plantilla = Template('{% load cdn_tags %}' + ''.join(
+            "{% cdn_img 'img/salon/a.png' max_width=" + str(a) + " %}" for a in (480, 800, 1200, 1600)))
+        with self.settings(CLOUDINARY_ENABLED=True):
+            primera = plantilla.render(Context())
+            with self.assertNumQueries(0), mock.patch.object(cache.cache, 'get') as get, \
+                    mock.patch.object(imagenes, 'info') as info:
+                self.assertEqual(plantilla.render(Context()), primera)
+        get.assert_not_called()
+        info.assert_not_called()
+
+    def test_local_sin_variantes(self):
+        html = self._render("'img/salon/a.png'", cloudinary=False)
+        self.assertNotIn('srcset', html)
+        self.assertIn('width="1600" height="900"', html)
+
+
+class VariantesTests(ReservasTestCase):
+    """`reservas.variantes.construir`: variantes incrementales y su manifiesto."""
+
+    def setUp(self):
+        from PIL import Image
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.base = Path(tmp.name)
+        (self.base / 'salon').mkdir()
+        self.original = self.base / 'salon' / 'a.png'
+        Image.new('RGB', (1000, 500), 'red').save(self.original)
+
+    def _construir(self, **kwargs):
+        return variantes.construir(self.base, procesos=1, formatos=('webp',), **kwargs)
+
+    def test_una_variante_por_ancho_con_el_original_como_tope(self):
+        resumen = self._construir()
+        self.assertEqual(resumen['procesadas'], 1)
+        entrada = variantes.leer_manifiesto(self.base)['imagenes']['salon/a.png']
+        self.assertEqual((entrada['ancho'], entrada['alto']), (1000, 500))
+        self.assertEqual([(v['ancho'], v['alto']) for v in entrada['variantes']],
+                         [(480, 240), (800, 400), (1000, 500)])
+        for v in entrada['variantes']:
+            self.assertEqual((self.base / v['ruta']).stat().st_size, v['bytes'])
+
+    def test_incremental_por_hash_y_limpieza_de_obsoletas(self):
+        self._construir()
+        segunda = self._construir()
+        self.assertEqual((segunda['procesadas'], segunda['sin_cambios']), (0, 1))
+
+        from PIL import Image
+        Image.new('RGB', (600, 300), 'blue').save(self.original)
+        tercera = self._construir()
+        self.assertEqual(tercera['procesadas'], 1)
+        # 800w y 1000w ya no existen para un original de 600px
+        self.assertEqual(tercera['eliminadas'], 2)
+        self.assertFalse((self.base / variantes.ruta_variante('salon/a.png', 800)).exists())
+        self.assertTrue((self.base / variantes.ruta_variante('salon/a.png', 600)).exists())
+
+        self.original.unlink()
+        cuarta = self._construir()
+        self.assertEqual(cuarta['imagenes'], {})
+        self.assertEqual(list((self.base / imagenes.DIR_VARIANTES).rglob('*.webp')), [])
+
+    def test_imagen_danada_no_frena_las_demas(self):
+        (self.base / 'rota.png').write_bytes(b'no es una imagen')
+        errores = []
+        with self.assertLogs('reservas.variantes', 'ERROR'):
+            resumen = self._construir(al_procesar=lambda rel, entrada, error: error and errores.append(rel))
+        self.assertEqual(resumen['errores'], ['rota.png'])
+        self.assertEqual(errores, ['rota.png'])
+        self.assertIn('salon/a.png', resumen['imagenes'])
+
+
+class _CloudinaryFalso(BaseHTTPRequestHandler):
+    """API de Cloudinary mínima: `subir` responde 429 mientras queden `limitadas`
+    para ese public_id y 500 para los de `rotas`; `resources` usa `etags`."""
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status, datos):
+        cuerpo = json.dumps(datos).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def do_GET(self):
+        public_id = unquote(self.path.split('/resources/image/upload/', 1)[-1].split('?')[0])
+        etag = self.server.etags.get(public_id)
+        if etag is None:
+            self._json(404, {'error': {'message': f'Resource not found - {public_id}'}})
+        else:
+            self._json(200, {'public_id': public_id, 'etag': etag})
+
+    def do_POST(self):
+        cuerpo = self.rfile.read(int(self.headers['Content-Length']))
+        public_id = re.search(rb'name="public_id"\r\n\r\n([^\r]+)', cuerpo).group(1).decode()
+        srv = self.server
+        with srv.lock:
+            srv.subidas.append((public_id, time_mod.monotonic()))
+            limitada = srv.limitadas.get(public_id, 0)
+            if limitada:
+                srv.limitadas[public_id] = limitada - 1
+        if limitada:
+            self._json(429, {'error': {'message': 'Rate Limit Exceeded'}})
+        elif public_id in srv.rotas:
+            self._json(500, {'error': {'message': 'General Error'}})
+        else:
+            self._json(200, {'public_id': public_id, 'version': 7})
+
+
+class SubidaCloudinaryTests(ReservasTestCase):
+    """`upload_static_to_cloudinary` contra un servidor HTTP local."""
+
+    def setUp(self):
+        import cloudinary
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name) / 'img'
+        self.root.mkdir()
+        for nombre in ('a', 'b'):
+            (self.root / f'{nombre}.png').write_bytes(nombre.encode() * 64)
+        self.estado = Path(tmp.name) / 'estado.json'
+
+        self.servidor = ThreadingHTTPServer(('127.0.0.1', 0), _CloudinaryFalso)
+        self.servidor.lock = threading.Lock()
+        self.servidor.subidas, self.servidor.limitadas = [], {}
+        self.servidor.rotas, self.servidor.etags = set(), {}
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+        self.addCleanup(self.servidor.server_close)
+        self.addCleanup(self.servidor.shutdown)
+
+        config = cloudinary.config()
+        anterior = {k: getattr(config, k, None) for k in ('cloud_name', 'api_key', 'api_secret', 'upload_prefix')}
+        self.addCleanup(lambda: cloudinary.config(**anterior))
+        entorno = mock.patch.dict(os.environ, {
+            'CLOUDINARY_CLOUD_NAME': 'demo', 'CLOUDINARY_API_KEY': 'k', 'CLOUDINARY_API_SECRET': 's',
+        })
+        entorno.start()
+        self.addCleanup(entorno.stop)
+
+    def _subir(self, *args):
+        salida = StringIO()
+        call_command(
+            'upload_static_to_cloudinary', f'--root={self.root}', f'--estado={self.estado}',
+            f'--api-url=http://127.0.0.1:{self.servidor.server_port}', '--concurrencia=2', *args,
+            stdout=salida, stderr=StringIO(),
+        )
+        return salida.getvalue()
+
+    def _subidos(self):
+        return [public_id for public_id, _ in self.servidor.subidas]
+
+    def test_reintenta_429_con_espera_creciente(self):
+        self.servidor.limitadas['img/a'] = 2
+        with self.assertLogs('reservas.subidas_cloudinary', 'WARNING'):
+            salida = self._subir()
+        self.assertIn('uploaded=2 skipped=0 failed=0', salida)
+        intentos = [t for public_id, t in self.servidor.subidas if public_id == 'img/a']
+        self.assertEqual(len(intentos), 3)
+        # Espera base 1s con jitter de 0.5x a 1x: >= 0.5s y luego >= 1s
+        self.assertGreaterEqual(intentos[1] - intentos[0], 0.5)
+        self.assertGreaterEqual(intentos[2] - intentos[1], 1.0)
+
+    def test_reanuda_desde_el_estado(self):
+        self.servidor.rotas.add('img/b')
+        self.assertIn('uploaded=1 skipped=0 failed=1', self._subir())
+        self.assertEqual(set(json.loads(self.estado.read_text())), {'img/a'})
+
+        self.servidor.rotas.clear()
+        self.servidor.subidas.clear()
+        self.assertIn('uploaded=1 skipped=1 failed=0', self._subir())
+        self.assertEqual(self._subidos(), ['img/b'])
+        self.assertEqual(json.loads(self.estado.read_text())['img/b']['version'], 7)
+
+    def test_dry_run_no_escribe_el_estado(self):
+        self.servidor.etags['img/a'] = subidas_cloudinary.md5_archivo(self.root / 'a.png')
+        salida = self._subir('--dry-run')
+        self.assertIn('skip (igual en Cloudinary): img/a', salida)
+        self.assertEqual(self._subidos(), [])
+        self.assertFalse(self.estado.exists())
+
+    def test_concurrencia_por_defecto_del_entorno(self):
+        with mock.patch.dict(os.environ, {'CLOUDINARY_UPLOAD_CONCURRENCY': '3'}):
+            salida = StringIO()
+            call_command('upload_static_to_cloudinary', f'--root={self.root}', f'--estado={self.estado}',
+                         '--dry-run', f'--api-url=http://127.0.0.1:{self.servidor.server_port}', stdout=salida)
+        self.assertIn('concurrencia=3', salida.getvalue())
+
+
+class SubidasSalonTests(ReservasTestCase):
+    """Cola de `SubidaImagen`: el worker del mismo host publica lo que el admin dejó en static/img."""
+
+    def setUp(self):
+        from PIL import Image
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        ajustes = self.settings(STATICFILES_DIRS=[tmp.name])
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        entorno = mock.patch.dict(os.environ, {'CLOUDINARY_API_KEY': ''})
+        entorno.start()
+        self.addCleanup(entorno.stop)
+
+        self.salon = Salon.objects.create(nombre='Salón Fotos')
+        png = BytesIO()
+        Image.new('RGB', (32, 16)).save(png, 'PNG')
+        self.bytes = png.getvalue()
+
+    def _encolar(self):
+        creadas, errores = subidas.encolar(self.salon, [SimpleUploadedFile('foto 1.png', self.bytes)])
+        self.assertEqual(errores, [])
+        return SubidaImagen.objects.get(pk=creadas[0].pk)
+
+    def test_encolar_guarda_el_archivo(self):
+        subida = self._encolar()
+        self.assertEqual(subida.archivo, 'salon_salon-fotos/foto_1.png')
+        self.assertEqual(subida.estado, 'PENDIENTE')
+        self.assertEqual((imagenes.directorio_img() / subida.archivo).read_bytes(), self.bytes)
+
+    def test_worker_publica_con_las_variantes_junto_al_original(self):
+        subida = self._encolar()
+        resumen = subidas.procesar_lote(concurrencia=1)
+        self.assertEqual(resumen['listas'], 1)
+        subida.refresh_from_db()
+        self.assertEqual(subida.estado, 'LISTA')
+        self.assertFalse(subida.subida_cloudinary)
+        entrada = variantes.manifiesto()[subida.archivo]
+        self.assertEqual(subida.variantes, len(entrada['variantes']))
+        for v in entrada['variantes']:
+            self.assertTrue((imagenes.directorio_img() / v['ruta']).is_file())
+        self.salon.refresh_from_db()
+        self.assertEqual(self.salon.imagen, subida.archivo)
+        self.assertTrue(imagenes.existe(subida.archivo))
+
+    def test_sin_archivo_se_reintenta(self):
+        subida = self._encolar()
+        (imagenes.directorio_img() / subida.archivo).unlink()
+        with self.assertLogs('reservas.subidas', 'ERROR'):
+            resumen = subidas.procesar_lote(concurrencia=1)
+        self.assertEqual(resumen['reintentar'], 1)
+        subida.refresh_from_db()
+        self.assertEqual(subida.estado, 'PENDIENTE')
+        self.assertIn('No existe', subida.error)
+
+
+class BandejaSalidaTests(ReservasTestCase):
+    """Bandeja de salida: un correo enviado no vuelve a la cola."""
+
+    def setUp(self):
+        ajustes = self.settings(DEFAULT_FROM_EMAIL='club@example.com')
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.reserva = crear_reserva(crear_configuracion(), proxima_fecha(), time(8, 0))
+        EmailOutbox.objects.all().delete()
+        EmailLog.objects.all().delete()
+
+    def _encolar(self, reserva=None):
+        return bandeja_salida.encolar('Asunto', 'Texto', None, ['destino@example.com'], reserva=reserva)
+
+    def test_despachar_respeta_el_ajuste(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            bandeja_salida.despachar()
+        self.assertEqual(callbacks, [])
+        with self.settings(EMAIL_OUTBOX_EN_PROCESO=True), self.captureOnCommitCallbacks() as callbacks:
+            bandeja_salida.despachar()
+        self.assertEqual(len(callbacks), 1)
+
+    def test_tomar_reclama_el_lote_con_un_update(self):
+        for _ in range(50):
+            self._encolar()
+        with CaptureQueriesContext(connection) as ctx:
+            tomados = bandeja_salida.tomar(limite=50)
+        updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(len(tomados), 50)
+        self.assertEqual({(c.status, c.attempts) for c in tomados}, {('ENVIANDO', 1)})
+        self.assertEqual(bandeja_salida.tomar(limite=50), [])
+
+    def test_reserva_borrada_durante_el_envio(self):
+        correo = self._encolar(self.reserva)
+        pk = self.reserva.pk
+
+        def enviar(backend, mensajes):
+            Reserva.objects.filter(pk=pk).delete()
+            return len(mensajes)
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', autospec=True, side_effect=enviar):
+            resumen = bandeja_salida.enviar_lote()
+        self.assertEqual(resumen['enviados'], 1)
+        correo.refresh_from_db()
+        self.assertEqual(correo.status, 'ENVIADO')
+        log = EmailLog.objects.get()
+        self.assertTrue(log.success)
+        self.assertIsNone(log.reserva_id)
+
+    def test_error_registrando_no_reenvia(self):
+        correo = self._encolar(self.reserva)
+        with mock.patch.object(EmailLog.objects, 'bulk_create', side_effect=DatabaseError('sin espacio')), \
+                self.assertLogs('reservas.bandeja_salida', 'ERROR'):
+            bandeja_salida.enviar_lote()
+        correo.refresh_from_db()
+        self.assertEqual(correo.status, 'ENVIADO')
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(bandeja_salida.enviar_lote(), Counter())
+        self.assertEqual(len(mail.outbox), 1)
+
+    def _comando(self, *args, **kwargs):
+        # close_old_connections cerraría la conexión de la transacción del test
+        with mock.patch('reservas.management.commands.procesar_correos.close_old_connections'):
+            call_command('procesar_correos', *args, **kwargs)
+
+    def test_worker_sigue_tras_un_lote_fallido(self):
+        err = StringIO()
+        with mock.patch.object(bandeja_salida, 'enviar_lote', side_effect=[DatabaseError('caída'), KeyboardInterrupt]) as lote, \
+                self.assertLogs('reservas.management.commands.procesar_correos', 'ERROR'):
+            self._comando('--intervalo', '0', stdout=StringIO(), stderr=err)
+        self.assertEqual(lote.call_count, 2)
+        self.assertIn('caída', err.getvalue())
+
+    def test_una_vez_termina_sin_propagar_el_error(self):
+        out = StringIO()
+        with mock.patch.object(bandeja_salida, 'enviar_lote', side_effect=DatabaseError('caída')), \
+                self.assertLogs('reservas.management.commands.procesar_correos', 'ERROR'):
+            self._comando('--una-vez', stdout=out, stderr=StringIO())
+        self.assertIn('Bandeja de salida procesada', out.getvalue())
+
+    def test_reserva_de_socio_notifica_al_codigo_socio(self):
+        CodigoSocio.objects.create(codigo='S-1', nombre_socio='Ana Socia', email='ana@example.com')
+        reserva = crear_reserva(
+            self.reserva.configuracion_salon, proxima_fecha(), time(14, 0),
+            tipo_cliente='SOCIO', email_cliente='ANA@example.com')
+        correo = EmailOutbox.objects.get(to_email='ana@example.com')
+        self.assertEqual(correo.subject, f'Notificación de Reserva Socio #{reserva.pk} - Ana Socia')
+        EmailOutbox.objects.exclude(pk=correo.pk).delete()
+        bandeja_salida.enviar_lote()
+        self.assertIn('Hola Ana Socia', mail.outbox[0].body)
+
+    def test_accion_admin_encola_la_notificacion_manual(self):
+        admin_socios = SocioAdmin(CodigoSocio, AdminSite())
+        socio = SimpleNamespace(pk=1, nombre='Ana', email='ana@example.com')
+        queryset = mock.MagicMock()
+        queryset.__iter__.return_value = iter([socio])
+        queryset.count.return_value = 1
+        with mock.patch.object(admin_socios, 'message_user') as mensaje:
+            admin_socios.enviar_notificacion_manual(mock.Mock(), queryset)
+        self.assertIn('1 notificación(es)', mensaje.call_args[0][1])
+        self.assertTrue(EmailOutbox.objects.filter(to_email='ana@example.com').exists())
+
+
+class CorreosRenderTests(ReservasTestCase):
+    """Un correo que no se puede renderizar se reintenta; nunca sale vacío."""
+
+    def setUp(self):
+        ajustes = self.settings(DEFAULT_FROM_EMAIL='club@example.com')
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.reserva = crear_reserva(crear_configuracion(), proxima_fecha(), time(8, 0))
+        EmailOutbox.objects.all().delete()
+
+    def _encolar(self, template_txt='reservas/emails/reserva_cliente.txt'):
+        from .emails import send_email_async
+
+        return send_email_async(
+            'Asunto', template_txt, 'reservas/emails/reserva_cliente.html',
+            {'reserva': self.reserva, 'cliente': 'Cliente'}, ['destino@example.com'])
+
+    def _enviar_con_error(self):
+        with self.assertLogs('reservas.bandeja_salida', 'ERROR'):
+            return bandeja_salida.enviar_lote()
+
+    def test_render_una_vez_al_enviar(self):
+        correo = self._encolar()
+        self.assertEqual(correo.body_text, '')
+        bandeja_salida.enviar_lote()
+        correo.refresh_from_db()
+        self.assertEqual(correo.status, 'ENVIADO')
+        log = EmailLog.objects.get(subject='Asunto')
+        self.assertEqual(mail.outbox[0].body, log.texto)
+        self.assertIn(str(self.reserva.pk), log.texto)
+
+    def test_renderizar_propaga_errores_de_plantilla(self):
+        from django.template import TemplateDoesNotExist
+
+        with self.assertRaises(TemplateDoesNotExist):
+            correos.renderizar('Asunto', 'reservas/emails/no_existe.txt', '', {})
+
+    def test_restaurar_contexto_sin_el_objeto(self):
+        datos = correos.serializar_contexto({'reserva': self.reserva})
+        self.reserva.delete()
+        with self.assertRaises(Reserva.DoesNotExist):
+            correos.restaurar_contexto(datos)
+
+    def test_plantilla_rota_se_reintenta(self):
+        correo = self._encolar('reservas/emails/no_existe.txt')
+        self.assertEqual(self._enviar_con_error()['reintentar'], 1)
+        correo.refresh_from_db()
+        self.assertEqual(correo.status, 'PENDIENTE')
+        self.assertIn('TemplateDoesNotExist', correo.last_error)
+        self.assertEqual(mail.outbox, [])
+
+    def test_reserva_borrada_termina_en_error(self):
+        correo = self._encolar()
+        self.reserva.delete()
+        EmailOutbox.objects.filter(pk=correo.pk).update(attempts=bandeja_salida.MAX_INTENTOS - 1)
+        self.assertEqual(self._enviar_con_error()['errores'], 1)
+        correo.refresh_from_db()
+        self.assertEqual(correo.status, 'ERROR')
+        self.assertIn('DoesNotExist', correo.last_error)
+        self.assertEqual(mail.outbox, [])
+        log = EmailLog.objects.get(subject='Asunto')
+        self.assertFalse(log.success)
+
+
+class EmailBodyTests(ReservasTestCase):
+    """Cuerpos deduplicados: la bandeja no los repite y la depuración no borra uno en uso."""
+
+    def test_correo_enviado_deja_el_cuerpo_solo_en_el_log(self):
+        with self.settings(DEFAULT_FROM_EMAIL='club@example.com'):
+            correo = bandeja_salida.encolar('Asunto', 'Texto', '<p>Texto</p>', ['destino@example.com'])
+            EmailOutbox.objects.filter(pk=correo.pk).update(context={'cliente': 'Ana'})
+            bandeja_salida.enviar_lote()
+        correo.refresh_from_db()
+        self.assertEqual(correo.status, 'ENVIADO')
+        self.assertEqual((correo.body_text, correo.body_html, correo.context), ('', None, {}))
+        log = EmailLog.objects.get()
+        self.assertEqual((log.texto, log.html), ('Texto', '<p>Texto</p>'))
+
+    def test_guardar_bloquea_los_cuerpos_existentes(self):
+        EmailBody.guardar(['Hola'])
+        with mock.patch.object(EmailBody.objects, 'select_for_update', wraps=EmailBody.objects.select_for_update) as sfu:
+            EmailLog.objects.create(to_email='a@example.com', body_text='Hola')
+        sfu.assert_called_once_with()
+        self.assertEqual(EmailLog.objects.get().texto, 'Hola')
+
+    def test_depuracion_no_borra_un_cuerpo_tomado_mientras_tanto(self):
+        EmailBody.guardar(['Hola', 'Suelto'])
+        original = EmailBody.objects.select_for_update
+
+        def bloquear():
+            # Otro proceso confirma un log con el cuerpo justo antes del bloqueo
+            EmailLog.objects.create(to_email='a@example.com', text_body_id=EmailBody.clave('Hola'))
+            return original()
+
+        with mock.patch.object(EmailBody.objects, 'select_for_update', side_effect=bloquear):
+            call_command('depurar_email_logs', '--dias', '0', stdout=StringIO())
+        self.assertEqual(list(EmailBody.objects.values_list('hash', flat=True)), [EmailBody.clave('Hola')])
+        self.assertEqual(EmailLog.objects.get().texto, 'Hola')
@@ -10,6 +10,11 @@ urlpatterns = [
     path('register/', views.register, name='register'),
     path('check-availability/', views.check_availability, name='check_availability'),
     path('get-bloqueos-salon/', views.get_bloqueos_salon, name='get_bloqueos_salon'),
+    path('availability-range/', views.availability_range, name='availability_range'),
+    path('suggest-alternatives/', views.suggest_alternatives, name='suggest_alternatives'),
+    path('quote/', views.quote, name='quote'),
+    path('hold/', views.hold_create, name='hold_create'),
+    path('hold/liberar/', views.hold_release, name='hold_release'),
     path('preguntas-frecuentes/', views.preguntas_frecuentes, name='preguntas_frecuentes'),
     path('politicas/', views.politicas, name='politicas'),
     path('validate-socio-code/', views.validate_socio_code, name='validate_socio_code'),
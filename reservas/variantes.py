@@ -0,0 +1,253 @@
+"""
+Variantes responsive (AVIF + WebP a varios anchos) de las imágenes de `static/img`.
+
+`construir()` recorre `static/img` y, para cada imagen nueva o modificada,
+genera en `static/img/_responsive/` una copia por ancho de `ANCHOS` menor
+que el original (más una al ancho original) en cada formato. El trabajo de
+Pillow se reparte en un pool de procesos.
+
+El resultado se describe en `static/img/_responsive/manifest.json`:
+
+    {"version": 1, "imagenes": {"tenis/tenis1.avif": {
+        "hash": "<sha256 del original>", "ancho": 300, "alto": 206, "bytes": 12944,
+        "variantes": [{"formato": "webp", "ancho": 300, "alto": 206,
+                       "ruta": "_responsive/tenis/tenis1.avif-300w.webp", "bytes": 9100}, ...]}}}
+
+Una imagen cuyo hash coincide con el del manifiesto (y cuyas variantes
+siguen en disco) no se vuelve a procesar. El tag `cdn_img` lee el manifiesto
+(`manifiesto()`, memoizado por la generación 'imagenes', revisada con
+`generacion_local`) para armar el `srcset` cuando Cloudinary está
+desactivado.
+"""
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from .cache import generacion_local
+from .imagenes import DIR_VARIANTES, directorio_img
+
+
+logger = logging.getLogger(__name__)
+
+# Anchos (px) de las variantes y candidatos del srcset de `cdn_img`
+ANCHOS = (480, 800, 1200, 1600)
+
+FORMATOS = ('avif', 'webp')
+
+CALIDAD = {'avif': 55, 'webp': 80}
+
+ARCHIVO_MANIFIESTO = 'manifest.json'
+
+# Formatos de origen que se procesan (svg/gif se sirven tal cual)
+ORIGENES = {'.jpg', '.jpeg', '.png', '.webp', '.avif'}
+
+# (generación, manifiesto) por proceso
+_manifiesto = None
+
+
+def ruta_variante(rel, ancho, formato='webp'):
+    """Variante de una imagen, relativa a static/img.
+
+    'tenis/tenis1.avif', 800 -> '_responsive/tenis/tenis1.avif-800w.webp'
+
+    Conserva la extensión del original: 'carru2.png' y 'carru2.webp' no
+    comparten variantes.
+    """
+    return f"{DIR_VARIANTES}/{rel}-{ancho}w.{formato}"
+
+
+def ruta_manifiesto(base=None):
+    return (Path(base) if base else directorio_img()) / DIR_VARIANTES / ARCHIVO_MANIFIESTO
+
+
+def leer_manifiesto(base=None):
+    """Manifiesto en disco ({'version', 'imagenes'}); vacío si no existe o está dañado."""
+    try:
+        datos = json.loads(ruta_manifiesto(base).read_text(encoding='utf-8'))
+        if isinstance(datos.get('imagenes'), dict):
+            return datos
+    except (OSError, ValueError, AttributeError):
+        pass
+    return {'version': 1, 'imagenes': {}}
+
+
+def manifiesto():
+    """{ruta: entrada} vigente del proceso; se recarga cuando cambia la generación 'imagenes'."""
+    global _manifiesto
+    gen = generacion_local('imagenes')
+    if _manifiesto is None or _manifiesto[0] != gen:
+        _manifiesto = (gen, leer_manifiesto()['imagenes'])
+    return _manifiesto[1]
+
+
+def hash_archivo(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def anchos_para(ancho_original, anchos=ANCHOS):
+    """Anchos de variante para un original: los menores que él más el propio."""
+    return sorted({a for a in anchos if a < ancho_original} | {ancho_original})
+
+
+def _guardar(im, destino, formato):
+    # Escribir a un temporal y renombrar: un proceso caído no deja archivos a medias
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    tmp = destino.with_name(destino.name + '.tmp')
+    if formato == 'webp':
+        im.save(tmp, 'WEBP', quality=CALIDAD['webp'], method=6)
+    else:
+        im.save(tmp, 'AVIF', quality=CALIDAD['avif'])
+    os.replace(tmp, destino)
+    return destino.stat().st_size
+
+
+def procesar(base, rel, hash_origen, anchos=ANCHOS, formatos=FORMATOS):
+    """Genera las variantes de una imagen (se ejecuta en un proceso del pool).
+
+    Devuelve la entrada del manifiesto para `rel`.
+    """
+    from PIL import Image, ImageOps
+
+    base = Path(base)
+    origen = base / rel
+    with Image.open(origen) as im:
+        im = ImageOps.exif_transpose(im)
+        if im.mode not in ('RGB', 'RGBA'):
+            im = im.convert('RGBA' if 'transparency' in im.info or im.mode in ('LA', 'PA') else 'RGB')
+        ancho, alto = im.size
+        variantes = []
+        for w in anchos_para(ancho, anchos):
+            h = max(1, round(alto * w / ancho))
+            copia = im if w == ancho else im.resize((w, h), Image.LANCZOS)
+            for formato in formatos:
+                ruta = ruta_variante(rel, w, formato)
+                tamano = _guardar(copia, base / ruta, formato)
+                variantes.append({'formato': formato, 'ancho': w, 'alto': h, 'ruta': ruta, 'bytes': tamano})
+    return {
+        'hash': hash_origen,
+        'ancho': ancho,
+        'alto': alto,
+        'bytes': origen.stat().st_size,
+        'variantes': variantes,
+    }
+
+
+def escribir_manifiesto(imagenes, base=None):
+    destino = ruta_manifiesto(base)
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    tmp = destino.with_name(destino.name + '.tmp')
+    tmp.write_text(
+        json.dumps({'version': 1, 'imagenes': dict(sorted(imagenes.items()))}, indent=1, ensure_ascii=False),
+        encoding='utf-8',
+    )
+    os.replace(tmp, destino)
+
+
+def registrar(entradas, base=None):
+    """Suma al manifiesto en disco las entradas de `procesar()` (p.ej. subidas del admin)."""
+    imagenes = leer_manifiesto(base)['imagenes']
+    imagenes.update(entradas)
+    escribir_manifiesto(imagenes, base)
+
+
+def _origenes(base):
+    for path in sorted(base.rglob('*')):
+        rel = path.relative_to(base).as_posix()
+        if rel.startswith(DIR_VARIANTES + '/') or not path.is_file():
+            continue
+        if path.suffix.lower() in ORIGENES:
+            yield rel, path
+
+
+def _al_dia(base, entrada, hash_origen):
+    return (
+        entrada is not None
+        and entrada.get('hash') == hash_origen
+        and all((base / v['ruta']).is_file() for v in entrada.get('variantes', []))
+    )
+
+
+def formatos_disponibles(formatos=FORMATOS):
+    from PIL import features
+    disponibles = [f for f in formatos if features.check(f)]
+    for f in set(formatos) - set(disponibles):
+        logger.warning('Pillow no soporta %s: se omiten esas variantes', f)
+    return disponibles
+
+
+def construir(base=None, procesos=None, forzar=False, anchos=ANCHOS, formatos=FORMATOS, al_procesar=None):
+    """Genera las variantes pendientes y escribe el manifiesto.
+
+    `al_procesar(rel, entrada, error)` se llama al terminar cada imagen.
+    Devuelve un resumen: {'procesadas', 'sin_cambios', 'errores', 'eliminadas', 'imagenes'}.
+    """
+    base = Path(base) if base else directorio_img()
+    formatos = formatos_disponibles(formatos)
+    anterior = leer_manifiesto(base)['imagenes']
+    nuevo, pendientes = {}, []
+    for rel, path in _origenes(base):
+        hash_origen = hash_archivo(path)
+        if not forzar and _al_dia(base, anterior.get(rel), hash_origen):
+            nuevo[rel] = anterior[rel]
+        else:
+            pendientes.append((rel, hash_origen))
+
+    sin_cambios = len(nuevo)
+    errores = []
+    if pendientes:
+        with ProcessPoolExecutor(max_workers=procesos) as pool:
+            futuros = {
+                pool.submit(procesar, str(base), rel, hash_origen, tuple(anchos), tuple(formatos)): rel
+                for rel, hash_origen in pendientes
+            }
+            for futuro in as_completed(futuros):
+                rel = futuros[futuro]
+                try:
+                    nuevo[rel] = futuro.result()
+                    error = None
+                except Exception as exc:
+                    logger.exception('Error generando variantes de %s', rel)
+                    errores.append(rel)
+                    error = exc
+                    # Conservar las variantes anteriores; el hash viejo hace
+                    # que se reintente en la próxima corrida
+                    if rel in anterior:
+                        nuevo[rel] = anterior[rel]
+                if al_procesar:
+                    al_procesar(rel, nuevo.get(rel), error)
+
+    # Variantes de originales borrados o cambiados que ya no se usan
+    vigentes = {v['ruta'] for e in nuevo.values() for v in e['variantes']}
+    eliminadas = 0
+    for e in anterior.values():
+        for v in e.get('variantes', []):
+            if v['ruta'] not in vigentes and (base / v['ruta']).is_file():
+                (base / v['ruta']).unlink()
+                eliminadas += 1
+
+    escribir_manifiesto(nuevo, base)
+    return {
+        'procesadas': len(pendientes) - len(errores),
+        'sin_cambios': sin_cambios,
+        'errores': errores,
+        'eliminadas': eliminadas,
+        'imagenes': nuevo,
+    }
+
+
+def ahorro(imagenes):
+    """{formato: (bytes originales, bytes de la variante más ancha)} sobre las imágenes dadas."""
+    totales = {}
+    for e in imagenes.values():
+        for formato in {v['formato'] for v in e['variantes']}:
+            mayor = max((v for v in e['variantes'] if v['formato'] == formato), key=lambda v: v['ancho'])
+            orig, var = totales.get(formato, (0, 0))
+            totales[formato] = (orig + e['bytes'], var + mayor['bytes'])
+    return totales
@@ -1,12 +1,27 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.http import JsonResponse, HttpResponseRedirect, HttpResponse
 from django.views.decorators.http import require_http_methods
-from django.db.models import Sum, Count
+from django.db.models import Sum, Count, Q
 from django.contrib.auth.decorators import login_required
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import logout
 from django.contrib import messages
-from .models import Salon, ConfiguracionSalon, Reserva, BloqueoEspacio, AnuncioFlotante
+from .models import (
+    Salon, ConfiguracionSalon, Reserva, BloqueoEspacio, AnuncioFlotante, OcupacionDiaria,
+    Comunicado, ComunicadoImagen,
+)
+from .disponibilidad import bloqueos_en_conflicto, buscar_conflictos, describir_conflicto
+from .ocupacion import formatear_rangos
+from .cache import obtener_o_calcular
+from .condicional import condicional
+from .candados import HorarioApartado, HorarioOcupado, reservar_horario
+from . import holds as holds_svc
+from . import imagenes
+from . import catalogo
+from . import contenido
+from . import precios
+from . import socios
+from .sugerencias import sugerir
 import csv
 from datetime import datetime
 import datetime as dt
@@ -64,15 +79,12 @@ _PENDING_CLOUDINARY_UPLOAD = {
 
 def _filter_existing_images(paths):
     """Filtra una lista de rutas para devolver solo las que:
-    1. Existen en disco bajo static/img/.
+    1. Existen en disco bajo static/img/ (según el manifiesto de imágenes).
     2. NO estan en la lista temporal de pendientes de subir a Cloudinary.
 
     Asi evitamos referenciar archivos que se romperian visualmente.
     """
-    from django.conf import settings
-    from pathlib import Path
-    static_dirs = getattr(settings, 'STATICFILES_DIRS', [])
-    base = Path(static_dirs[0]) if static_dirs else Path(settings.BASE_DIR) / 'static'
+    existentes = imagenes.manifiesto()
     valid = []
     for p in paths:
         if not p:
@@ -80,8 +92,7 @@ def _filter_existing_images(paths):
         # Skip si esta marcada como pendiente de subir a Cloudinary
         if p.strip() in _PENDING_CLOUDINARY_UPLOAD:
             continue
-        full = base / 'img' / p
-        if full.is_file():
+        if p in existentes:
             valid.append(p)
     return valid
 
@@ -128,13 +139,10 @@ def get_salon_images(salon_or_name):
 
     return []
 
-# Validación de código de socio contra base de datos
+# Validación de código de socio (índice en memoria, ver reservas.socios)
 def is_valid_socio(code):
     """Valida si el código de socio existe y está activo"""
-    if not code:
-        return False
-    from .models import CodigoSocio
-    return CodigoSocio.objects.filter(codigo=code.strip(), activo=True).exists()
+    return socios.es_valido(code)
 
 def validate_socio_code(request):
     """Vista AJAX para validar código de socio en tiempo real"""
@@ -143,43 +151,36 @@ def validate_socio_code(request):
         if not code:
             return JsonResponse({'valid': False, 'message': 'Código vacío'})
         
-        is_valid = is_valid_socio(code)
-        if is_valid:
-            # además de validar, devolver datos del socio para autocompletar el formulario
-            from .models import CodigoSocio
-            try:
-                socio = CodigoSocio.objects.filter(codigo=code.strip(), activo=True).values(
-                    'nombre_socio', 'email', 'celular', 'empresa'
-                ).first()
-            except Exception:
-                socio = None
-
+        # además de validar, devolver datos del socio para autocompletar el formulario
+        socio = socios.buscar(code)
+        if socio is not None:
             return JsonResponse({'valid': True, 'message': 'Código válido', 'socio': socio})
         else:
             return JsonResponse({'valid': False, 'message': 'Código inválido o inactivo'})
     
     return JsonResponse({'valid': False, 'message': 'Método no permitido'})
 
+@condicional(AnuncioFlotante, anonimo=True)
 def index(request):
     """Página principal - bienvenida"""
-    anuncios = AnuncioFlotante.objects.filter(activo=True, mostrar_en_index=True).order_by('-creado')
-    # Por ahora mostramos el anuncio más reciente (si existe)
-    anuncio_destacado = anuncios.first() if anuncios.exists() else None
     return render(request, 'index.html', {
-        'anuncio_flotante': anuncio_destacado,
+        'anuncio_flotante': contenido.anuncio_destacado(),
     })
 
 
+@condicional(Comunicado, ComunicadoImagen, anonimo=True, extra=lambda request: request.GET.get('despues', ''))
 def comunicados(request):
-    """Vista pública que muestra los Comunicados activos con sus imagenes."""
-    from .models import Comunicado
-    comunicados_qs = (
-        Comunicado.objects
-        .filter(activo=True)
-        .prefetch_related('images')
-        .order_by('-publicado', '-id')
-    )
-    return render(request, 'comunicados.html', {'comunicados': comunicados_qs})
+    """Vista pública que muestra los Comunicados activos con sus imagenes.
+
+    Paginada por cursor: `?despues=<cursor>` (ver reservas.contenido).
+    """
+    cursor = request.GET.get('despues') or None
+    pagina = contenido.pagina_comunicados(cursor)
+    return render(request, 'comunicados.html', {
+        'comunicados': pagina['comunicados'],
+        'siguiente': pagina['siguiente'],
+        'es_primera_pagina': cursor is None,
+    })
 
 
 def preguntas_frecuentes(request):
@@ -189,113 +190,36 @@ def preguntas_frecuentes(request):
 def politicas(request):
     return render(request, 'politicas.html')
 
+@condicional('catalogo', 'precios', 'imagenes', anonimo=True)
 def espacios(request):
     """Página de espacios disponibles - usando datos de la base de datos"""
-    from .models import ConfiguracionSalon
-    
-    salones = Salon.objects.filter(disponible=True).order_by('nombre')
-    
-    # Convertir salones a formato compatible con template
-    # Ahora mostramos UN salón con sus configuraciones como opciones
-    rooms = []
-    for salon in salones:
-        # Obtener todas las configuraciones del salón
-        configuraciones = salon.configuraciones.all()
-        
-        if configuraciones.exists():
-            # Calcular agregados para mostrar en la card del salón:
-            #   - capacidad mostrada = la MAYOR de todas las configuraciones
-            #   - precio "desde"     = el MENOR de todas las configuraciones
-            configs_list = list(configuraciones)
-            max_capacidad = max(c.capacidad_efectiva_max for c in configs_list)
-            min_precio_particular_4h = min(int(c.precio_particular_4h) for c in configs_list if c.precio_particular_4h is not None)
-            min_precio_socio_4h = min(int(c.precio_socio_4h) for c in configs_list if c.precio_socio_4h is not None)
-            precios_part_8h = [int(c.precio_particular_8h) for c in configs_list if c.precio_particular_8h]
-            precios_socio_8h = [int(c.precio_socio_8h) for c in configs_list if c.precio_socio_8h]
-            min_precio_particular_8h = min(precios_part_8h) if precios_part_8h else min_precio_particular_4h
-            min_precio_socio_8h = min(precios_socio_8h) if precios_socio_8h else min_precio_socio_4h
-
-            rooms.append({
-                'id': salon.id,
-                'name': salon.nombre,
-                'desc': salon.descripcion,
-                'price_particular_4h': min_precio_particular_4h,
-                'price_particular_8h': min_precio_particular_8h,
-                'price_socio_4h': min_precio_socio_4h,
-                'price_socio_8h': min_precio_socio_8h,
-                'capacity': str(max_capacidad),
-                'capacity_max': max_capacidad,
-                'type': 'social',
-                'images': get_salon_images(salon),
-                'configuraciones': [
-                    {
-                        'id': c.id,
-                        'tipo': c.get_tipo_configuracion_display(),
-                        'capacidad': c.capacidad_display,
-                        'capacidad_max': c.capacidad_efectiva_max,
-                        'precio_particular_4h': int(c.precio_particular_4h),
-                        'precio_particular_8h': int(c.precio_particular_8h) if c.precio_particular_8h else None,
-                        'montaje_image': c.imagen_montaje,
-                    } for c in configs_list
-                ]
-                ,
-                'num_configuraciones': len(configs_list),
-                'medidas': salon.medidas_dict()
-            })
-    
-    return render(request, 'espacios.html', {'rooms': rooms})
+    # Un salón por tarjeta con sus configuraciones como opciones (ver reservas.catalogo)
+    return render(request, 'espacios.html', {'rooms': catalogo.catalogo()['salones']})
 
 def register(request):
     """Página de registro/reserva"""
-    from .models import ConfiguracionSalon, ServicioAdicional
-    
+    datos = catalogo.catalogo()
+    rooms = datos['configuraciones']
+    servicios_adicionales = datos['servicios']
+
     # Si se recibe `espacio_id` por GET (viene desde la lista de espacios),
     # filtramos las configuraciones para mostrar sólo las del salón seleccionado.
     espacio_get = request.GET.get('espacio_id')
-    configuraciones = ConfiguracionSalon.objects.filter(salon__disponible=True).select_related('salon').order_by('salon__nombre', 'tipo_configuracion')
     selected_salon = None
     default_config_id = None
     try:
         if espacio_get:
             salon_id = int(espacio_get)
-            configuraciones = configuraciones.filter(salon__id=salon_id)
-            # obtener nombre del salón para contexto
-            from .models import Salon
-            selected_salon = Salon.objects.filter(id=salon_id).first()
+            rooms = [r for r in rooms if r['salon_id'] == salon_id]
+            if salon_id in datos['nombres']:
+                selected_salon = {'id': salon_id, 'nombre': datos['nombres'][salon_id]}
+            # si el parámetro GET vino, usar la primera configuración como seleccionada
+            if selected_salon and rooms:
+                default_config_id = rooms[0]['id']
     except Exception:
         # ignorar si el parámetro no es válido
         selected_salon = None
     
-    # Obtener servicios adicionales activos (excluir montajes ya que se manejan por separado)
-    servicios_adicionales = ServicioAdicional.objects.filter(activo=True).exclude(nombre__icontains='montaje').order_by('nombre')
-    
-    # Convertir configuraciones a formato compatible con template
-    rooms = []
-    for config in configuraciones:
-        # Mostrar solo precio particular (ocultar precios de socio por solicitud del cliente)
-        precio_texto = f"${config.precio_particular_4h:,.0f}"
-        
-        rooms.append({
-            'id': config.id,
-            'salon_id': config.salon.id,
-            'name': f"{config.salon.nombre} - {config.get_tipo_configuracion_display()}",
-            'desc': f"{config.capacidad_display} personas",
-            'price': precio_texto,  # Texto completo del precio
-            'price_particular_4h': int(config.precio_particular_4h),
-            'price_particular_8h': int(config.precio_particular_8h or config.precio_particular_4h),
-            'price_socio_4h': int(config.precio_socio_4h),
-            'price_socio_8h': int(config.precio_socio_8h or config.precio_socio_4h),
-            'capacity': config.capacidad_display,
-            'capacity_max': config.capacidad_efectiva_max,
-            'type': 'social',
-            'images': get_salon_images(config.salon),
-            'montaje_image': config.imagen_montaje
-        })
-
-        # si no hay default aún y el parámetro GET vino, usar la primera configuración como seleccionada
-        if selected_salon and default_config_id is None:
-            default_config_id = config.id
-    
     if request.method == 'GET':
         ctx = {
             'rooms': rooms,
@@ -356,24 +280,55 @@ def register(request):
     except ValueError:
         errors.append("Formato de fecha inválido.")
         fecha_evento_obj = None
+
+    # Procesar tiempo de decoración
+    try:
+        tiempo_decoracion_i = int(tiempo_decoracion)
+    except:
+        tiempo_decoracion_i = 0
+
+    # Convertir hora_inicio string a objeto time
+    from datetime import time as datetime_time
+    hora_inicio_obj = None
+    if hora_inicio:
+        try:
+            hora_parts = hora_inicio.split(':')
+            hora_inicio_obj = datetime_time(int(hora_parts[0]), int(hora_parts[1]))
+        except:
+            hora_inicio_obj = None
+
+    # Validar rango permitido: desde 08:30 hasta 02:00 (noche siguiente)
+    # Permitimos horas entre 08:30 (08:30) y 02:00 (02:00 del día siguiente).
+    if hora_inicio_obj:
+        try:
+            min_minutes = 8 * 60 + 30
+            # Representaremos las horas posteriores a medianoche como hora+24h para comparar
+            h = hora_inicio_obj.hour
+            m = hora_inicio_obj.minute
+            minutes = (h if h >= 8 else h + 24) * 60 + m
+            max_minutes = (2 + 24) * 60  # 26:00 -> 02:00 siguiente día
+            if not (minutes >= min_minutes and minutes <= max_minutes):
+                errors.append('Hora inválida. Horarios disponibles: 08:30 a.m. a 02:00 a.m. (siguiente día).')
+        except Exception:
+            errors.append('Error al validar la hora de inicio.')
     
+    sugerir_alternativas = False
     try:
-        from .models import ConfiguracionSalon, BloqueoEspacio
+        from .models import ConfiguracionSalon
         espacio_id_int = int(espacio_id)
         configuracion = ConfiguracionSalon.objects.filter(id=espacio_id_int, salon__disponible=True).select_related('salon').first()
         if not configuracion:
             errors.append("Espacio seleccionado inválido.")
         else:
-            # Validar que el salón no esté bloqueado en esa fecha
+            # Validar que el salón no esté bloqueado en ese horario (o todo el día)
             if fecha_evento_obj:
-                bloqueos = BloqueoEspacio.objects.filter(
-                    salon=configuracion.salon,
-                    activo=True,
-                    fecha_inicio__lte=fecha_evento_obj,
-                    fecha_fin__gte=fecha_evento_obj
+                bloqueos = bloqueos_en_conflicto(
+                    configuracion.salon_id, fecha_evento_obj, hora_inicio_obj,
+                    '4H' if duracion_i == 4 else '8H', tiempo_decoracion_i,
                 )
-                if bloqueos.exists():
-                    bloqueo = bloqueos.first()
+                if bloqueos:
+                    sugerir_alternativas = True
+                    bloqueo = bloqueos[0]
                     fecha_inicio_str = bloqueo.fecha_inicio.strftime('%d/%m/%Y')
                     fecha_fin_str = bloqueo.fecha_fin.strftime('%d/%m/%Y')
                     errors.append(f"El salón {configuracion.salon.nombre} no está disponible para la fecha {fecha_evento}. Motivo: {bloqueo.get_motivo_display()}. Bloqueado desde {fecha_inicio_str} hasta {fecha_fin_str}.")
@@ -381,7 +336,21 @@ def register(request):
             # Validar capacidad del salón (usa el tope máximo si la configuración tiene intervalo)
             cap_max = configuracion.capacidad_efectiva_max
             if personas_i > cap_max:
+                sugerir_alternativas = True
                 errors.append(f"El salón soporta máximo {cap_max} personas. Solicitaste {personas_i}.")
+
+            # Validar que el horario no se cruce con otra reserva del mismo salón
+            if fecha_evento_obj and duracion_i > 0:
+                conflictos = buscar_conflictos(
+                    configuracion.salon_id, fecha_evento_obj, hora_inicio_obj,
+                    '4H' if duracion_i == 4 else '8H', tiempo_decoracion_i,
+                )
+                if conflictos:
+                    sugerir_alternativas = True
+                    errors.append(
+                        f"El salón {configuracion.salon.nombre} ya está reservado en ese horario "
+                        f"({describir_conflicto(conflictos[0])}). Por favor elige otra hora o fecha."
+                    )
             
             # Validar código de socio si se marcó como socio
             es_socio = request.POST.get('es_socio', 'no')
@@ -393,6 +362,13 @@ def register(request):
         errors.append("Espacio seleccionado inválido.")
         configuracion = None
     
+    def _sugerencias():
+        """Fechas y salones alternativos para el formulario rechazado."""
+        if not (configuracion and fecha_evento_obj and personas_i > 0):
+            return None
+        return sugerir(configuracion, fecha_evento_obj, personas_i, hora_inicio_obj,
+                       '4H' if duracion_i == 4 else '8H', tiempo_decoracion_i)
+
     if errors:
         form_dict = {k: v for k, v in request.POST.items()}
         return render(request, 'register.html', {
@@ -400,7 +376,8 @@ def register(request):
             'servicios_adicionales': servicios_adicionales, 
             'errors': errors, 
             'form': request.POST,
-            'form_dict': form_dict
+            'form_dict': form_dict,
+            'sugerencias': _sugerencias() if sugerir_alternativas else None,
         }, status=400)
     
     # Determine price depending on socio code and duration (4H/8H)
@@ -410,17 +387,10 @@ def register(request):
         if es_socio == 'si' and is_valid_socio(socio_code):
             applied_socio = True
 
-        # Precio según duración seleccionada
-        if duracion_i == 8:
-            if applied_socio:
-                price = int(configuracion.precio_socio_8h or configuracion.precio_socio_4h)
-            else:
-                price = int(configuracion.precio_particular_8h or configuracion.precio_particular_4h)
-        else:
-            if applied_socio:
-                price = int(configuracion.precio_socio_4h)
-            else:
-                price = int(configuracion.precio_particular_4h)
+        # Precio según tipo de cliente y duración (motor de precios compartido)
+        tipo_cliente = 'SOCIO' if applied_socio else 'PARTICULAR'
+        duracion = '4H' if duracion_i == 4 else '8H'
+        price = int(precios.cotizar(configuracion.id, tipo_cliente, duracion)['precio_base'])
 
         espacio_nombre = f"{configuracion.salon.nombre} - {configuracion.get_tipo_configuracion_display()}"
     else:
@@ -430,89 +400,67 @@ def register(request):
 
     total_price = price
     
-    # Procesar tiempo de decoración
-    try:
-        tiempo_decoracion_i = int(tiempo_decoracion)
-    except:
-        tiempo_decoracion_i = 0
-    
     # Guardar la reserva en la base de datos
     try:
-        from datetime import time as datetime_time
-        # Convertir hora_inicio string a objeto time
-        hora_inicio_obj = None
-        if hora_inicio:
-            try:
-                hora_parts = hora_inicio.split(':')
-                hora_inicio_obj = datetime_time(int(hora_parts[0]), int(hora_parts[1]))
-            except:
-                hora_inicio_obj = None
-
-        # Validar rango permitido: desde 08:30 hasta 02:00 (noche siguiente)
-        # Permitimos horas entre 08:30 (08:30) y 02:00 (02:00 del día siguiente).
-        if hora_inicio_obj:
-            try:
-                from datetime import time as datetime_time_check
-                min_minutes = 8 * 60 + 30
-                # Representaremos las horas posteriores a medianoche como hora+24h para comparar
-                h = hora_inicio_obj.hour
-                m = hora_inicio_obj.minute
-                minutes = (h if h >= 8 else h + 24) * 60 + m
-                max_minutes = (2 + 24) * 60  # 26:00 -> 02:00 siguiente día
-                if not (minutes >= min_minutes and minutes <= max_minutes):
-                    errors.append('Hora inválida. Horarios disponibles: 08:30 a.m. a 02:00 a.m. (siguiente día).')
-            except Exception:
-                errors.append('Error al validar la hora de inicio.')
-        
         # Obtener nombre de entidad si viene de empresa
         nombre_entidad = request.POST.get('nombre_entidad', '').strip()
         
-        reserva = Reserva.objects.create(
-            configuracion_salon=configuracion,
-            nombre_cliente=nombre_cliente,
-            email_cliente=email_cliente,
-            telefono_cliente=telefono_cliente,
-            tipo_cliente='SOCIO' if applied_socio else 'PARTICULAR',
-            nombre_entidad=nombre_entidad if nombre_entidad else None,
-            fecha_evento=fecha_evento,
-            hora_inicio=hora_inicio_obj,
-            duracion='4H' if duracion_i == 4 else '8H',
-            tiempo_decoracion=tiempo_decoracion_i,
-            numero_personas=personas_i,
-            precio_total=0,
-            estado='PENDIENTE',
-            observaciones=note if note else ''
-        )
-        # Después de crear la reserva, refrescar para obtener el precio calculado por el modelo
-        reserva.refresh_from_db()
-
-        # Guardar servicios adicionales
-        from .models import ServicioAdicional, ReservaServicioAdicional
-        servicios_total = 0
+        # Cantidades pedidas por servicio (campos servicio_<id>)
+        from .models import ReservaServicioAdicional
+        cantidades = {}
         for key in request.POST:
             if key.startswith('servicio_') and request.POST[key]:
                 try:
                     servicio_id = int(key.replace('servicio_', ''))
                     cantidad = int(request.POST[key])
-                    if cantidad > 0:
-                        servicio = ServicioAdicional.objects.get(id=servicio_id, activo=True)
-                        reserva_servicio = ReservaServicioAdicional.objects.create(
-                            reserva=reserva,
-                            servicio=servicio,
-                            cantidad=cantidad,
-                            precio_unitario=servicio.precio_unitario
-                        )
-                        servicios_total += float(reserva_servicio.subtotal)
-                except (ValueError, ServicioAdicional.DoesNotExist):
-                    pass
-        
-        # Actualizar precio total de la reserva si hay servicios
-        if servicios_total > 0:
-            reserva.precio_total = float(reserva.precio_total) + servicios_total
+                except ValueError:
+                    continue
+                if cantidad > 0:
+                    cantidades[servicio_id] = cantidad
+        # Precio del salón y de los servicios activos desde la matriz en caché
+        cotizacion = precios.cotizar(configuracion.id, tipo_cliente, duracion, cantidades)
+
+        # Sección crítica: con el salón bloqueado para la fecha se vuelve a
+        # comprobar el cruce de horario y se crea la reserva en la misma transacción
+        # El apartado (ReservaHold) del propio cliente no cuenta como conflicto
+        hold_token = request.POST.get('hold_token', '').strip()
+        with reservar_horario(configuracion.salon_id, fecha_evento_obj, hora_inicio_obj,
+                              duracion, tiempo_decoracion_i,
+                              hold_token=hold_token):
+            reserva = Reserva(
+                configuracion_salon=configuracion,
+                nombre_cliente=nombre_cliente,
+                email_cliente=email_cliente,
+                telefono_cliente=telefono_cliente,
+                tipo_cliente=tipo_cliente,
+                nombre_entidad=nombre_entidad if nombre_entidad else None,
+                fecha_evento=fecha_evento_obj,
+                hora_inicio=hora_inicio_obj,
+                duracion=duracion,
+                tiempo_decoracion=tiempo_decoracion_i,
+                numero_personas=personas_i,
+                estado='PENDIENTE',
+                observaciones=note if note else '',
+                precio_total=cotizacion['total'],
+            )
             reserva.save()
 
-        # Obtener el precio final calculado en la reserva
-        reserva.refresh_from_db()
+            # Servicios adicionales con el precio cotizado, en un solo INSERT
+            servicios_lineas = [
+                ReservaServicioAdicional(
+                    reserva=reserva,
+                    servicio_id=linea['id'],
+                    cantidad=linea['cantidad'],
+                    precio_unitario=linea['precio_unitario'],
+                    subtotal=linea['subtotal'],
+                )
+                for linea in cotizacion['servicios']
+            ]
+
+            ReservaServicioAdicional.objects.bulk_create(servicios_lineas)
+
+            holds_svc.convertir_hold(hold_token)
+
         total_price = int(reserva.precio_total or 0)
         
         # Mensaje de éxito
@@ -541,6 +489,36 @@ def register(request):
         
         return render(request, 'register.html', {'success': True, 'registration': payload, 'rooms': rooms})
     
+    except HorarioApartado:
+        errors.append(
+            f"Otro cliente está completando una reserva del salón {configuracion.salon.nombre} "
+            f"en ese horario. Por favor elige otra hora o intenta de nuevo en unos minutos."
+        )
+        form_dict = {k: v for k, v in request.POST.items()}
+        return render(request, 'register.html', {
+            'rooms': rooms,
+            'servicios_adicionales': servicios_adicionales,
+            'errors': errors,
+            'form': request.POST,
+            'form_dict': form_dict,
+            'sugerencias': _sugerencias(),
+        }, status=400)
+
+    except HorarioOcupado as e:
+        errors.append(
+            f"El salón {configuracion.salon.nombre} ya está reservado en ese horario "
+            f"({describir_conflicto(e.conflictos[0])}). Por favor elige otra hora o fecha."
+        )
+        form_dict = {k: v for k, v in request.POST.items()}
+        return render(request, 'register.html', {
+            'rooms': rooms,
+            'servicios_adicionales': servicios_adicionales,
+            'errors': errors,
+            'form': request.POST,
+            'form_dict': form_dict,
+            'sugerencias': _sugerencias(),
+        }, status=400)
+
     except Exception as e:
         messages.error(request, f'Error al crear la reserva: {str(e)}')
         errors.append(f"Error al guardar la reserva: {str(e)}")
@@ -687,6 +665,7 @@ def reserva_manual(request):
         precio_override = request.POST.get('precio_override', '').strip()
         force_monday = request.POST.get('force_monday') == '1'
         force_capacity = request.POST.get('force_capacity') == '1'
+        force_overlap = request.POST.get('force_overlap') == '1'
 
         errors = []
         warnings = []
@@ -764,16 +743,27 @@ def reserva_manual(request):
             elif personas_i > cap_max and force_capacity:
                 warnings.append(f'Reserva forzada por encima de la capacidad ({personas_i} > {cap_max}).')
 
+        # Cruce de horario con otras reservas del salón (con override admin)
+        if configuracion and fecha_evento_obj and duracion_i in (4, 8):
+            conflictos = buscar_conflictos(
+                configuracion.salon_id, fecha_evento_obj, hora_inicio_obj,
+                '4H' if duracion_i == 4 else '8H', tiempo_decoracion_i,
+            )
+            if conflictos:
+                detalle = ', '.join(f'#{c.id} {describir_conflicto(c)}' for c in conflictos[:3])
+                if not force_overlap:
+                    errors.append(f'El horario se cruza con otra(s) reserva(s) del salón: {detalle}. Marca "Permitir cruce de horario" si quieres registrarla igual.')
+                else:
+                    warnings.append(f'Reserva forzada con cruce de horario: {detalle}.')
+
         # Bloqueos del salón (solo informar, no bloquear — admin decide)
         if configuracion and fecha_evento_obj:
-            bloqueos = BloqueoEspacio.objects.filter(
-                salon=configuracion.salon,
-                activo=True,
-                fecha_inicio__lte=fecha_evento_obj,
-                fecha_fin__gte=fecha_evento_obj,
+            bloqueos = bloqueos_en_conflicto(
+                configuracion.salon_id, fecha_evento_obj, hora_inicio_obj,
+                '4H' if duracion_i == 4 else '8H', tiempo_decoracion_i,
             )
-            if bloqueos.exists():
-                b = bloqueos.first()
+            if bloqueos:
+                b = bloqueos[0]
                 warnings.append(
                     f'Aviso: el salón {configuracion.salon.nombre} tiene un bloqueo activo '
                     f'({b.get_motivo_display()}) entre {b.fecha_inicio:%d/%m/%Y} y {b.fecha_fin:%d/%m/%Y}.'
@@ -789,39 +779,58 @@ def reserva_manual(request):
                 'form_dict': request.POST.dict(),
             })
 
-        # Crear la reserva. precio_total=0 hace que el model.save() calcule
-        # automáticamente desde la configuración y el tipo de cliente.
+        # Precio: el manual del admin si es válido; si no, el del motor de precios
+        duracion = '4H' if duracion_i == 4 else '8H'
+        precio_total = None
+        if precio_override:
+            try:
+                pov = int(str(precio_override).replace(',', '').replace('.', '').replace('$', '').strip())
+                if pov >= 0:
+                    precio_total = pov
+            except (ValueError, TypeError):
+                warnings.append('No se pudo aplicar el precio manual (formato inválido); se mantuvo el precio automático.')
+        if precio_total is None:
+            precio_total = precios.cotizar(configuracion.id, tipo_cliente, duracion)['precio_base']
+
         try:
-            reserva = Reserva.objects.create(
-                configuracion_salon=configuracion,
-                nombre_cliente=nombre_cliente,
-                email_cliente=email_cliente,
-                telefono_cliente=telefono_cliente,
-                tipo_cliente=tipo_cliente,
-                nombre_entidad=nombre_entidad or None,
-                fecha_evento=fecha_evento_obj,
-                hora_inicio=hora_inicio_obj,
-                duracion='4H' if duracion_i == 4 else '8H',
-                tiempo_decoracion=tiempo_decoracion_i,
-                numero_personas=personas_i,
-                precio_total=0,  # auto-calc en model.save()
-                estado=estado,
-                observaciones=observaciones,
-            )
-            # Sobrescribir precio si el admin lo especificó
-            if precio_override:
-                try:
-                    pov = int(str(precio_override).replace(',', '').replace('.', '').replace('$', '').strip())
-                    if pov >= 0:
-                        reserva.precio_total = pov
-                        reserva.save()
-                except (ValueError, TypeError):
-                    warnings.append('No se pudo aplicar el precio manual (formato inválido); se mantuvo el precio automático.')
+            with reservar_horario(configuracion.salon_id, fecha_evento_obj, hora_inicio_obj,
+                                  duracion, tiempo_decoracion_i,
+                                  permitir_cruce=force_overlap):
+                reserva = Reserva.objects.create(
+                    configuracion_salon=configuracion,
+                    nombre_cliente=nombre_cliente,
+                    email_cliente=email_cliente,
+                    telefono_cliente=telefono_cliente,
+                    tipo_cliente=tipo_cliente,
+                    nombre_entidad=nombre_entidad or None,
+                    fecha_evento=fecha_evento_obj,
+                    hora_inicio=hora_inicio_obj,
+                    duracion=duracion,
+                    tiempo_decoracion=tiempo_decoracion_i,
+                    numero_personas=personas_i,
+                    precio_total=precio_total,
+                    estado=estado,
+                    observaciones=observaciones,
+                )
 
             for w in warnings:
                 messages.warning(request, w)
             messages.success(request, f'Reserva manual #{reserva.id} creada para {nombre_cliente}.')
             return redirect('reservas:panel')
+        except HorarioOcupado as e:
+            if e.conflictos:
+                detalle = ', '.join(f'#{c.id} {describir_conflicto(c)}' for c in e.conflictos[:3])
+                error = f'El horario se cruza con otra(s) reserva(s) del salón: {detalle}.'
+            else:
+                error = 'Un cliente tiene apartado ese horario mientras completa su reserva en la web.'
+            return render(request, 'reserva_manual.html', {
+                'configuraciones': configuraciones,
+                'estados': estados,
+                'tipos_cliente': tipos_cliente,
+                'errors': [f'{error} Marca "Permitir cruce de horario" si quieres registrarla igual.'],
+                'warnings': warnings,
+                'form_dict': request.POST.dict(),
+            })
         except Exception as e:
             messages.error(request, f'Error al crear la reserva: {e}')
             return render(request, 'reserva_manual.html', {
@@ -1427,38 +1436,19 @@ def export_reservas_csv_fallback(request):
     return response
 
 
-def check_availability(request):
-    """API endpoint para verificar disponibilidad de espacios en una fecha específica"""
-    fecha_str = request.GET.get('fecha', '')
-    
-    try:
-        fecha_obj = datetime.strptime(fecha_str, '%Y-%m-%d').date()
-    except:
-        return JsonResponse({'error': 'Fecha inválida'}, status=400)
-    
+def _disponibilidad_fecha(fecha_obj):
+    """Lista de configuraciones con su disponibilidad para `fecha_obj` (sin caché)."""
     # Obtener todas las configuraciones
     configuraciones = ConfiguracionSalon.objects.filter(salon__disponible=True).select_related('salon')
     
-    # Verificar cuáles salones están bloqueados
-    salones_bloqueados = set()
-    bloqueos = BloqueoEspacio.objects.filter(
-        activo=True,
-        fecha_inicio__lte=fecha_obj,
-        fecha_fin__gte=fecha_obj
-    ).select_related('salon')
-    
-    bloqueos_info = {}
-    for bloqueo in bloqueos:
-        salones_bloqueados.add(bloqueo.salon.id)
-        bloqueos_info[bloqueo.salon.id] = {
-            'motivo': bloqueo.get_motivo_display(),
-            'descripcion': bloqueo.descripcion
-        }
+    # Ocupación precalculada del día (una fila por salón con reservas o bloqueos)
+    ocupacion = {o.salon_id: o for o in OcupacionDiaria.objects.filter(fecha=fecha_obj)}
     
     # Construir respuesta
     result = []
     for config in configuraciones:
-        esta_bloqueado = config.salon.id in salones_bloqueados
+        dia = ocupacion.get(config.salon_id)
+        esta_bloqueado = bool(dia and dia.bloqueado)
         item = {
             'id': config.id,
             'salon_id': config.salon.id,
@@ -1467,17 +1457,153 @@ def check_availability(request):
             'capacidad': config.capacidad_display,
             'capacidad_max': config.capacidad_efectiva_max,
             'disponible': not esta_bloqueado,
+            'horarios_ocupados': formatear_rangos(dia.rangos) if dia else [],
         }
         
         if esta_bloqueado:
-            item['motivo_bloqueo'] = bloqueos_info[config.salon.id]['motivo']
-            item['descripcion_bloqueo'] = bloqueos_info[config.salon.id]['descripcion']
+            item['motivo_bloqueo'] = dia.motivo_bloqueo
+            item['descripcion_bloqueo'] = dia.descripcion_bloqueo
         
         result.append(item)
+    return result
+
+
+@condicional('disponibilidad', 'holds', extra=lambda request: holds_svc.marca_vigencia())
+def check_availability(request):
+    """API endpoint para verificar disponibilidad de espacios en una fecha específica.
+
+    El resultado se cachea por fecha; las señales de Reserva, BloqueoEspacio,
+    Salon y ConfiguracionSalon incrementan la generación 'disponibilidad'
+    y con eso invalidan todas las fechas (ver reservas.cache).
+    """
+    fecha_str = request.GET.get('fecha', '')
+    
+    try:
+        fecha_obj = datetime.strptime(fecha_str, '%Y-%m-%d').date()
+    except:
+        return JsonResponse({'error': 'Fecha inválida'}, status=400)
+    
+    result, hit = obtener_o_calcular(
+        'disponibilidad', [fecha_obj.isoformat()], lambda: _disponibilidad_fecha(fecha_obj)
+    )
     
-    return JsonResponse({'espacios': result, 'fecha': fecha_str})
+    # Los apartados temporales vencen solos: se consultan aparte (índice por fecha)
+    # para no tener que invalidar la caché cuando expiran
+    apartados = holds_svc.apartados_del_dia(fecha_obj)
+    if apartados:
+        result = [
+            dict(item, horarios_apartados=formatear_rangos(apartados.get(item['salon_id'], [])))
+            for item in result
+        ]
+    
+    response = JsonResponse({'espacios': result, 'fecha': fecha_str})
+    response['X-Cache'] = 'HIT' if hit else 'MISS'
+    return response
+
+
+def suggest_alternatives(request):
+    """API: fechas libres cercanas y otros espacios con capacidad para una solicitud.
+
+    Parámetros GET: espacio_id, fecha (YYYY-MM-DD), num_personas y
+    opcionalmente hora_inicio (HH:MM), duracion_horas y tiempo_decoracion.
+    """
+    try:
+        fecha_obj = datetime.strptime(request.GET.get('fecha', ''), '%Y-%m-%d').date()
+        personas = int(request.GET.get('num_personas', ''))
+        hora_str = request.GET.get('hora_inicio', '')
+        hora_obj = datetime.strptime(hora_str, '%H:%M').time() if hora_str else None
+        tiempo_decoracion = max(0, int(request.GET.get('tiempo_decoracion', '0') or 0))
+    except (ValueError, TypeError):
+        return JsonResponse({'error': 'Parámetros inválidos'}, status=400)
+    duracion = '8H' if request.GET.get('duracion_horas', '4') == '8' else '4H'
+
+    configuracion = None
+    espacio_id = request.GET.get('espacio_id')
+    if espacio_id and espacio_id.isdigit():
+        configuracion = ConfiguracionSalon.objects.filter(id=int(espacio_id)).select_related('salon').first()
+
+    return JsonResponse(sugerir(configuracion, fecha_obj, personas, hora_obj, duracion, tiempo_decoracion))
+
+
+def quote(request):
+    """API: cotización en vivo para el formulario de `register`.
+
+    Parámetros GET: espacio_id, duracion_horas, es_socio ('si'/'no'),
+    socio_code y servicio_<id>=cantidad. El precio de socio solo se aplica
+    con un código válido, igual que al crear la reserva.
+    """
+    try:
+        config_id = int(request.GET.get('espacio_id', ''))
+    except (ValueError, TypeError):
+        return JsonResponse({'error': 'Parámetros inválidos'}, status=400)
+    duracion = '8H' if request.GET.get('duracion_horas', '4').strip() == '8' else '4H'
+    es_socio = request.GET.get('es_socio') == 'si' and is_valid_socio(request.GET.get('socio_code', '').strip())
+
+    cantidades = {}
+    for key, valor in request.GET.items():
+        if key.startswith('servicio_') and valor:
+            try:
+                cantidades[int(key.replace('servicio_', ''))] = int(valor)
+            except ValueError:
+                continue
+
+    cotizacion = precios.cotizar(config_id, 'SOCIO' if es_socio else 'PARTICULAR', duracion, cantidades)
+    if cotizacion is None:
+        return JsonResponse({'error': 'Espacio no encontrado'}, status=404)
+    return JsonResponse({
+        'espacio_id': config_id,
+        'tipo_cliente': cotizacion['tipo_cliente'],
+        'duracion_horas': 8 if duracion == '8H' else 4,
+        'precio_base': int(cotizacion['precio_base']),
+        'servicios': [
+            {'id': l['id'], 'nombre': l['nombre'], 'cantidad': l['cantidad'],
+             'precio_unitario': int(l['precio_unitario']), 'subtotal': int(l['subtotal'])}
+            for l in cotizacion['servicios']
+        ],
+        'servicios_total': int(cotizacion['servicios_total']),
+        'total': int(cotizacion['total']),
+    })
+
+
+@require_http_methods(["POST"])
+def hold_create(request):
+    """API: aparta un horario por unos minutos mientras el cliente llena el formulario.
+
+    Recibe espacio_id, fecha_evento, hora_inicio, duracion_horas, tiempo_decoracion
+    y opcionalmente el hold_token anterior (se reemplaza). Responde 409 si el
+    horario ya está reservado o apartado por otro cliente.
+    """
+    try:
+        configuracion = ConfiguracionSalon.objects.select_related('salon').get(
+            id=int(request.POST.get('espacio_id', '')), salon__disponible=True)
+        fecha_obj = datetime.strptime(request.POST.get('fecha_evento', ''), '%Y-%m-%d').date()
+        hora_obj = datetime.strptime(request.POST.get('hora_inicio', ''), '%H:%M').time()
+        duracion = '8H' if request.POST.get('duracion_horas', '4').strip() == '8' else '4H'
+        tiempo_decoracion = max(0, int(request.POST.get('tiempo_decoracion', '0') or 0))
+    except (ValueError, TypeError, ConfiguracionSalon.DoesNotExist):
+        return JsonResponse({'error': 'Datos inválidos'}, status=400)
+
+    try:
+        hold = holds_svc.crear_hold(configuracion, fecha_obj, hora_obj, duracion, tiempo_decoracion,
+                                    token=request.POST.get('hold_token'))
+    except HorarioOcupado as e:
+        return JsonResponse({'error': 'Horario no disponible', 'apartado': not e.conflictos}, status=409)
+
+    return JsonResponse({
+        'hold_token': str(hold.token),
+        'expira': hold.expira.isoformat(),
+        'ttl_segundos': holds_svc.TTL_MINUTOS * 60,
+    })
+
+
+@require_http_methods(["POST"])
+def hold_release(request):
+    """API: libera el apartado del cliente (cambió de salón o abandonó el formulario)."""
+    liberados = holds_svc.liberar_hold(request.POST.get('hold_token'))
+    return JsonResponse({'liberado': bool(liberados)})
 
 
+@condicional(BloqueoEspacio, extra=lambda request: dt.date.today())
 def get_bloqueos_salon(request):
     """API endpoint para obtener todos los bloqueos de un salón específico"""
     salon_id = request.GET.get('salon_id', '')
@@ -1487,38 +1613,101 @@ def get_bloqueos_salon(request):
     
     try:
         from datetime import date
-        hoy = date.today()
-        
-        # Obtener bloqueos activos del salón que aún no han terminado
-        # Algunos registros en BD pueden tener `fecha_fin` anterior a `fecha_inicio` (datos inconsistentes).
-        # Para evitar omitir bloqueos futuros en el formulario (aunque fecha_fin esté mal),
-        # incluimos bloqueos cuya fecha_fin sea >= hoy OR cuya fecha_inicio sea >= hoy.
-        from django.db.models import Q
-        bloqueos = BloqueoEspacio.objects.filter(
-            Q(salon_id=salon_id),
-            Q(activo=True),
-            (Q(fecha_fin__gte=hoy) | Q(fecha_inicio__gte=hoy))
-        ).order_by('fecha_inicio')
-        
-        result = []
-        for bloqueo in bloqueos:
-            # Normalize dates: if fecha_fin is before fecha_inicio, treat fecha_fin as fecha_inicio
-            fecha_inicio = bloqueo.fecha_inicio
-            fecha_fin = bloqueo.fecha_fin
-            if fecha_fin < fecha_inicio:
-                fecha_fin = fecha_inicio
-
-            result.append({
-                'fecha_inicio': fecha_inicio.strftime('%Y-%m-%d'),
-                'fecha_fin': fecha_fin.strftime('%Y-%m-%d'),
-                'motivo': bloqueo.get_motivo_display(),
-                'descripcion': bloqueo.descripcion
-            })
-        
+        from .ocupacion import bloqueos_de_filas
+
+        # Misma fuente que availability_range: la ocupación precalculada, que ya
+        # normaliza los rangos invertidos y distingue los bloqueos por horas
+        filas = OcupacionDiaria.objects.filter(
+            salon_id=int(salon_id), fecha__gte=date.today(),
+        ).exclude(motivo_bloqueo='')
+        result = [
+            {k: v for k, v in b.items() if k != 'salon_id'}
+            for b in bloqueos_de_filas(filas)
+        ]
         return JsonResponse({'bloqueos': result})
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=400)
 
+# Ventana máxima (días) que acepta availability_range
+MAX_DIAS_RANGO_DISPONIBILIDAD = 186
+
+
+@condicional('disponibilidad', 'holds', extra=lambda request: (
+    sorted(request.GET.lists()), dt.date.today(), holds_svc.marca_vigencia()))
+def availability_range(request):
+    """API: grilla de disponibilidad por día × configuración para un rango de fechas.
+
+    Parámetros GET: `desde`, `hasta` (YYYY-MM-DD) y opcional `salon_id`.
+    Reemplaza las llamadas por fecha a check_availability/get_bloqueos_salon:
+    siempre hace tres consultas (configuraciones, OcupacionDiaria y apartados
+    del rango) sin importar la longitud de la ventana; con el mismo ETag se
+    responde 304 sin consultar la base. Cada día es un string con un
+    carácter por configuración (ver `leyenda`).
+    """
+    from datetime import date, timedelta
+    from .ocupacion import LEYENDA, bloqueos_de_filas, estado_dia, ocupacion_rango
+
+    try:
+        desde = datetime.strptime(request.GET.get('desde', ''), '%Y-%m-%d').date()
+    except ValueError:
+        desde = date.today()
+    try:
+        hasta = datetime.strptime(request.GET.get('hasta', ''), '%Y-%m-%d').date()
+    except ValueError:
+        hasta = desde + timedelta(days=60)
+    if hasta < desde:
+        return JsonResponse({'error': 'Rango de fechas inválido'}, status=400)
+    if (hasta - desde).days >= MAX_DIAS_RANGO_DISPONIBILIDAD:
+        return JsonResponse({'error': f'El rango máximo es de {MAX_DIAS_RANGO_DISPONIBILIDAD} días'}, status=400)
+
+    salon_id = None
+    if request.GET.get('salon_id'):
+        try:
+            salon_id = int(request.GET['salon_id'])
+        except ValueError:
+            return JsonResponse({'error': 'salon_id inválido'}, status=400)
+
+    configuraciones = (
+        ConfiguracionSalon.objects
+        .filter(salon__disponible=True)
+        .select_related('salon')
+        .order_by('salon__nombre', 'tipo_configuracion')
+    )
+    if salon_id:
+        configuraciones = configuraciones.filter(salon_id=salon_id)
+    configuraciones = list(configuraciones)
+    filas = ocupacion_rango(desde, hasta, salon_id=salon_id)
+    # Igual que check_availability: los apartados vivos también ocupan el horario
+    apartados = holds_svc.apartados_rango(desde, hasta)
+
+    dias = {}
+    actual = desde
+    while actual <= hasta:
+        dias[actual.strftime('%Y-%m-%d')] = ''.join(
+            estado_dia(actual, filas.get((c.salon_id, actual)), apartados.get((c.salon_id, actual), ()))
+            for c in configuraciones
+        )
+        actual += timedelta(days=1)
+
+    return JsonResponse({
+        'desde': desde.strftime('%Y-%m-%d'),
+        'hasta': hasta.strftime('%Y-%m-%d'),
+        'leyenda': LEYENDA,
+        'configuraciones': [
+            {
+                'id': c.id,
+                'salon_id': c.salon_id,
+                'salon_nombre': c.salon.nombre,
+                'configuracion': c.get_tipo_configuracion_display(),
+                'capacidad': c.capacidad_display,
+                'capacidad_max': c.capacidad_efectiva_max,
+            } for c in configuraciones
+        ],
+        'dias': dias,
+        'bloqueos': bloqueos_de_filas(filas.values()),
+    })
+
+
 # Vista para el calendario
 @login_required
 def calendario(request):
@@ -1696,18 +1885,37 @@ def reportes_dashboard(request):
 
     return render(request, 'reportes.html', context)
 
+def _fecha_param(valor):
+    """'2025-03-01' o '2025-03-01T00:00:00-05:00' -> date; None si no es válida."""
+    try:
+        return datetime.strptime((valor or '')[:10], '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
 # API para obtener eventos del calendario
 @login_required
+@condicional(Reserva, BloqueoEspacio, Salon, ConfiguracionSalon, privada=True)
 def get_calendar_events(request):
-    """Obtiene todos los eventos (reservas y bloqueos) para el calendario"""
+    """Obtiene los eventos (reservas y bloqueos) para el calendario.
+
+    FullCalendar envía `start`/`end` con la ventana visible; si vienen, solo
+    se consultan las reservas y bloqueos de ese rango (usa los índices por fecha).
+    """
     try:
         espacio_id = request.GET.get('espacio_id', None)
+        desde = _fecha_param(request.GET.get('start'))
+        hasta = _fecha_param(request.GET.get('end'))
         events = []
         
         # Filtrar reservas
         reservas = Reserva.objects.select_related('configuracion_salon__salon')
         if espacio_id:
             reservas = reservas.filter(configuracion_salon__salon_id=espacio_id)
+        if desde:
+            reservas = reservas.filter(fecha_evento__gte=desde)
+        if hasta:
+            reservas = reservas.filter(fecha_evento__lte=hasta)
         
         for reserva in reservas:
             try:
@@ -1760,6 +1968,11 @@ def get_calendar_events(request):
         bloqueos = BloqueoEspacio.objects.select_related('salon')
         if espacio_id:
             bloqueos = bloqueos.filter(salon_id=espacio_id)
+        if desde:
+            # Algunos bloqueos tienen fecha_fin < fecha_inicio: cuentan como un solo día
+            bloqueos = bloqueos.filter(Q(fecha_fin__gte=desde) | Q(fecha_inicio__gte=desde))
+        if hasta:
+            bloqueos = bloqueos.filter(fecha_inicio__lte=hasta)
         
         for bloqueo in bloqueos:
             try:
@@ -1767,7 +1980,7 @@ def get_calendar_events(request):
                     'id': f'bloqueo_{bloqueo.id}',
                     'title': f'BLOQUEADO - {bloqueo.salon.nombre}',
                     'start': bloqueo.fecha_inicio.strftime('%Y-%m-%d'),
-                    'end': (bloqueo.fecha_fin + timedelta(days=1)).strftime('%Y-%m-%d'),
+                    'end': (max(bloqueo.fecha_inicio, bloqueo.fecha_fin) + dt.timedelta(days=1)).strftime('%Y-%m-%d'),
                     'backgroundColor': '#dc2626',
                     'borderColor': '#b91c1c',
                     'display': 'background',
@@ -2,6 +2,9 @@
 
 Run once from the project root:
     python scripts/optimize_images.py
+
+For responsive AVIF/WebP variants of everything under static/img (several
+widths, in parallel, incremental) use `python manage.py generar_variantes`.
 """
 from PIL import Image
 from pathlib import Path
@@ -58,7 +58,7 @@ if __name__ == '__main__':
             print('success=', last.success)
             print('error=', last.error)
             print('body_text (first 200 chars)=')
-            print((last.body_text or '')[:200])
+            print((last.texto or '')[:200])
 
         logs_for_reserva = EmailLog.objects.filter(reserva=r).order_by('-created_at')
         print('EmailLog count for this reserva:', logs_for_reserva.count())